@@ -6,9 +6,18 @@ from datetime import datetime, timedelta
 import os
 import plotly.express as px
 import plotly.graph_objects as go
+import json
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
 
 HUB_URL = os.environ.get("HUB_URL", "http://localhost:5000/alerts")
 HUB_BASE = HUB_URL.replace("/alerts", "")
+# Most recent alerts fetched per refresh for charts and the alert table
+ALERT_LIMIT = int(os.environ.get("DASHBOARD_ALERT_LIMIT", 1000))
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
 
 # Page configuration
 st.set_page_config(
@@ -283,6 +292,8 @@ if 'last_update' not in st.session_state:
     st.session_state.last_update = None
 if 'alert_count' not in st.session_state:
     st.session_state.alert_count = 0
+if 'hub_responses' not in st.session_state:
+    st.session_state.hub_responses = {}
 
 # Enhanced Sidebar with Professional Design
 with st.sidebar:
@@ -399,30 +410,96 @@ with refresh_section:
 st.markdown("---")
 
 # Fetch data
+def conditional_get(url, params=None, headers=None, parse=None):
+    """GET from the hub, sending the ETag of the last answer to the same
+    request; a 304 reuses that answer instead of downloading it again.
+    Returns the parsed body, or None on errors."""
+    params = {k: v for k, v in (params or {}).items() if v}
+    key = (url, tuple(sorted(params.items())), tuple(sorted((headers or {}).items())))
+    cached = st.session_state.hub_responses.get(key)
+    headers = dict(headers or {})
+    if cached:
+        headers["If-None-Match"] = cached[0]
+    r = requests.get(url, params=params, headers=headers, timeout=2)
+    if r.status_code == 304 and cached:
+        return cached[1]
+    if r.status_code != 200:
+        return None
+    value = parse(r) if parse else r.json()
+    if r.headers.get("ETag"):
+        st.session_state.hub_responses[key] = (r.headers["ETag"], value)
+    return value
+
 def fetch_alerts():
+    # Filter and page on the hub instead of downloading the whole table
+    params = {
+        "limit": ALERT_LIMIT,
+        "severity": ",".join(filter_severity),
+        "suc_id": ",".join(filter_suc),
+        "event_type": ",".join(filter_event_type)
+    }
+    # Ask for an Arrow stream so the DataFrame is built column by column
+    # instead of from a list of per-alert dicts; hubs without pyarrow
+    # answer with JSON.
+    headers = {"Accept": f"{ARROW_STREAM_MIMETYPE}, application/json;q=0.5"} if pa is not None else {}
+    def parse(r):
+        if r.headers.get("Content-Type", "").startswith(ARROW_STREAM_MIMETYPE):
+            return pa.ipc.open_stream(r.content).read_pandas()
+        return pd.DataFrame(r.json())
+
     try:
-        r = requests.get(HUB_URL, timeout=2)
+        alerts = conditional_get(HUB_URL, params, headers, parse)
+        if alerts is not None:
+            return alerts
+    except Exception as e:
+        return pd.DataFrame()
+    return pd.DataFrame()
+
+def search_alerts(term):
+    # Ranked full-text search on the hub's FTS index, with the sidebar filters
+    params = {
+        "q": term,
+        "limit": ALERT_LIMIT,
+        "severity": ",".join(filter_severity),
+        "suc_id": ",".join(filter_suc),
+        "event_type": ",".join(filter_event_type)
+    }
+    try:
+        r = requests.get(f"{HUB_URL}/search", params={k: v for k, v in params.items() if v}, timeout=2)
         if r.status_code == 200:
-            return r.json()
+            return pd.DataFrame(r.json())
     except Exception as e:
-        return []
-    return []
+        st.warning(f"Search error: {e}")
+    return pd.DataFrame()
 
 def fetch_metrics():
     try:
-        r = requests.get(f"{HUB_BASE}/metrics", timeout=2)
-        if r.status_code == 200:
-            return r.json()
+        return conditional_get(f"{HUB_BASE}/metrics")
     except:
         pass
     return None
 
-alerts = fetch_alerts()
+def fetch_timeseries():
+    params = {
+        "bucket": "1m",
+        "severity": ",".join(filter_severity),
+        "suc_id": ",".join(filter_suc),
+        "event_type": ",".join(filter_event_type)
+    }
+    try:
+        r = requests.get(f"{HUB_BASE}/metrics/timeseries", params={k: v for k, v in params.items() if v}, timeout=2)
+        if r.status_code == 200:
+            return r.json().get("points", [])
+    except:
+        pass
+    return []
+
+alerts_df = fetch_alerts()
 metrics = fetch_metrics()
 
 # Update session state
-if alerts:
-    st.session_state.alert_count = len(alerts)
+if not alerts_df.empty:
+    st.session_state.alert_count = len(alerts_df)
     st.session_state.last_update = datetime.now()
 
 # Enhanced Metrics Section with Better Visual Design
@@ -441,12 +518,14 @@ if metrics:
     suc_a_count = suc_counts.get("SUC_A", 0)
     suc_b_count = suc_counts.get("SUC_B", 0)
 else:
-    total = len(alerts)
-    high = sum(1 for a in alerts if a.get("severity") == "High")
-    medium = sum(1 for a in alerts if a.get("severity") == "Medium")
-    low = sum(1 for a in alerts if a.get("severity") == "Low")
-    suc_a_count = sum(1 for a in alerts if a.get("suc_id") == "SUC_A")
-    suc_b_count = sum(1 for a in alerts if a.get("suc_id") == "SUC_B")
+    total = len(alerts_df)
+    severity_counts = alerts_df["severity"].value_counts() if "severity" in alerts_df.columns else {}
+    suc_counts = alerts_df["suc_id"].value_counts() if "suc_id" in alerts_df.columns else {}
+    high = int(severity_counts.get("High", 0))
+    medium = int(severity_counts.get("Medium", 0))
+    low = int(severity_counts.get("Low", 0))
+    suc_a_count = int(suc_counts.get("SUC_A", 0))
+    suc_b_count = int(suc_counts.get("SUC_B", 0))
 
 # Enhanced Metric Cards with Professional Styling
 with metric_col1:
@@ -481,9 +560,9 @@ st.markdown("### 📊 Visualizations")
 st.markdown("---")
 viz_col1, viz_col2 = st.columns(2)
 
-if alerts and len(alerts) > 0:
+if not alerts_df.empty:
     try:
-        df = pd.DataFrame(alerts)
+        df = alerts_df.copy()
         
         # Ensure required columns exist
         required_cols = ["severity", "suc_id", "event_type"]
@@ -555,17 +634,18 @@ with viz_col2:
     else:
         st.info("📊 No SUC data available to display")
     
-# Timeline chart
-if not df.empty and "timestamp" in df.columns and len(df) > 0:
+# Timeline chart (per-minute counts pre-aggregated by the hub)
+timeline_points = fetch_timeseries()
+if timeline_points:
     st.markdown("### ⏱️ Alert Timeline")
     try:
-        df["timestamp_parsed"] = pd.to_datetime(df["timestamp"], errors='coerce')
+        df_points = pd.DataFrame(timeline_points)
+        df_points["timestamp_parsed"] = pd.to_datetime(df_points["time"], errors='coerce')
         # Remove rows with invalid timestamps
-        df_valid = df[df["timestamp_parsed"].notna()]
+        df_valid = df_points[df_points["timestamp_parsed"].notna()]
         
         if len(df_valid) > 0:
-            df_timeline = df_valid.groupby([df_valid["timestamp_parsed"].dt.floor("1min"), "severity"]).size().reset_index(name="count")
-            df_timeline = df_timeline.pivot(index="timestamp_parsed", columns="severity", values="count").fillna(0)
+            df_timeline = df_valid.pivot_table(index="timestamp_parsed", columns="severity", values="count", aggfunc="sum").fillna(0)
             
             fig_timeline = go.Figure()
             for severity in ["High", "Medium", "Low"]:
@@ -622,24 +702,10 @@ st.markdown("### 🚨 Recent Alerts")
         if st.button("🔄 Clear", use_container_width=True, help="Clear search and filters"):
             st.rerun()
     
-    if not df.empty:
-        if search_term:
-            try:
-                mask = pd.Series([False] * len(df))
-                if "suc_id" in df.columns:
-                    mask = mask | df["suc_id"].astype(str).str.contains(search_term, case=False, na=False)
-                if "event_type" in df.columns:
-                    mask = mask | df["event_type"].astype(str).str.contains(search_term, case=False, na=False)
-                if "summary" in df.columns:
-                    mask = mask | df["summary"].astype(str).str.contains(search_term, case=False, na=False)
-                df_filtered = df[mask]
-            except Exception as e:
-                st.warning(f"Search error: {e}")
-                df_filtered = df
-        else:
-            df_filtered = df
+    if search_term:
+        df_filtered = search_alerts(search_term)
     else:
-        df_filtered = pd.DataFrame()
+        df_filtered = df
     
     # Prepare display dataframe
     if len(df_filtered) > 0:
@@ -769,11 +835,18 @@ st.markdown("### 🚨 Recent Alerts")
                             st.markdown(f"**Summary:** {selected_alert.get('summary', 'N/A')}")
                         
                         # Anonymized details in expandable section
-                        if selected_alert.get("raw_masked"):
+                        raw_masked = selected_alert.get("raw_masked")
+                        if isinstance(raw_masked, str):
+                            # Arrow responses keep raw_masked as a JSON string
+                            try:
+                                raw_masked = json.loads(raw_masked)
+                            except ValueError:
+                                raw_masked = {}
+                        if raw_masked:
                             st.markdown("---")
                             st.markdown("#### 🔒 Anonymized Event Details")
                             st.markdown("*Privacy-protected data (IPs and usernames anonymized)*")
-                            st.json(selected_alert.get("raw_masked", {}))
+                            st.json(raw_masked)
     else:
         st.warning("⚠️ No alerts match the current filters. Try adjusting your filters or wait for new alerts.")
 else:
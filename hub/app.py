@@ -1,186 +1,803 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timezone
 import sqlite3
 import json
 import os
 import sys
+import threading
+import time
+import atexit
+from collections import Counter
+from functools import wraps
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from correlation import correlate_and_tag
-from storage import init_db, insert_alert, get_alerts
+from correlation import score_severity, BatchCorrelation, CorrelationPool
+from storage import row_to_alert, parse_epoch, ALERT_FIELDS, SELECTABLE_FIELDS, QueryTimeout
+from backends import open_store
+from columnar import require_pyarrow, stream_arrow, ARROW_STREAM_MIMETYPE, PARQUET_MIMETYPE
+from ingest import IngestQueue
+from masking import prepare_alert
+from response_cache import ResponseCache
+from events import EventBroadcaster
+from compression import compress_response, GzipRequestMiddleware
+from ratelimit import SucRateLimiter, ConcurrencyCap, retry_after_header
+from archive import Archiver, query_archive, PARTITION_SECONDS
 
 # Use absolute path for database to avoid issues
 DB_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.environ.get("BAYANI_DB", os.path.join(DB_DIR, "bayanihub.db"))
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Before-Id", "X-Next-After-Id", "X-Next-Offset", "X-Next-Since-Seq", "ETag"])
 
-# initialize DB
-init_db(DB_PATH)
+# Storage backend: sqlite (default) or memory, an in-memory columnar store
+# that is snapshotted to BAYANI_SNAPSHOT_PATH every BAYANI_SNAPSHOT_INTERVAL
+# seconds and at shutdown, and restored from it on startup. An empty
+# BAYANI_SNAPSHOT_PATH keeps the memory store fully ephemeral.
+STORAGE_BACKEND = os.environ.get("BAYANI_STORAGE", "sqlite").lower()
+store = open_store(
+    STORAGE_BACKEND,
+    DB_PATH,
+    snapshot_path=os.environ.get("BAYANI_SNAPSHOT_PATH", os.path.join(DB_DIR, "bayanihub-memory.npz")) or None,
+    snapshot_interval=int(os.environ.get("BAYANI_SNAPSHOT_INTERVAL", 60))
+)
+atexit.register(store.close)
+
+MAX_BATCH_SIZE = int(os.environ.get("BAYANI_MAX_BATCH", 1000))
+DEFAULT_PAGE_SIZE = int(os.environ.get("BAYANI_ALERTS_PAGE_SIZE", 500))
+MAX_PAGE_SIZE = int(os.environ.get("BAYANI_ALERTS_MAX_PAGE_SIZE", 5000))
+SEARCH_PAGE_SIZE = int(os.environ.get("BAYANI_SEARCH_PAGE_SIZE", 50))
+
+# GET /alerts and /metrics carry the store's data version as their ETag and
+# answer If-None-Match (or If-Modified-Since) with 304 while nothing has
+# been written. Rendered JSON responses of the current version are kept in
+# a small LRU cache keyed by the query string.
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("BAYANI_RESPONSE_CACHE_SIZE", 32)),
+    max_bytes=int(os.environ.get("BAYANI_RESPONSE_CACHE_MAX_BYTES", 1 << 20))
+)
+
+# GET /alerts/stream pushes stored, coalesced and re-tagged alerts as
+# Server-Sent Events from one in-process broadcast fed by the store's
+# change listener. The last BAYANI_STREAM_BUFFER events are kept for
+# Last-Event-ID resume.
+event_stream = EventBroadcaster(
+    buffer_size=int(os.environ.get("BAYANI_STREAM_BUFFER", 1000)),
+    max_subscribers=int(os.environ.get("BAYANI_STREAM_MAX_CLIENTS", 100))
+)
+store.add_change_listener(event_stream.publish)
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get("BAYANI_STREAM_HEARTBEAT", 15))
+
+# Responses of at least BAYANI_GZIP_MIN_SIZE bytes are gzipped at
+# BAYANI_GZIP_LEVEL (0 turns compression off) for clients that accept it;
+# streamed exports are compressed as they go. SUCs on slow links may send
+# POST /alerts and /alerts/batch bodies with Content-Encoding: gzip, which
+# are inflated up to BAYANI_MAX_INFLATED_BODY bytes.
+GZIP_LEVEL = int(os.environ.get("BAYANI_GZIP_LEVEL", 6))
+GZIP_MIN_SIZE = int(os.environ.get("BAYANI_GZIP_MIN_SIZE", 1024))
+app.wsgi_app = GzipRequestMiddleware(
+    app.wsgi_app,
+    paths=("/alerts", "/alerts/batch"),
+    max_size=int(os.environ.get("BAYANI_MAX_INFLATED_BODY", 10 << 20))
+)
+
+@app.after_request
+def gzip_response(response):
+    return compress_response(response, request, level=GZIP_LEVEL, min_size=GZIP_MIN_SIZE)
+
+# Opt-in write-behind ingest: POST /alerts returns 202 once the alert is
+# queued and a writer thread commits queued alerts in groups.
+ASYNC_INGEST = os.environ.get("BAYANI_ASYNC_INGEST", "False").lower() == "true"
+
+# In-memory sliding window of recent alerts per event_type, so correlation
+# does not scan every stored alert of the same type. It is rebuilt from the
+# database on startup; set BAYANI_CORRELATION_INDEX=false to always use SQL.
+correlation_window = None
+if os.environ.get("BAYANI_CORRELATION_INDEX", "True").lower() == "true":
+    correlation_window = store.correlation_window()
+# Held from an insert until its records are in the window, so the next
+# batch's lookups see them; the store serializes writes anyway.
+window_lock = threading.Lock()
+
+# Opt-in background correlation: alerts are stored with a provisional
+# severity derived from anomaly_score and re-tagged by a worker pool.
+ASYNC_CORRELATION = os.environ.get("BAYANI_ASYNC_CORRELATION", "False").lower() == "true"
+
+correlation_pool = None
+if ASYNC_CORRELATION:
+    correlation_pool = CorrelationPool(store, workers=int(os.environ.get("BAYANI_CORRELATION_WORKERS", 2)),
+                                       window=correlation_window)
+    atexit.register(correlation_pool.shutdown)
+
+# Coalescing: an alert that repeats a stored one (same SUC, event type,
+# masked source IP and destination port) within a window of its first
+# occurrence is folded into it, counting occurrence_count up, instead of
+# being stored and correlated again. BAYANI_COALESCE_SECONDS is the window
+# for every event type and BAYANI_COALESCE_WINDOWS overrides it per type,
+# e.g. "brute_force=60,port_scan=30"; a window of 0 turns it off.
+def parse_coalesce_windows(value):
+    windows = {}
+    for item in value.split(","):
+        if item.strip():
+            event_type, _, seconds = item.partition("=")
+            windows[event_type.strip()] = float(seconds)
+    return windows
+
+COALESCE_SECONDS = float(os.environ.get("BAYANI_COALESCE_SECONDS", 0))
+COALESCE_WINDOWS = parse_coalesce_windows(os.environ.get("BAYANI_COALESCE_WINDOWS", ""))
+
+def coalesce_window(event_type):
+    return COALESCE_WINDOWS.get(event_type, COALESCE_SECONDS)
+
+coalesce = coalesce_window if COALESCE_SECONDS or any(COALESCE_WINDOWS.values()) else None
+
+def store_records(records):
+    """Store and correlate records and return (id, severity, summary,
+    occurrence_count) for each record in order.
+
+    By default the insert, the correlation lookup and the final tags are
+    one transaction on one connection. With background correlation the
+    severity is provisional and the summary is None until a worker has
+    tagged the alert. Records folded into a stored alert (occurrence_count
+    above 1) report that alert's id and tags.
+    """
+    if correlation_pool is None:
+        # correlated inside the insert transaction; the window only learns
+        # of the records once they are committed
+        batch = BatchCorrelation(correlation_window)
+        with window_lock:
+            alert_ids = store.insert_alerts(records, classify=batch.classify, coalesce=coalesce)
+            batch.commit()
+        return [(alert_id, record["severity"], record["summary"], record["occurrence_count"])
+                for alert_id, record in zip(alert_ids, records)]
+
+    for record in records:
+        record["severity"] = score_severity(record["anomaly_score"])
+    alert_ids = store.insert_alerts(records, coalesce=coalesce)
+    new_ids = [alert_id for alert_id, record in zip(alert_ids, records) if record["occurrence_count"] == 1]
+    if correlation_window is not None:
+        for record in records:
+            if record["occurrence_count"] == 1:
+                correlation_window.add(record["event_type"], record["suc_id"], record["ts_epoch"])
+    correlation_pool.submit(new_ids)
+    return [(alert_id, record["severity"], None if record["occurrence_count"] == 1 else record["summary"],
+             record["occurrence_count"]) for alert_id, record in zip(alert_ids, records)]
+
+ingest_queue = None
+if ASYNC_INGEST:
+    ingest_queue = IngestQueue(
+        store_records,
+        max_size=int(os.environ.get("BAYANI_INGEST_QUEUE_SIZE", 10000)),
+        batch_size=int(os.environ.get("BAYANI_GROUP_COMMIT_SIZE", 200)),
+        flush_ms=int(os.environ.get("BAYANI_GROUP_COMMIT_MS", 50))
+    )
+    ingest_queue.start()
+    atexit.register(ingest_queue.stop)
+
+# Admission control for POST /alerts and /alerts/batch. Each SUC may send
+# BAYANI_SUC_RATE alerts per second with bursts of BAYANI_SUC_BURST and is
+# answered 429 with Retry-After beyond that (0 turns the limit off; alerts
+# are counted per SUC either way). At most BAYANI_INGEST_MAX_CONCURRENCY
+# ingest requests are processed at once, further ones get 503.
+suc_limiter = SucRateLimiter(
+    rate=float(os.environ.get("BAYANI_SUC_RATE", 0)),
+    burst=float(os.environ.get("BAYANI_SUC_BURST", 0)),
+    max_sucs=int(os.environ.get("BAYANI_SUC_LIMIT_MAX_SUCS", 10000))
+)
+ingest_cap = ConcurrencyCap(int(os.environ.get("BAYANI_INGEST_MAX_CONCURRENCY", 0)))
+
+def limit_ingest_concurrency(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ingest_cap.try_enter():
+            response = jsonify({"error": "too many concurrent ingest requests"})
+            response.status_code = 503
+            response.headers["Retry-After"] = "1"
+            return response
+        try:
+            return view(*args, **kwargs)
+        finally:
+            ingest_cap.leave()
+    return wrapper
+
+def rate_limited(wait):
+    response = jsonify({"error": "rate limit exceeded", "retry_after": round(wait, 3)})
+    response.status_code = 429
+    response.headers["Retry-After"] = retry_after_header(wait)
+    return response
+
+# Optional retention: partitions (BAYANI_PARTITION_SECONDS of event time,
+# daily by default) older than BAYANI_RETENTION_DAYS are moved to Parquet
+# files in BAYANI_ARCHIVE_DIR and stay readable via GET /alerts/archive.
+ARCHIVE_DIR = os.environ.get("BAYANI_ARCHIVE_DIR", os.path.join(DB_DIR, "archive"))
+RETENTION_DAYS = os.environ.get("BAYANI_RETENTION_DAYS")
+
+archiver = None
+if RETENTION_DAYS and store.name != "sqlite":
+    print(f"[HUB] BAYANI_RETENTION_DAYS is ignored with the {store.name} storage backend")
+elif RETENTION_DAYS:
+    archiver = Archiver(
+        DB_PATH,
+        ARCHIVE_DIR,
+        float(RETENTION_DAYS),
+        interval_seconds=int(os.environ.get("BAYANI_ARCHIVE_INTERVAL", 3600)),
+        partition_seconds=int(os.environ.get("BAYANI_PARTITION_SECONDS", PARTITION_SECONDS))
+    )
+    archiver.start()
+    atexit.register(archiver.stop)
 
 @app.route("/alerts", methods=["POST"])
+@limit_ingest_concurrency
 def receive_alert():
     try:
         data = request.get_json()
-        if not data or "suc_id" not in data:
-            return jsonify({"error": "malformed payload: missing suc_id"}), 400
-
-        # Basic anonymization
-        raw = data.get("raw_details", {})
-        if not isinstance(raw, dict):
-            raw = {}
-        
-        masked = {}
-        # Example anonymization: mask IPs and usernames
-        if "src_ip" in raw:
-            ip = raw["src_ip"]
-            masked["src_ip_masked"] = mask_ip(ip)
-        if "username" in raw:
-            masked["username_hash"] = hash_username(raw["username"])
-        if "attempts" in raw:
-            masked["attempts"] = raw["attempts"]
-        if "dst_port" in raw:
-            masked["dst_port"] = raw["dst_port"]
-        if "ports_scanned" in raw:
-            masked["ports_scanned"] = raw["ports_scanned"]
-
-        # Validate and sanitize inputs
-        suc_id = str(data["suc_id"]).strip()
-        if len(suc_id) > 50:
-            return jsonify({"error": "suc_id too long (max 50 characters)"}), 400
-        if not suc_id:
-            return jsonify({"error": "suc_id cannot be empty"}), 400
-        
-        event_type = str(data.get("event_type", "")).strip()[:50]
-        timestamp = data.get("timestamp")
-        if not timestamp:
-            timestamp = datetime.utcnow().isoformat() + "Z"
-        
-        anomaly_score = data.get("anomaly_score")
-        if anomaly_score is not None:
-            try:
-                anomaly_score = float(anomaly_score)
-                # Clamp to valid range
-                anomaly_score = max(0.0, min(1.0, anomaly_score))
-            except (ValueError, TypeError):
-                anomaly_score = None
+        record, error = prepare_alert(data)
+        if error:
+            return jsonify({"error": error}), 400
+        admitted, wait = suc_limiter.acquire(record["suc_id"])
+        if not admitted:
+            return rate_limited(wait)
 
-        # Safely serialize masked data
-        try:
-            raw_masked_json = json.dumps(masked)
-        except (TypeError, ValueError):
-            raw_masked_json = "{}"
-
-        record = {
-            "suc_id": suc_id,
-            "timestamp": timestamp,
-            "event_type": event_type,
-            "raw_masked": raw_masked_json,
-            "anomaly_score": anomaly_score
-        }
+        if ingest_queue is not None:
+            if not ingest_queue.submit([record]):
+                return jsonify({"error": "ingest queue full", "queue_depth": ingest_queue.depth()}), 503
+            return jsonify({"status": "queued", "queue_depth": ingest_queue.depth()}), 202
 
         try:
-            alert_id = insert_alert(DB_PATH, record)
+            alert_id, severity, summary, occurrences = store_records([record])[0]
         except Exception as db_error:
             print(f"[HUB] Database error inserting alert: {db_error}")
             # Log full error, but return generic message
             return jsonify({"error": "database error", "message": "Failed to store alert"}), 500
 
-        # run correlation (can be async/threaded in POC)
-        severity, summary = correlate_and_tag(DB_PATH, alert_id)
+        if occurrences > 1:
+            return jsonify({"status": "coalesced", "id": alert_id, "severity": severity, "summary": summary,
+                            "occurrence_count": occurrences}), 200
 
-        print(f"[HUB] Received alert #{alert_id} from {suc_id}: {event_type} (severity: {severity})")
+        print(f"[HUB] Received alert #{alert_id} from {record['suc_id']}: {record['event_type']} (severity: {severity})")
         
-        return jsonify({"status": "received", "id": alert_id, "severity": severity, "summary": summary}), 200
+        response = {"status": "received", "id": alert_id, "severity": severity, "summary": summary}
+        if correlation_pool is not None:
+            response["correlation"] = "pending"
+        return jsonify(response), 200
     except Exception as e:
         print(f"[HUB] Error processing alert: {e}")
         # Don't expose internal error details in production
         error_msg = str(e) if os.environ.get("FLASK_DEBUG", "False").lower() == "true" else "Internal server error"
         return jsonify({"error": "internal server error", "message": error_msg}), 500
 
+def parse_batch_body():
+    """Return the list of alert payloads in a batch request body.
+
+    Accepts a JSON array, an object with an "alerts" array, or NDJSON
+    (one alert per line). Lines that are not valid JSON are kept as None
+    so they are reported as per-item errors.
+    """
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+        return items
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("alerts")
+    if not isinstance(data, list):
+        return None
+    return data
+
+@app.route("/alerts/batch", methods=["POST"])
+@limit_ingest_concurrency
+def receive_alert_batch():
+    try:
+        items = parse_batch_body()
+        if items is None:
+            return jsonify({"error": "malformed payload: expected a JSON array, {\"alerts\": [...]} or NDJSON"}), 400
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"batch too large (max {MAX_BATCH_SIZE} alerts)"}), 413
+
+        results = [None] * len(items)
+        records = []
+        positions = []
+        for i, data in enumerate(items):
+            record, error = prepare_alert(data)
+            if error:
+                results[i] = {"index": i, "status": "rejected", "error": error}
+            else:
+                records.append(record)
+                positions.append(i)
+
+        # each SUC in the batch pays for its own alerts: the first ones its
+        # bucket has tokens for go through, the rest of them are rejected
+        allowed = {}
+        waits = {}
+        for suc_id, count in Counter(record["suc_id"] for record in records).items():
+            allowed[suc_id], wait = suc_limiter.acquire(suc_id, count)
+            if wait:
+                waits[suc_id] = wait
+        if waits:
+            admitted = []
+            for i, record in zip(positions, records):
+                suc_id = record["suc_id"]
+                if allowed[suc_id] > 0:
+                    allowed[suc_id] -= 1
+                    admitted.append((i, record))
+                else:
+                    results[i] = {"index": i, "status": "rejected", "error": "rate limit exceeded",
+                                  "retry_after": round(waits[suc_id], 3)}
+            if not admitted:
+                return rate_limited(max(waits.values()))
+            positions = [i for i, _ in admitted]
+            records = [record for _, record in admitted]
+
+        if ingest_queue is not None:
+            if not ingest_queue.submit(records):
+                return jsonify({"error": "ingest queue full", "queue_depth": ingest_queue.depth()}), 503
+            for i in positions:
+                results[i] = {"index": i, "status": "queued"}
+            return jsonify({
+                "status": "queued",
+                "queued": len(records),
+                "rejected": len(items) - len(records),
+                "queue_depth": ingest_queue.depth(),
+                "results": results
+            }), 202
+
+        try:
+            stored = store_records(records)
+        except Exception as db_error:
+            print(f"[HUB] Database error inserting alert batch: {db_error}")
+            return jsonify({"error": "database error", "message": "Failed to store alerts"}), 500
+
+        coalesced = 0
+        for i, (alert_id, severity, summary, occurrences) in zip(positions, stored):
+            if occurrences > 1:
+                results[i] = {"index": i, "status": "coalesced", "id": alert_id, "severity": severity,
+                              "summary": summary, "occurrence_count": occurrences}
+                coalesced += 1
+                continue
+            results[i] = {"index": i, "status": "received", "id": alert_id, "severity": severity, "summary": summary}
+            if correlation_pool is not None:
+                results[i]["correlation"] = "pending"
+
+        print(f"[HUB] Received batch of {len(items)} alerts ({len(records) - coalesced} stored, {coalesced} coalesced, "
+              f"{len(items) - len(records)} rejected)")
+
+        return jsonify({
+            "status": "received",
+            "received": len(records),
+            "coalesced": coalesced,
+            "rejected": len(items) - len(records),
+            "results": results
+        }), 200
+    except Exception as e:
+        print(f"[HUB] Error processing alert batch: {e}")
+        error_msg = str(e) if os.environ.get("FLASK_DEBUG", "False").lower() == "true" else "Internal server error"
+        return jsonify({"error": "internal server error", "message": error_msg}), 500
+
+def _list_arg(args, name):
+    values = []
+    for value in args.getlist(name):
+        values.extend(v.strip() for v in value.split(",") if v.strip())
+    return values or None
+
+def _time_arg(args, name):
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        epoch = parse_epoch(value)
+        if epoch is None:
+            raise ValueError(f"invalid {name}: expected epoch seconds or ISO timestamp")
+        return epoch
+
+def _int_arg(args, name, default=None):
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"invalid {name}: expected an integer")
+
+def _int_list_arg(args, name):
+    values = _list_arg(args, name)
+    if values is None:
+        return None
+    try:
+        return [int(v) for v in values]
+    except ValueError:
+        raise ValueError(f"invalid {name}: expected integers")
+
+def parse_alert_query(args, default_limit=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE):
+    """Translate GET /alerts query parameters into get_alerts filters.
+
+    A limit of None means no limit. Raises ValueError with a message
+    suitable for a 400 response.
+    """
+    limit = _int_arg(args, "limit", default_limit)
+    if limit is not None and limit < 1:
+        raise ValueError("invalid limit: must be at least 1")
+    if limit is not None and max_limit is not None:
+        limit = min(limit, max_limit)
+    fields = _list_arg(args, "fields")
+    if fields:
+        unknown = [f for f in fields if f not in SELECTABLE_FIELDS]
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return {
+        "limit": limit,
+        "before_id": _int_arg(args, "before_id"),
+        "after_id": _int_arg(args, "after_id"),
+        "severity": _list_arg(args, "severity"),
+        "suc_id": _list_arg(args, "suc_id"),
+        "event_type": _list_arg(args, "event_type"),
+        "since": _time_arg(args, "since"),
+        "until": _time_arg(args, "until"),
+        "dst_port": _int_list_arg(args, "dst_port"),
+        "src_ip_masked": _list_arg(args, "src_ip_masked"),
+        "username_hash": _list_arg(args, "username_hash"),
+        "min_attempts": _int_arg(args, "min_attempts"),
+        "fields": fields
+    }
+
+FORMAT_MIMETYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "arrow": ARROW_STREAM_MIMETYPE,
+    "parquet": PARQUET_MIMETYPE
+}
+
+def negotiate_format(formats):
+    """Pick a response format from ?format= or the Accept header.
+
+    formats lists the supported names, preferred first. Returns None when
+    the client asked for something else.
+    """
+    fmt = request.args.get("format")
+    if fmt:
+        return fmt if fmt in formats else None
+    best = request.accept_mimetypes.best_match([FORMAT_MIMETYPES[f] for f in formats])
+    if best is None:
+        return formats[0]
+    return next(f for f in formats if FORMAT_MIMETYPES[f] == best)
+
+def columnar_response(query, fmt):
+    """Stream the alerts matching query as Arrow IPC or Parquet, encoded
+    in record batches straight from the store (the sqlite cursor)."""
+    try:
+        require_pyarrow()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+    fields = query["fields"] or ALERT_FIELDS
+    body = stream_arrow(fields, store.iter_alert_batches(**query), fmt)
+    return Response(body, mimetype=FORMAT_MIMETYPES[fmt])
+
+def stream_json_response(query, fmt):
+    """Stream the alerts matching query as NDJSON or as a JSON array.
+
+    Rows are read in keyset batches, so memory stays bounded and the
+    first bytes go out before the whole result has been read.
+    """
+    fields = query["fields"] or ALERT_FIELDS
+
+    def generate():
+        first = True
+        if fmt == "json":
+            yield "["
+        for rows in store.iter_alert_batches(**query):
+            lines = [json.dumps(row_to_alert(row, fields)) for row in rows]
+            if fmt == "ndjson":
+                yield "\n".join(lines) + "\n"
+            else:
+                yield ("" if first else ",") + ",".join(lines)
+            first = False
+        if fmt == "json":
+            yield "]"
+
+    return Response(generate(), mimetype=FORMAT_MIMETYPES[fmt])
+
+def conditional_response(key, build):
+    """Answer a GET for the current data version: 304 when the client's
+    validators match, else the cached response for key, else build().
+
+    The version is read before build() runs, so a response never claims a
+    version newer than its data.
+    """
+    version, modified = store.data_version()
+    etag = f"{version}-{key[0]}"
+    last_modified = datetime.fromtimestamp(int(modified), tz=timezone.utc)
+    if request.if_none_match:
+        # weak comparison: a gzipped copy carries the same tag, made weak
+        unchanged = request.if_none_match.contains_weak(etag)
+    else:
+        # Last-Modified only has whole seconds, and a later write in the
+        # same second leaves it unchanged: only data last changed before
+        # the given second is known to be unchanged
+        unchanged = request.if_modified_since is not None and modified < request.if_modified_since.timestamp()
+    if unchanged:
+        response = Response(status=304)
+    else:
+        response = response_cache.get(version, key)
+        if response is None:
+            response = build()
+            response_cache.put(version, key, response)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.vary.add("Accept")
+    return response
+
+def _flag_arg(args, name):
+    return args.get(name, "").lower() in ("1", "true", "yes")
+
 @app.route("/alerts", methods=["GET"])
 def list_alerts():
     try:
-        alerts = get_alerts(DB_PATH)
-        return jsonify(alerts)
+        try:
+            query = parse_alert_query(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if query["fields"] and "id" not in query["fields"]:
+            # the id is the pagination cursor, so it is always returned
+            query["fields"] = ["id"] + query["fields"]
+        fmt = negotiate_format(["json", "ndjson", "arrow", "parquet"])
+        if fmt is None:
+            return jsonify({"error": "unsupported format: expected json, ndjson, arrow or parquet"}), 406
+        if fmt in ("arrow", "parquet"):
+            try:
+                require_pyarrow()
+            except RuntimeError as e:
+                return jsonify({"error": str(e)}), 501
+            return conditional_response((fmt, request.query_string), lambda: columnar_response(query, fmt))
+        if fmt == "ndjson" or _flag_arg(request.args, "stream"):
+            return conditional_response(("stream-" + fmt, request.query_string),
+                                        lambda: stream_json_response(query, fmt))
+
+        def build():
+            alerts = store.get_alerts(**query)
+            response = jsonify(alerts)
+            if len(alerts) == query["limit"]:
+                # a full page: tell the client where the next one starts
+                if query["after_id"] is not None and query["before_id"] is None:
+                    response.headers["X-Next-After-Id"] = str(alerts[-1]["id"])
+                else:
+                    response.headers["X-Next-Before-Id"] = str(alerts[-1]["id"])
+            return response
+
+        return conditional_response((fmt, request.query_string), build)
+    except QueryTimeout as e:
+        print(f"[HUB] Error retrieving alerts: {e}")
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         print(f"[HUB] Error retrieving alerts: {e}")
         return jsonify({"error": "internal server error"}), 500
 
+@app.route("/alerts/stream", methods=["GET"])
+def stream_alert_changes():
+    """Server-Sent Events: "insert" (a stored alert), "repeat" ({id,
+    occurrence_count} of a coalesced one), "update" ({id, severity,
+    summary} after re-tagging) and "reset" (events were missed; refetch)."""
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "invalid Last-Event-ID"}), 400
+    # takes the slot and fixes the starting point now, not when the
+    # response body is first read, so nothing stored in between is missed
+    subscription = event_stream.subscribe(last_event_id, STREAM_HEARTBEAT_SECONDS)
+    if subscription is None:
+        return jsonify({"error": "too many stream subscribers"}), 503
+
+    def generate():
+        yield f"retry: {int(STREAM_HEARTBEAT_SECONDS * 1000)}\n\n"
+        for event in subscription:
+            if event is None:
+                # keeps proxies from closing an idle stream and notices
+                # clients that went away
+                yield ": keepalive\n\n"
+            else:
+                event_id, kind, data = event
+                yield f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+
+    response = Response(generate(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # also when the body is never read
+    response.call_on_close(subscription.close)
+    return response
+
+@app.route("/alerts/export", methods=["GET"])
+def export_alerts():
+    """Bulk export with the GET /alerts filters but no default limit."""
+    try:
+        try:
+            query = parse_alert_query(request.args, default_limit=None, max_limit=None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        fmt = negotiate_format(["parquet", "arrow", "ndjson"])
+        if fmt is None:
+            return jsonify({"error": "unsupported format: expected parquet, arrow or ndjson"}), 406
+        if fmt == "ndjson":
+            return stream_json_response(query, fmt)
+        response = columnar_response(query, fmt)
+        if fmt == "parquet" and response.status_code == 200:
+            response.headers["Content-Disposition"] = "attachment; filename=alerts.parquet"
+        return response
+    except Exception as e:
+        print(f"[HUB] Error exporting alerts: {e}")
+        return jsonify({"error": "internal server error"}), 500
+
+@app.route("/alerts/search", methods=["GET"])
+def search():
+    """Full-text search, ranked by relevance, paged with offset."""
+    try:
+        q = (request.args.get("q") or "").strip()
+        if not q:
+            return jsonify({"error": "missing q"}), 400
+        sort = request.args.get("sort", "rank")
+        if sort not in ("rank", "recent"):
+            return jsonify({"error": "invalid sort: expected rank or recent"}), 400
+        try:
+            query = parse_alert_query(request.args, default_limit=SEARCH_PAGE_SIZE)
+            offset = _int_arg(request.args, "offset", 0)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if offset < 0:
+            return jsonify({"error": "invalid offset: must not be negative"}), 400
+        # search pages by offset, not by id cursor
+        before_id, after_id = query.pop("before_id"), query.pop("after_id")
+        if before_id is not None or after_id is not None:
+            return jsonify({"error": "before_id and after_id are not supported here: page with offset"}), 400
+        if query["fields"] and "id" not in query["fields"]:
+            query["fields"] = ["id"] + query["fields"]
+        results = store.search_alerts(q, offset=offset, sort=sort, **query)
+        response = jsonify(results)
+        if len(results) == query["limit"]:
+            response.headers["X-Next-Offset"] = str(offset + len(results))
+        return response
+    except QueryTimeout as e:
+        print(f"[HUB] Error searching alerts: {e}")
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        print(f"[HUB] Error searching alerts: {e}")
+        return jsonify({"error": "internal server error"}), 500
+
+@app.route("/alerts/changes", methods=["GET"])
+def list_alert_changes():
+    """Delta sync: alerts inserted, repeated or re-tagged after change_seq
+    since_seq, oldest change first. Clients pass the last change_seq they
+    saw as the next since_seq; X-Next-Since-Seq carries it as well."""
+    try:
+        try:
+            query = parse_alert_query(request.args)
+            since_seq = _int_arg(request.args, "since_seq", 0)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # the change_seq cursor replaces the id cursors
+        before_id, after_id = query.pop("before_id"), query.pop("after_id")
+        if before_id is not None or after_id is not None:
+            return jsonify({"error": "before_id and after_id are not supported here: page with since_seq"}), 400
+        limit = query.pop("limit")
+        fields = query.pop("fields")
+        if fields and "id" not in fields:
+            fields = ["id"] + fields
+
+        def build():
+            changes, next_seq = store.get_changes(since_seq, limit, fields, **query)
+            response = jsonify(changes)
+            response.headers["X-Next-Since-Seq"] = str(next_seq)
+            return response
+
+        return conditional_response(("changes", request.query_string), build)
+    except QueryTimeout as e:
+        print(f"[HUB] Error retrieving alert changes: {e}")
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        print(f"[HUB] Error retrieving alert changes: {e}")
+        return jsonify({"error": "internal server error"}), 500
+
+@app.route("/alerts/archive", methods=["GET"])
+def list_archived_alerts():
+    try:
+        try:
+            limit = _int_arg(request.args, "limit", DEFAULT_PAGE_SIZE)
+            since = _time_arg(request.args, "since")
+            until = _time_arg(request.args, "until")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            alerts = query_archive(
+                ARCHIVE_DIR,
+                since=since,
+                until=until,
+                suc_id=_list_arg(request.args, "suc_id"),
+                event_type=_list_arg(request.args, "event_type"),
+                severity=_list_arg(request.args, "severity"),
+                limit=min(max(1, limit), MAX_PAGE_SIZE)
+            )
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 501
+        return jsonify(alerts)
+    except Exception as e:
+        print(f"[HUB] Error retrieving archived alerts: {e}")
+        return jsonify({"error": "internal server error"}), 500
+
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({"status": "healthy", "service": "bayanihub-hub"}), 200
+    status = {"status": "healthy", "service": "bayanihub-hub", "storage": store.name}
+    if ingest_queue is not None:
+        status["ingest_queue"] = ingest_queue.stats()
+    if correlation_pool is not None:
+        status["correlation_pool"] = correlation_pool.stats()
+    if correlation_window is not None:
+        status["correlation_index_entries"] = correlation_window.size()
+    status["response_cache"] = response_cache.stats()
+    status["stream"] = event_stream.stats()
+    status["ingest_concurrency"] = ingest_cap.stats()
+    status["rate_limit"] = suc_limiter.stats()
+    return jsonify(status), 200
 
 @app.route("/metrics", methods=["GET"])
 def metrics():
     try:
-        alerts = get_alerts(DB_PATH)
-        total = len(alerts)
-        high_severity = sum(1 for a in alerts if a.get("severity") == "High")
-        medium_severity = sum(1 for a in alerts if a.get("severity") == "Medium")
-        low_severity = sum(1 for a in alerts if a.get("severity") == "Low")
-        
-        suc_counts = {}
-        event_type_counts = {}
-        coordinated_count = 0
-        
-        for a in alerts:
-            suc_id = a.get("suc_id", "unknown")
-            suc_counts[suc_id] = suc_counts.get(suc_id, 0) + 1
-            
-            event_type = a.get("event_type", "unknown")
-            event_type_counts[event_type] = event_type_counts.get(event_type, 0) + 1
-            
-            summary = a.get("summary", "")
-            if summary and "coordinated" in str(summary).lower():
-                coordinated_count += 1
-        
-        return jsonify({
-            "total_alerts": total,
-            "by_severity": {
-                "high": high_severity,
-                "medium": medium_severity,
-                "low": low_severity
-            },
-            "by_suc": suc_counts,
-            "by_event_type": event_type_counts,
-            "coordinated_attacks": coordinated_count
-        })
+        return conditional_response(("metrics",), lambda: jsonify(store.get_metrics()))
+    except QueryTimeout as e:
+        print(f"[HUB] Error calculating metrics: {e}")
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         print(f"[HUB] Error calculating metrics: {e}")
         return jsonify({"error": "internal server error"}), 500
 
-def mask_ip(ip):
-    # naive mask: replace last octet
-    try:
-        if not ip or not isinstance(ip, str):
-            return "masked"
-        parts = ip.split(".")
-        if len(parts) == 4:
-            parts[-1] = "xxx"
-            return ".".join(parts)
-    except (AttributeError, ValueError):
-        pass
-    return "masked"
-
-def hash_username(u):
-    # simple deterministic hash for demo (not secure)
+# Default look-back for /metrics/timeseries when no since is given
+TIMESERIES_DEFAULT_SPAN = {"1m": 24 * 3600, "1h": 30 * 24 * 3600}
+
+@app.route("/metrics/timeseries", methods=["GET"])
+def metrics_timeseries():
     try:
-        if not u or not isinstance(u, str):
-            return "0"
-        return str(abs(hash(u)) % 1000000)
-    except (TypeError, AttributeError):
-        return "0"
+        bucket = request.args.get("bucket", "1m")
+        if bucket not in TIMESERIES_DEFAULT_SPAN:
+            return jsonify({"error": f"invalid bucket: expected one of {', '.join(TIMESERIES_DEFAULT_SPAN)}"}), 400
+        try:
+            since = _time_arg(request.args, "since")
+            until = _time_arg(request.args, "until")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if since is None:
+            since = time.time() - TIMESERIES_DEFAULT_SPAN[bucket]
+        points = store.get_timeseries(
+            bucket=bucket,
+            since=since,
+            until=until,
+            suc_id=_list_arg(request.args, "suc_id"),
+            event_type=_list_arg(request.args, "event_type"),
+            severity=_list_arg(request.args, "severity")
+        )
+        for point in points:
+            point["time"] = datetime.utcfromtimestamp(point["bucket"]).isoformat() + "Z"
+        return jsonify({"bucket": bucket, "since": since, "until": until, "points": points})
+    except QueryTimeout as e:
+        print(f"[HUB] Error calculating timeseries: {e}")
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        print(f"[HUB] Error calculating timeseries: {e}")
+        return jsonify({"error": "internal server error"}), 500
 
 if __name__ == "__main__":
     # Get port from environment variable (for Render, Heroku, etc.) or default to 5000
     port = int(os.environ.get("PORT", 5000))
     print(f"[HUB] Starting BAYANIHUB Hub on http://0.0.0.0:{port}")
-    print(f"[HUB] Database: {DB_PATH}")
+    if store.name == "sqlite":
+        print(f"[HUB] Database: {DB_PATH}")
+    else:
+        print(f"[HUB] Storage: {store.name}")
     # Disable debug mode in production
     debug_mode = os.environ.get("FLASK_DEBUG", "False").lower() == "true"
     app.run(host="0.0.0.0", port=port, debug=debug_mode)
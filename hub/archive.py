@@ -0,0 +1,205 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from storage import connection, delete_rows, row_to_alert, ALERT_FIELDS, OCCURRENCE_FIELDS
+from columnar import require_pyarrow, alert_schema, record_batches
+
+# Alerts are partitioned by event time (ts_epoch) into fixed-size
+# partitions, daily by default. Partitions older than the retention period
+# are written to one compressed Parquet file each and removed from sqlite;
+# archived partitions stay queryable read-only through query_archive.
+
+PARTITION_SECONDS = 86400
+ARCHIVE_COLUMNS = ALERT_FIELDS + OCCURRENCE_FIELDS + ("ts_epoch",)
+FILE_TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+
+def partition_start(epoch, partition_seconds=PARTITION_SECONDS):
+    return int(epoch // partition_seconds) * partition_seconds
+
+def _format_time(epoch):
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime(FILE_TIME_FORMAT)
+
+def archive_file_name(start, end, first_id):
+    # first_id keeps late rows archived from the same partition in their own file
+    return f"alerts-{_format_time(start)}-{_format_time(end)}-{first_id}.parquet"
+
+def parse_archive_file_name(name):
+    """Return the (start, end) epochs covered by an archive file, or None."""
+    if not (name.startswith("alerts-") and name.endswith(".parquet")):
+        return None
+    parts = name[len("alerts-"):-len(".parquet")].split("-")
+    if len(parts) != 3:
+        return None
+    try:
+        start = datetime.strptime(parts[0], FILE_TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+        end = datetime.strptime(parts[1], FILE_TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+    return start, end
+
+def archive_partition(db_path, archive_dir, start, end, compression="zstd", batch_size=5000):
+    """Move alerts with start <= ts_epoch < end into one Parquet file.
+
+    Returns the number of alerts archived. The file is complete on disk
+    before the rows are deleted, so an interrupted run loses nothing.
+    """
+    pa, pq = require_pyarrow()
+    schema = alert_schema(pa, ARCHIVE_COLUMNS)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    alert_ids = []
+    writer = None
+    tmp_path = os.path.join(archive_dir, f".alerts-{int(start)}.parquet.tmp")
+    try:
+        with connection(db_path) as conn:
+            c = conn.cursor()
+            c.execute(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM alerts WHERE ts_epoch >= ? AND ts_epoch < ? ORDER BY id",
+                      (start, end))
+            for batch in record_batches(pa, schema, iter(lambda: c.fetchmany(batch_size), [])):
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, schema, compression=compression)
+                writer.write_batch(batch)
+                alert_ids.extend(batch.column(0).to_pylist())
+    finally:
+        if writer is not None:
+            writer.close()
+    if not alert_ids:
+        return 0
+
+    os.replace(tmp_path, os.path.join(archive_dir, archive_file_name(start, end, alert_ids[0])))
+    with connection(db_path) as conn:
+        delete_rows(conn.cursor(), alert_ids)
+    return len(alert_ids)
+
+def archive_expired(db_path, archive_dir, retention_days, partition_seconds=PARTITION_SECONDS,
+                    compression="zstd", now=None):
+    """Archive every whole partition older than retention_days.
+
+    Returns a list of (partition start, alerts archived).
+    """
+    now = time.time() if now is None else now
+    cutoff = partition_start(now - retention_days * 86400, partition_seconds)
+    archived = []
+    start = None
+    while True:
+        with connection(db_path) as conn:
+            c = conn.cursor()
+            if start is None:
+                c.execute("SELECT MIN(ts_epoch) FROM alerts")
+            else:
+                c.execute("SELECT MIN(ts_epoch) FROM alerts WHERE ts_epoch >= ?", (start + partition_seconds,))
+            oldest = c.fetchone()[0]
+        if oldest is None:
+            break
+        start = partition_start(oldest, partition_seconds)
+        if start + partition_seconds > cutoff:
+            break
+        count = archive_partition(db_path, archive_dir, start, start + partition_seconds, compression)
+        print(f"[HUB] Archived {count} alerts from partition {_format_time(start)}")
+        archived.append((start, count))
+    return archived
+
+def _value_filter(column, values):
+    if isinstance(values, str):
+        values = [values]
+    return (column, "in", list(values))
+
+def query_archive(archive_dir, since=None, until=None, suc_id=None, event_type=None, severity=None, limit=None):
+    """Read archived alerts, newest event time first, in the get_alerts
+    format.
+
+    Only files whose partition overlaps [since, until] are opened. Files
+    are read newest partition first, and reading stops once limit alerts
+    are newer than anything the next file can hold.
+    """
+    pa, pq = require_pyarrow()
+    if not os.path.isdir(archive_dir):
+        return []
+    filters = []
+    if since is not None:
+        filters.append(("ts_epoch", ">=", since))
+    if until is not None:
+        filters.append(("ts_epoch", "<=", until))
+    if suc_id:
+        filters.append(_value_filter("suc_id", suc_id))
+    if event_type:
+        filters.append(_value_filter("event_type", event_type))
+    if severity:
+        filters.append(_value_filter("severity", severity))
+
+    files = []
+    for name in os.listdir(archive_dir):
+        bounds = parse_archive_file_name(name)
+        if bounds is None:
+            continue
+        if since is not None and bounds[1] <= since:
+            continue
+        if until is not None and bounds[0] > until:
+            continue
+        files.append((bounds[1], name))
+    files.sort(reverse=True)
+
+    columns = list(ALERT_FIELDS) + ["ts_epoch"]
+    table = None
+    for i, (_, name) in enumerate(files):
+        part = pq.read_table(os.path.join(archive_dir, name), columns=columns, filters=filters or None)
+        table = part if table is None else pa.concat_tables([table, part])
+        table = table.sort_by([("ts_epoch", "descending"), ("id", "descending")])
+        if limit is not None:
+            table = table.slice(0, limit)
+            # every alert in the next file is older than its partition end
+            if table.num_rows == limit and (i + 1 == len(files) or table.column("ts_epoch")[-1].as_py() >= files[i + 1][0]):
+                break
+    if table is None:
+        return []
+    columns = [table.column(name).to_pylist() for name in ALERT_FIELDS]
+    return [row_to_alert(row, ALERT_FIELDS) for row in zip(*columns)]
+
+class Archiver:
+    """Background thread that archives expired partitions periodically."""
+
+    def __init__(self, db_path, archive_dir, retention_days, interval_seconds=3600,
+                 partition_seconds=PARTITION_SECONDS):
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.interval_seconds = interval_seconds
+        self.partition_seconds = partition_seconds
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bayanihub-archiver", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                archive_expired(self.db_path, self.archive_dir, self.retention_days, self.partition_seconds)
+            except Exception as e:
+                print(f"[HUB] Error archiving alerts: {e}")
+            self._stopping.wait(self.interval_seconds)
+
+def main(argv=None):
+    db_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Archive expired BAYANIHUB alert partitions to Parquet")
+    parser.add_argument("--db", default=os.environ.get("BAYANI_DB", os.path.join(db_dir, "bayanihub.db")))
+    parser.add_argument("--archive-dir", default=os.environ.get("BAYANI_ARCHIVE_DIR", os.path.join(db_dir, "archive")))
+    parser.add_argument("--retention-days", type=float, default=float(os.environ.get("BAYANI_RETENTION_DAYS", 30)))
+    parser.add_argument("--partition-seconds", type=int,
+                        default=int(os.environ.get("BAYANI_PARTITION_SECONDS", PARTITION_SECONDS)))
+    args = parser.parse_args(argv)
+    archived = archive_expired(args.db, args.archive_dir, args.retention_days, args.partition_seconds)
+    print(f"Archived {sum(count for _, count in archived)} alerts from {len(archived)} partition(s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import storage
+from correlation import CorrelationWindow, correlate_and_tag, TIME_WINDOW_SECONDS
+
+# Storage backends behind one interface, so the hub can run on sqlite (the
+# default, durable) or on an in-memory columnar store (memstore.py) for load
+# testing and ephemeral edge hubs, and so backends can be benchmarked
+# against each other with the same workload (see main below).
+
+BACKENDS = ("sqlite", "memory")
+
+class AlertStore:
+    """Interface the hub uses for alert storage.
+
+    Query methods take the get_alerts filters (see
+    storage.build_alert_query) and return the same shapes as the
+    functions in storage.py.
+    """
+
+    name = None
+
+    def insert_alerts(self, records, classify=None, coalesce=None):
+        """Store records in order and return their ids. classify(c, record)
+        returns (severity, summary) and may look up stored alerts through
+        c; it may be called for the whole batch before any of it is
+        written (see correlation.BatchCorrelation). Records that repeat
+        a stored alert within coalesce(event_type) seconds are folded
+        into it (see storage.insert_rows)."""
+        raise NotImplementedError
+
+    def insert_alert(self, record, classify=None, coalesce=None):
+        return self.insert_alerts([record], classify, coalesce)[0]
+
+    def update_severity(self, alert_id, severity, summary):
+        raise NotImplementedError
+
+    def get_alerts(self, **query):
+        raise NotImplementedError
+
+    def iter_alert_batches(self, batch_size=1000, **query):
+        """Yield lists of row tuples in the order of the requested fields."""
+        raise NotImplementedError
+
+    def search_alerts(self, q, fields=None, limit=50, offset=0, sort="rank", **filters):
+        raise NotImplementedError
+
+    def get_changes(self, since_seq=0, limit=500, fields=None, **filters):
+        """(changes, next_seq): alerts changed after since_seq in change_seq
+        order, and the since_seq to continue from; see storage.get_changes."""
+        raise NotImplementedError
+
+    def get_metrics(self):
+        raise NotImplementedError
+
+    def get_timeseries(self, bucket="1m", since=None, until=None, suc_id=None, event_type=None, severity=None):
+        raise NotImplementedError
+
+    def add_change_listener(self, listener):
+        """Call listener(kind, items) after each committed write; see
+        storage.add_change_listener for the kinds and items."""
+        raise NotImplementedError
+
+    def data_version(self):
+        """(version, modified): version increases with every write, and
+        modified is the epoch time of the latest one."""
+        raise NotImplementedError
+
+    def correlate(self, alert_id, window=None):
+        """Classify a stored alert and write its tags; returns (severity, summary)."""
+        raise NotImplementedError
+
+    def correlation_window(self, window_seconds=TIME_WINDOW_SECONDS):
+        """A CorrelationWindow loaded with the most recent stored alerts."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class SqliteStore(AlertStore):
+    """The storage.py functions bound to one database file."""
+
+    name = "sqlite"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        storage.init_db(db_path)
+
+    def insert_alerts(self, records, classify=None, coalesce=None):
+        return storage.insert_alerts(self.db_path, records, classify=classify, coalesce=coalesce)
+
+    def update_severity(self, alert_id, severity, summary):
+        storage.update_alert_severity(self.db_path, alert_id, severity, summary)
+
+    def get_alerts(self, **query):
+        return storage.get_alerts(self.db_path, **query)
+
+    def iter_alert_batches(self, batch_size=1000, **query):
+        return storage.iter_alert_batches(self.db_path, batch_size, **query)
+
+    def search_alerts(self, q, fields=None, limit=50, offset=0, sort="rank", **filters):
+        return storage.search_alerts(self.db_path, q, fields=fields, limit=limit, offset=offset, sort=sort, **filters)
+
+    def get_changes(self, since_seq=0, limit=500, fields=None, **filters):
+        return storage.get_changes(self.db_path, since_seq, limit, fields, **filters)
+
+    def get_metrics(self):
+        return storage.get_metrics(self.db_path)
+
+    def get_timeseries(self, bucket="1m", since=None, until=None, suc_id=None, event_type=None, severity=None):
+        return storage.get_timeseries(self.db_path, bucket, since, until, suc_id, event_type, severity)
+
+    def add_change_listener(self, listener):
+        def forward(db_path, kind, items):
+            if db_path == self.db_path:
+                listener(kind, items)
+        storage.add_change_listener(forward)
+
+    def data_version(self):
+        return storage.get_data_version(self.db_path)
+
+    def correlate(self, alert_id, window=None):
+        return correlate_and_tag(self.db_path, alert_id, window)
+
+    def correlation_window(self, window_seconds=TIME_WINDOW_SECONDS):
+        return CorrelationWindow.rebuild(self.db_path, window_seconds)
+
+    def close(self):
+        storage.close_connections(self.db_path)
+
+def open_store(backend, db_path, snapshot_path=None, snapshot_interval=60):
+    """Create the store for a backend name. db_path is used by sqlite;
+    the memory backend restores from and snapshots to snapshot_path."""
+    if backend == "sqlite":
+        return SqliteStore(db_path)
+    if backend == "memory":
+        try:
+            from memstore import MemoryStore
+        except ImportError:
+            raise RuntimeError("numpy is required for the memory storage backend (pip install numpy)")
+        return MemoryStore(snapshot_path, snapshot_interval)
+    raise ValueError(f"unknown storage backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+def _bench_records(count, sucs=10, event_types=("port_scan", "brute_force", "malware"), span_seconds=86400):
+    start = time.time() - span_seconds
+    for i in range(count):
+        epoch = start + span_seconds * i / count
+        yield {
+            "suc_id": f"SUC_{random.randrange(sucs)}",
+            "timestamp": datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat(),
+            "event_type": random.choice(event_types),
+            "raw_masked": f'{{"dst_port": {random.choice([22, 80, 443, 3389])}, "attempts": {random.randrange(1, 50)}}}',
+            "anomaly_score": random.random()
+        }
+
+def benchmark(store, count=100000, batch_size=500, queries=20):
+    """Time bulk inserts and the read paths on a store; returns a dict of
+    rates and per-query latencies in milliseconds."""
+    batch = []
+    started = time.perf_counter()
+    for record in _bench_records(count):
+        batch.append(record)
+        if len(batch) == batch_size:
+            store.insert_alerts(batch)
+            batch = []
+    if batch:
+        store.insert_alerts(batch)
+    insert_seconds = time.perf_counter() - started
+
+    def timed(fn):
+        begin = time.perf_counter()
+        for _ in range(queries):
+            fn()
+        return round((time.perf_counter() - begin) * 1000 / queries, 3)
+
+    since = time.time() - 3600
+    return {
+        "backend": store.name,
+        "alerts": count,
+        "inserts_per_second": round(count / insert_seconds) if insert_seconds else None,
+        "latest_page_ms": timed(lambda: store.get_alerts(limit=500)),
+        "filtered_range_ms": timed(lambda: store.get_alerts(limit=500, event_type="port_scan", dst_port=[22],
+                                                            since=since)),
+        "metrics_ms": timed(store.get_metrics),
+        "timeseries_ms": timed(lambda: store.get_timeseries("1m", since=since)),
+        "update_severity_ms": timed(lambda: store.update_severity(random.randint(1, count), "High", "benchmark"))
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark BAYANIHUB storage backends on the same workload")
+    parser.add_argument("--backend", choices=BACKENDS, action="append",
+                        help="backend to run (repeatable; default: all)")
+    parser.add_argument("--alerts", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--db", default=None, help="sqlite file to use (default: a temporary file)")
+    args = parser.parse_args(argv)
+    for backend in args.backend or BACKENDS:
+        db_path = args.db
+        if backend == "sqlite" and db_path is None:
+            import tempfile
+            db_path = os.path.join(tempfile.mkdtemp(prefix="bayanihub-bench-"), "bench.db")
+        store = open_store(backend, db_path, snapshot_interval=0)
+        try:
+            results = benchmark(store, args.alerts, args.batch_size)
+        finally:
+            store.close()
+        print(" ".join(f"{key}={value}" for key, value in results.items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
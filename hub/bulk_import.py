@@ -0,0 +1,290 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from storage import connection, init_db, insert_rows, set_severity, rebuild_search_index
+from correlation import TIME_WINDOW_SECONDS, alert_tags, classify_alert
+from masking import prepare_alert
+
+# Bulk load of historical alerts from NDJSON or CSV files. Payloads go
+# through the same validation and masking as POST /alerts, are written with
+# executemany in large transactions while the secondary indexes and the
+# search index are dropped, and are correlated in one pass per event type
+# once everything is loaded. Progress is checkpointed after every commit,
+# so an interrupted import resumes where it stopped.
+#
+# Run it while the hub is stopped: the hub's in-memory correlation index
+# does not see imported alerts until it restarts, and live queries are
+# slow while the indexes are gone.
+
+CSV_FIELDS = ("suc_id", "timestamp", "event_type", "anomaly_score")
+CSV_DETAIL_FIELDS = ("src_ip", "username", "attempts", "dst_port", "ports_scanned")
+CSV_NUMERIC_DETAILS = ("attempts", "dst_port", "ports_scanned")
+
+def _csv_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+def _csv_payload(row):
+    """A POST /alerts payload from a CSV row. Details come from a
+    raw_details JSON column or from src_ip, username, ... columns."""
+    payload = {name: row[name] for name in CSV_FIELDS if row.get(name)}
+    if row.get("raw_details"):
+        try:
+            payload["raw_details"] = json.loads(row["raw_details"])
+        except ValueError:
+            payload["raw_details"] = {}
+    else:
+        payload["raw_details"] = {
+            name: _csv_number(row[name]) if name in CSV_NUMERIC_DETAILS else row[name]
+            for name in CSV_DETAIL_FIELDS if row.get(name)
+        }
+    return payload
+
+def _ndjson_payload(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+def read_payloads(path, fmt=None, skip=0):
+    """Yield alert payloads from an NDJSON or CSV file after the first skip
+    entries (blank NDJSON lines do not count). Unparseable lines yield None."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            for row in itertools.islice(csv.DictReader(f), skip, None):
+                yield _csv_payload(row)
+        else:
+            for line in itertools.islice((line for line in f if line.strip()), skip, None):
+                yield _ndjson_payload(line)
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return None
+
+def save_checkpoint(path, state):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def drop_secondary_indexes(conn):
+    """Drop the alerts indexes and return [(name, sql)] to recreate them."""
+    c = conn.cursor()
+    c.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name='alert_rows' AND sql IS NOT NULL")
+    indexes = c.fetchall()
+    for name, _ in indexes:
+        c.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+    return [list(index) for index in indexes]
+
+def recreate_indexes(conn, indexes):
+    c = conn.cursor()
+    existing = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    for name, sql in indexes:
+        if name not in existing:
+            c.execute(sql)
+    conn.commit()
+
+def load_file(db_path, path, state, checkpoint_path, fmt=None, batch_size=5000, commit_rows=100000,
+              started=None, inserted_before=0):
+    """Insert one file's alerts, committing and checkpointing every
+    commit_rows alerts. Updates the counters in state; the reported rate
+    counts alerts stored since started, after the first inserted_before."""
+    key = os.path.abspath(path)
+    progress = state["files"].setdefault(key, {"consumed": 0, "complete": False})
+    if progress["complete"]:
+        return
+    started = started or time.time()
+    consumed = progress["consumed"]
+
+    def commit(conn, complete=False):
+        conn.commit()
+        progress["consumed"] = consumed
+        progress["complete"] = complete
+        save_checkpoint(checkpoint_path, state)
+        elapsed = max(time.time() - started, 1e-9)
+        print(f"[IMPORT] {state['inserted']} alerts stored, {state['rejected']} rejected "
+              f"({(state['inserted'] - inserted_before) / elapsed:.0f} rows/s)")
+
+    with connection(db_path) as conn:
+        c = conn.cursor()
+        batch = []
+        uncommitted = 0
+        for payload in read_payloads(path, fmt, skip=consumed):
+            consumed += 1
+            record, error = prepare_alert(payload) if payload is not None else (None, "invalid JSON")
+            if record is None:
+                state["rejected"] += 1
+                continue
+            # tagged as uncorrelated; the correlation pass re-tags the
+            # coordinated ones
+            record["severity"], record["summary"] = alert_tags(record["suc_id"], record["event_type"],
+                                                               record["anomaly_score"], False)
+            batch.append(record)
+            if len(batch) >= batch_size:
+                uncommitted += _insert_batch(c, batch, state)
+                batch = []
+                if uncommitted >= commit_rows:
+                    commit(conn)
+                    uncommitted = 0
+        if batch:
+            _insert_batch(c, batch, state)
+        commit(conn, complete=True)
+
+def _insert_batch(c, records, state):
+    alert_ids = insert_rows(c, records, fts=False)
+    state["inserted"] += len(alert_ids)
+    state["first_id"] = alert_ids[0] if state["first_id"] is None else min(state["first_id"], alert_ids[0])
+    state["last_id"] = alert_ids[-1] if state["last_id"] is None else max(state["last_id"], alert_ids[-1])
+    return len(alert_ids)
+
+def _coordinated_flags(rows, window_seconds):
+    """For rows of (suc_id, ts_epoch) sorted by ts_epoch, whether another
+    SUC has a row within window_seconds of each one. Two linear passes,
+    each tracking the latest rows of the two most recent distinct SUCs."""
+    flags = [False] * len(rows)
+    for order in (range(len(rows)), range(len(rows) - 1, -1, -1)):
+        recent = []  # up to two (epoch, suc_id), distinct SUCs, nearest first
+        for i in order:
+            suc_id, epoch = rows[i]
+            other = next((r for r in recent if r[1] != suc_id), None)
+            if other is not None and abs(epoch - other[0]) <= window_seconds:
+                flags[i] = True
+            if recent and recent[0][1] == suc_id:
+                recent[0] = (epoch, suc_id)
+            else:
+                recent = [(epoch, suc_id)] + recent[:1]
+    return flags
+
+def correlate_range(db_path, first_id, last_id, window_seconds=TIME_WINDOW_SECONDS, commit_rows=100000):
+    """Correlate alerts first_id..last_id against everything stored, one
+    event type at a time, and re-tag those whose tags change. Returns
+    (alerts correlated, alerts re-tagged)."""
+    correlated = 0
+    retagged = 0
+    with connection(db_path) as conn:
+        c = conn.cursor()
+        c.execute("SELECT DISTINCT event_code, event_type FROM alerts WHERE id BETWEEN ? AND ?", (first_id, last_id))
+        event_types = c.fetchall()
+        for event_code, event_type in event_types:
+            c.execute("SELECT MIN(ts_epoch), MAX(ts_epoch) FROM alerts WHERE event_code IS ? AND id BETWEEN ? AND ?",
+                      (event_code, first_id, last_id))
+            low, high = c.fetchone()
+            coordinated = {}
+            if event_type and low is not None:
+                c.execute("""
+                    SELECT id, suc_id, ts_epoch FROM alerts
+                    WHERE event_code=? AND ts_epoch BETWEEN ? AND ?
+                    ORDER BY ts_epoch
+                """, (event_code, low - window_seconds, high + window_seconds))
+                rows = c.fetchall()
+                flags = _coordinated_flags([(suc_id, epoch) for _, suc_id, epoch in rows], window_seconds)
+                coordinated = {row[0]: flag for row, flag in zip(rows, flags) if first_id <= row[0] <= last_id}
+
+            c.execute("""
+                SELECT id, suc_id, timestamp, event_type, anomaly_score, ts_epoch, severity, summary
+                FROM alerts WHERE event_code IS ? AND id BETWEEN ? AND ?
+            """, (event_code, first_id, last_id))
+            pending = 0
+            for alert_id, suc_id, timestamp, event_type_, anomaly_score, ts_epoch, severity, summary in c.fetchall():
+                if alert_id in coordinated:
+                    tags = alert_tags(suc_id, event_type_, anomaly_score, coordinated[alert_id])
+                else:
+                    # no usable event time or event type: same rules as ingest
+                    record = {"suc_id": suc_id, "timestamp": timestamp, "event_type": event_type_,
+                              "anomaly_score": anomaly_score, "ts_epoch": ts_epoch}
+                    tags = classify_alert(c, record)
+                correlated += 1
+                if tags != (severity, summary):
+                    set_severity(c, alert_id, *tags)
+                    retagged += 1
+                    pending += 1
+                    if pending >= commit_rows:
+                        conn.commit()
+                        pending = 0
+            conn.commit()
+    return correlated, retagged
+
+def run_import(db_path, paths, checkpoint_path, fmt=None, batch_size=5000, commit_rows=100000,
+               keep_indexes=False, correlate=True):
+    """Import files into db_path, resuming from checkpoint_path if present.
+    Returns the final import state."""
+    state = load_checkpoint(checkpoint_path)
+    if state is None:
+        init_db(db_path)
+        state = {"phase": "load", "files": {}, "indexes": [], "inserted": 0, "rejected": 0,
+                 "first_id": None, "last_id": None}
+    else:
+        print(f"[IMPORT] Resuming from {checkpoint_path} ({state['inserted']} alerts already stored)")
+    started = time.time()
+    inserted_before = state["inserted"]
+
+    if state["phase"] == "load":
+        if not keep_indexes:
+            with connection(db_path) as conn:
+                state["indexes"] += drop_secondary_indexes(conn)
+            save_checkpoint(checkpoint_path, state)
+        for path in paths:
+            load_file(db_path, path, state, checkpoint_path, fmt, batch_size, commit_rows, started, inserted_before)
+        state["phase"] = "index"
+        save_checkpoint(checkpoint_path, state)
+    load_seconds = time.time() - started
+
+    if state["phase"] == "index":
+        print("[IMPORT] Rebuilding indexes")
+        with connection(db_path) as conn:
+            recreate_indexes(conn, state["indexes"])
+            rebuild_search_index(conn)
+            conn.execute("ANALYZE")
+            conn.commit()
+        state["phase"] = "correlate" if correlate else "done"
+        save_checkpoint(checkpoint_path, state)
+
+    if state["phase"] == "correlate":
+        if state["first_id"] is not None:
+            print("[IMPORT] Correlating imported alerts")
+            correlated, retagged = correlate_range(db_path, state["first_id"], state["last_id"],
+                                                   commit_rows=commit_rows)
+            print(f"[IMPORT] Correlated {correlated} alerts, re-tagged {retagged}")
+        state["phase"] = "done"
+        save_checkpoint(checkpoint_path, state)
+
+    inserted = state["inserted"] - inserted_before
+    print(f"[IMPORT] Stored {inserted} alerts in {load_seconds:.1f}s "
+          f"({inserted / max(load_seconds, 1e-9):.0f} rows/s), {time.time() - started:.1f}s in total")
+    os.remove(checkpoint_path)
+    return state
+
+def main(argv=None):
+    db_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Bulk import historical alerts into BAYANIHUB from NDJSON or CSV")
+    parser.add_argument("files", nargs="+", help="NDJSON (one POST /alerts payload per line) or CSV files")
+    parser.add_argument("--db", default=os.environ.get("BAYANI_DB", os.path.join(db_dir, "bayanihub.db")))
+    parser.add_argument("--format", choices=("ndjson", "csv"), help="default: by file extension")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per executemany")
+    parser.add_argument("--commit-rows", type=int, default=100000, help="rows per transaction and checkpoint")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <db>.import-checkpoint.json)")
+    parser.add_argument("--keep-indexes", action="store_true", help="do not drop indexes during the load")
+    parser.add_argument("--no-correlate", action="store_true", help="skip the correlation pass")
+    args = parser.parse_args(argv)
+    run_import(args.db, args.files, args.checkpoint or args.db + ".import-checkpoint.json", args.format,
+               max(1, args.batch_size), max(1, args.commit_rows), args.keep_indexes, not args.no_correlate)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import io
+
+# Columnar (Apache Arrow) encoding of alert rows. Rows are taken in
+# batches of tuples (as from fetchmany) and turned into Arrow record batches
+# column by column, without building a dict per row. raw_masked stays a
+# JSON string column.
+
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("pyarrow is required for Arrow/Parquet output (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+def alert_schema(pa, fields):
+    types = {
+        "id": pa.int64(),
+        "anomaly_score": pa.float64(),
+        "ts_epoch": pa.float64(),
+        "attempts": pa.int64(),
+        "dst_port": pa.int64(),
+        "ports_scanned": pa.int64(),
+        "occurrence_count": pa.int64(),
+        "change_seq": pa.int64()
+    }
+    return pa.schema([(field, types.get(field, pa.string())) for field in fields])
+
+def record_batches(pa, schema, row_batches):
+    """Turn an iterable of row lists (tuples in schema order) into record batches."""
+    for rows in row_batches:
+        if not rows:
+            continue
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back in chunks."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_arrow(fields, row_batches, fmt="arrow"):
+    """Yield the bytes of an Arrow IPC stream (fmt="arrow") or a Parquet
+    file (fmt="parquet") as each record batch is encoded."""
+    pa, pq = require_pyarrow()
+    schema = alert_schema(pa, fields)
+    sink = _ChunkSink()
+    out = pa.PythonFile(sink, mode="w")
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(out, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(out, schema)
+    try:
+        for batch in record_batches(pa, schema, row_batches):
+            writer.write_batch(batch)
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    out.close()
+    chunk = sink.take()
+    if chunk:
+        yield chunk
@@ -0,0 +1,131 @@
+import gzip
+import io
+import json
+import zlib
+
+# gzip for hub traffic, stdlib only. Responses are compressed when the
+# client accepts gzip: whole bodies above a size threshold in one go,
+# streamed bodies chunk by chunk with a sync flush after each chunk so
+# clients still receive rows as they are produced. Request bodies sent
+# with Content-Encoding: gzip are inflated, up to a size limit, before
+# Flask reads them.
+
+GZIP_WBITS = 31  # zlib with a gzip header and trailer
+
+# Parquet is compressed already, and Server-Sent Events are small and must
+# not sit in a compressor
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", "application/vnd.apache.arrow.stream",
+                          "text/plain", "text/csv", "text/html")
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        # release what the inner iterator holds (e.g. a read connection)
+        # when the client goes away mid-stream
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+def compress_response(response, request, level=6, min_size=1024):
+    """gzip response when the request accepts it; for after_request.
+
+    A strong ETag is made weak, as the bytes differ from the uncompressed
+    representation of the same data.
+    """
+    if level <= 0 or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.status_code != 200 or "Content-Encoding" in response.headers or response.direct_passthrough
+            or request.method == "HEAD" or not request.accept_encodings["gzip"]):
+        return response
+    if response.is_streamed:
+        response.response = _gzip_stream(response.response, level)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        response.set_data(gzip.compress(body, compresslevel=level, mtime=0))
+    response.headers["Content-Encoding"] = "gzip"
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+class GzipRequestMiddleware:
+    """WSGI middleware that inflates gzip-encoded POST bodies for paths,
+    so views read them like any other body. Chunked uploads without a
+    Content-Length are read to their end when the server marks the input
+    as terminated (wsgi.input_terminated).
+
+    The inflated size is capped at max_size bytes (413 beyond it) to keep a
+    small compressed upload from expanding without bound; a body that is
+    not valid gzip gets a 400.
+    """
+
+    def __init__(self, app, paths, max_size=10 << 20):
+        self.app = app
+        self.paths = set(paths)
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if (encoding not in ("gzip", "x-gzip") or environ.get("REQUEST_METHOD") != "POST"
+                or environ.get("PATH_INFO") not in self.paths):
+            return self.app(environ, start_response)
+        try:
+            body = self._inflate(environ)
+        except ValueError as e:
+            return self._error(start_response, "413 Request Entity Too Large", str(e))
+        except (zlib.error, EOFError, OSError):
+            return self._error(start_response, "400 Bad Request", "malformed gzip request body")
+        environ = dict(environ)
+        del environ["HTTP_CONTENT_ENCODING"]
+        environ["wsgi.input"] = io.BytesIO(body)
+        environ["CONTENT_LENGTH"] = str(len(body))
+        return self.app(environ, start_response)
+
+    def _inflate(self, environ):
+        stream = environ["wsgi.input"]
+        try:
+            remaining = int(environ.get("CONTENT_LENGTH") or -1)
+        except ValueError:
+            remaining = 0
+        if remaining < 0 and not environ.get("wsgi.input_terminated"):
+            # no length and a stream the server does not end (as werkzeug's
+            # get_input_stream): there is no body to read safely
+            remaining = 0
+        decompressor = zlib.decompressobj(GZIP_WBITS)
+        parts = []
+        size = 0
+        # remaining < 0: a chunked upload, read until the server ends it
+        while remaining != 0:
+            chunk = stream.read(64 * 1024 if remaining < 0 else min(remaining, 64 * 1024))
+            if not chunk:
+                break
+            if remaining > 0:
+                remaining -= len(chunk)
+            # max_length bounds the output of each step, so a zip bomb
+            # is caught before it is held in memory
+            data = decompressor.decompress(chunk, self.max_size - size + 1)
+            size += len(data)
+            if size > self.max_size or decompressor.unconsumed_tail:
+                raise ValueError(f"inflated request body too large (max {self.max_size} bytes)")
+            parts.append(data)
+            if decompressor.eof:
+                break
+        if not decompressor.eof:
+            raise EOFError("truncated gzip body")
+        return b"".join(parts)
+
+    def _error(self, start_response, status, message):
+        body = json.dumps({"error": message}).encode("utf-8")
+        start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+        return [body]
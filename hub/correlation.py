@@ -1,85 +1,266 @@
-from datetime import datetime, timedelta
-import sqlite3
-import json
-from storage import update_alert_severity
+from concurrent.futures import ThreadPoolExecutor
+import bisect
+import threading
+import time
+from storage import connection, set_severity, notify_changes, parse_epoch, SUMMARY_TEMPLATES, TAG_COORDINATED, TAG_DETECTED
 
 # Simple POC correlation:
 # If another alert of same event_type from different SUC occurred within 2 minutes, mark as coordinated.
 
 TIME_WINDOW_SECONDS = 120
 
-def correlate_and_tag(db_path, alert_id):
+def score_severity(anomaly_score):
+    # severity logic (very simple)
+    severity = "Medium"
     try:
-        with sqlite3.connect(db_path) as conn:
+        if anomaly_score is not None:
+            score = float(anomaly_score)
+            if score > 0.7:
+                severity = "High"
+            elif score > 0.5:
+                severity = "Medium"
+            else:
+                severity = "Low"
+    except (ValueError, TypeError):
+        severity = "Medium"
+    return severity
+
+class CorrelationWindow:
+    """In-memory index of recent alerts per event_type.
+
+    For each event_type it keeps the sorted epochs seen from each SUC,
+    back to 2 * window seconds before the newest alert of that type. That
+    is enough to answer "another SUC within the window?" exactly for any
+    alert no older than one window behind the newest; older alerts are
+    reported as not covered and fall back to the SQL lookup.
+    """
+
+    def __init__(self, window_seconds=TIME_WINDOW_SECONDS):
+        self.window = window_seconds
+        self._lock = threading.Lock()
+        self._events = {}  # event_type -> {suc_id: sorted list of epochs}
+        self._newest = {}  # event_type -> newest epoch seen
+        # Entries older than floor were never loaded (see rebuild)
+        self.floor = float("-inf")
+
+    def add(self, event_type, suc_id, epoch):
+        if not event_type or not suc_id or epoch is None:
+            return
+        with self._lock:
+            sucs = self._events.setdefault(event_type, {})
+            epochs = sucs.setdefault(suc_id, [])
+            if not epochs or epoch >= epochs[-1]:
+                epochs.append(epoch)
+            else:
+                bisect.insort(epochs, epoch)
+            if epoch > self._newest.get(event_type, float("-inf")):
+                self._newest[event_type] = epoch
+                self._evict(event_type)
+
+    def _evict(self, event_type):
+        horizon = self._newest[event_type] - 2 * self.window
+        sucs = self._events[event_type]
+        for suc_id in list(sucs):
+            epochs = sucs[suc_id]
+            if epochs[0] < horizon:
+                del epochs[:bisect.bisect_left(epochs, horizon)]
+                if not epochs:
+                    del sucs[suc_id]
+
+    def has_other_suc(self, event_type, suc_id, epoch):
+        """True/False if another SUC reported event_type within the window
+        around epoch, or None when the index cannot answer exactly."""
+        with self._lock:
+            newest = self._newest.get(event_type)
+            if epoch - self.window < self.floor:
+                return None
+            if newest is not None and epoch < newest - self.window:
+                return None
+            low, high = epoch - self.window, epoch + self.window
+            for other, epochs in self._events.get(event_type, {}).items():
+                if other == suc_id:
+                    continue
+                i = bisect.bisect_left(epochs, low)
+                if i < len(epochs) and epochs[i] <= high:
+                    return True
+            return False
+
+    def size(self):
+        with self._lock:
+            return sum(len(epochs) for sucs in self._events.values() for epochs in sucs.values())
+
+    @classmethod
+    def rebuild(cls, db_path, window_seconds=TIME_WINDOW_SECONDS):
+        """Load the last 2 windows of stored alerts into a new index."""
+        index = cls(window_seconds)
+        with connection(db_path) as conn:
+            c = conn.cursor()
+            newest = c.execute("SELECT MAX(ts_epoch) FROM alerts").fetchone()[0]
+            if newest is None:
+                return index
+            cutoff = newest - 2 * window_seconds
+            c.execute("SELECT suc_id, ts_epoch, event_type FROM alerts WHERE ts_epoch >= ? ORDER BY ts_epoch", (cutoff,))
+            for suc_id, epoch, event_type in c:
+                index.add(event_type, suc_id, epoch)
+        index.floor = cutoff
+        return index
+
+class BatchCorrelation:
+    """Correlation for the records of one insert batch.
+
+    Records classified earlier in the batch are kept here and answer
+    lookups for the later ones; they reach the shared window only through
+    commit(), once the batch is stored, so a rolled-back batch leaves no
+    entries behind. Other lookups go to the window (if any) and then SQL.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.seconds = window.window if window is not None else TIME_WINDOW_SECONDS
+        self._events = {}  # event_type -> {suc_id: sorted list of epochs}
+        self._added = []
+
+    def add(self, event_type, suc_id, epoch):
+        if not event_type or not suc_id or epoch is None:
+            return
+        bisect.insort(self._events.setdefault(event_type, {}).setdefault(suc_id, []), epoch)
+        self._added.append((event_type, suc_id, epoch))
+
+    def has_other_suc(self, event_type, suc_id, epoch):
+        low, high = epoch - self.seconds, epoch + self.seconds
+        for other, epochs in self._events.get(event_type, {}).items():
+            if other == suc_id:
+                continue
+            i = bisect.bisect_left(epochs, low)
+            if i < len(epochs) and epochs[i] <= high:
+                return True
+        if self.window is None:
+            return None
+        return self.window.has_other_suc(event_type, suc_id, epoch)
+
+    def classify(self, c, record):
+        """classify for insert_rows: the record's tags, remembered for the
+        rest of the batch."""
+        severity, summary = classify_alert(c, record, self)
+        self.add(record["event_type"], record["suc_id"], record["ts_epoch"])
+        return severity, summary
+
+    def commit(self):
+        """Add the batch's records to the window; call after the commit."""
+        if self.window is not None:
+            for event_type, suc_id, epoch in self._added:
+                self.window.add(event_type, suc_id, epoch)
+        self._added = []
+
+def _find_other_suc(c, suc_id, event_type, epoch):
+    if hasattr(c, "find_other_suc"):
+        # a non-sqlite store (see backends.py) answers the lookup itself
+        return c.find_other_suc(suc_id, event_type, epoch, TIME_WINDOW_SECONDS)
+    # bounded range seek on idx_event_type_ts instead of scanning the type
+    c.execute("""
+        SELECT 1 FROM alerts
+        WHERE event_code=(SELECT id FROM event_types WHERE name=?) AND ts_epoch BETWEEN ? AND ?
+          AND suc_code<>COALESCE((SELECT id FROM sucs WHERE name=?), 0)
+        LIMIT 1
+    """, (event_type, epoch - TIME_WINDOW_SECONDS, epoch + TIME_WINDOW_SECONDS, suc_id))
+    return c.fetchone() is not None
+
+def classify_alert(c, record, window=None):
+    """Return (severity, summary) for an alert record using cursor c
+    (or a store with its own find_other_suc).
+
+    Works for records that are not stored yet, so ingest can write the
+    final tags with the insert.
+    """
+    suc_id = record.get("suc_id")
+    event_type = record.get("event_type")
+
+    # Validate required fields
+    if not suc_id or not event_type:
+        return "Medium", f"{event_type or 'Unknown event'} detected by {suc_id or 'unknown SUC'}"
+
+    # parse timestamp (assuming ISO); unparseable means "now"
+    epoch = record.get("ts_epoch")
+    if epoch is None:
+        epoch = parse_epoch(record.get("timestamp"))
+    if epoch is None:
+        epoch = time.time()
+
+    coordinated = None
+    if window is not None:
+        coordinated = window.has_other_suc(event_type, suc_id, epoch)
+    if coordinated is None:
+        coordinated = _find_other_suc(c, suc_id, event_type, epoch)
+
+    return alert_tags(suc_id, event_type, record.get("anomaly_score"), coordinated)
+
+def alert_tags(suc_id, event_type, anomaly_score, coordinated):
+    """(severity, summary) for an alert once its correlation is known."""
+    severity = score_severity(anomaly_score)
+
+    if coordinated:
+        severity = "High"
+        summary = SUMMARY_TEMPLATES[TAG_COORDINATED].format(suc_id=suc_id, event_type=event_type)
+    else:
+        summary = SUMMARY_TEMPLATES[TAG_DETECTED].format(suc_id=suc_id, event_type=event_type)
+    return severity, summary
+
+def correlate_and_tag(db_path, alert_id, window=None):
+    try:
+        with connection(db_path) as conn:
             c = conn.cursor()
-            c.execute("SELECT id, suc_id, timestamp, event_type, raw_masked, anomaly_score FROM alerts WHERE id=?", (alert_id,))
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("SELECT suc_id, timestamp, event_type, anomaly_score, ts_epoch FROM alerts WHERE id=?", (alert_id,))
             row = c.fetchone()
             if not row:
                 return "Unknown", "No record found"
 
-            id_, suc_id, timestamp, event_type, raw_masked, anomaly_score = row
-            
-            # Validate required fields
-            if not suc_id or not event_type:
-                return "Medium", f"{event_type or 'Unknown event'} detected by {suc_id or 'unknown SUC'}"
-            
-            # parse timestamp (assuming ISO)
-            try:
-                ts = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-            except (ValueError, AttributeError):
-                try:
-                    ts = datetime.fromisoformat(timestamp)
-                except (ValueError, AttributeError):
-                    ts = datetime.utcnow()
-
-            # find other recent alerts with same event_type
-            c.execute("""
-                SELECT id, suc_id, timestamp FROM alerts WHERE event_type=? AND id<>? ORDER BY id DESC
-            """, (event_type, alert_id))
-            others = c.fetchall()
-            coordinated = False
-            for o in others:
-                if len(o) < 3:
-                    continue
-                try:
-                    ots = datetime.fromisoformat(o[2].replace("Z", "+00:00"))
-                    if abs((ts - ots).total_seconds()) <= TIME_WINDOW_SECONDS and o[1] != suc_id:
-                        coordinated = True
-                        break
-                except (ValueError, AttributeError):
-                    try:
-                        ots = datetime.fromisoformat(o[2])
-                        if abs((ts - ots).total_seconds()) <= TIME_WINDOW_SECONDS and o[1] != suc_id:
-                            coordinated = True
-                            break
-                    except (ValueError, AttributeError):
-                        continue
-
-            # severity logic (very simple)
-            severity = "Medium"
-            try:
-                if anomaly_score is not None:
-                    score = float(anomaly_score)
-                    if score > 0.7:
-                        severity = "High"
-                    elif score > 0.5:
-                        severity = "Medium"
-                    else:
-                        severity = "Low"
-            except (ValueError, TypeError):
-                severity = "Medium"
-
-            if coordinated:
-                severity = "High"
-                summary = f"Coordinated {event_type} detected across schools"
-            else:
-                summary = f"{event_type} detected by {suc_id}"
+            suc_id, timestamp, event_type, anomaly_score, ts_epoch = row
+            record = {"suc_id": suc_id, "timestamp": timestamp, "event_type": event_type,
+                      "anomaly_score": anomaly_score, "ts_epoch": ts_epoch}
+            severity, summary = classify_alert(c, record, window)
 
-            # Update the alert with severity and summary
-            update_alert_severity(db_path, alert_id, severity, summary)
+            # Update the alert with severity and summary on the same connection
+            set_severity(c, alert_id, severity, summary)
+            conn.commit()
 
-            return severity, summary
+        notify_changes(db_path, "update", [{"id": alert_id, "severity": severity, "summary": summary}])
+        return severity, summary
     except Exception as e:
         print(f"Error in correlation: {e}")
         return "Medium", "Error processing alert"
 
+class CorrelationPool:
+    """Runs store.correlate (correlate_and_tag for sqlite) for newly stored
+    alerts on worker threads so the ingest request does not wait for the
+    correlation lookup."""
+
+    def __init__(self, store, workers=2, window=None):
+        self.store = store
+        self.window = window
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bayanihub-correlation")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+
+    def submit(self, alert_ids):
+        with self._lock:
+            self._pending += len(alert_ids)
+        for alert_id in alert_ids:
+            self._executor.submit(self._correlate, alert_id)
+
+    def _correlate(self, alert_id):
+        try:
+            self.store.correlate(alert_id, self.window)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "pending": self._pending, "completed": self._completed}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
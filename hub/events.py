@@ -0,0 +1,107 @@
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+# In-process fan-out of alert changes to GET /alerts/stream subscribers.
+# Each change is serialized once into a ring buffer of recent events; a
+# subscriber only remembers the id of the last event it sent and reads
+# newer ones from the buffer, so there is no per-client queue and no
+# per-client database polling. The buffer also serves Last-Event-ID
+# resume; a client that fell further behind gets a "reset" event and
+# should refetch.
+
+class EventBroadcaster:
+    def __init__(self, buffer_size=1000, max_subscribers=100):
+        self.max_subscribers = max_subscribers
+        self._events = deque(maxlen=max(1, buffer_size))
+        self._cond = threading.Condition()
+        # ids start from the clock so they keep increasing across restarts
+        # and a Last-Event-ID from an earlier process is seen as too old
+        self._next_id = int(time.time() * 1000)
+        self._subscribers = 0
+        self._published = 0
+
+    def publish(self, kind, items):
+        """Add one event of the given kind per item and wake subscribers."""
+        if not items:
+            return
+        with self._cond:
+            for item in items:
+                self._events.append((self._next_id, kind, json.dumps(item)))
+                self._next_id += 1
+            self._published += len(items)
+            self._cond.notify_all()
+
+    def _after(self, last_id):
+        """Buffered events after last_id, or None when some of them have
+        already left the buffer."""
+        newer = self._next_id - 1 - last_id
+        if newer < 0 or newer > len(self._events):
+            return None
+        # walk from the newest end, so a caught-up subscriber costs the
+        # events it gets, not the buffer size
+        events = list(itertools.islice(reversed(self._events), newer))
+        events.reverse()
+        return events
+
+    def subscribe(self, last_id=None, heartbeat=15):
+        """Take a subscriber slot and return a Subscription yielding events
+        after last_id (default: from now on), or None when max_subscribers
+        are listening already. The slot is freed when it is closed."""
+        with self._cond:
+            if self._subscribers >= self.max_subscribers:
+                return None
+            self._subscribers += 1
+            if last_id is None:
+                last_id = self._next_id - 1
+        return Subscription(self, last_id, heartbeat)
+
+    def _listen(self, last_id, heartbeat):
+        """Yield (id, kind, data) for events after last_id, and None after
+        heartbeat seconds without one."""
+        while True:
+            with self._cond:
+                events = self._after(last_id)
+                if events == []:
+                    self._cond.wait(heartbeat)
+                    events = self._after(last_id)
+                if events is None:
+                    last_id = self._next_id - 1
+                    events = [(last_id, "reset", "{}")]
+            if not events:
+                yield None
+                continue
+            for event in events:
+                yield event
+            last_id = events[-1][0]
+
+    def _unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def stats(self):
+        with self._cond:
+            return {"subscribers": self._subscribers, "published": self._published, "buffered": len(self._events)}
+
+class Subscription:
+    """Events for one subscriber (see EventBroadcaster.subscribe). close()
+    frees the slot, also when iteration never started."""
+
+    def __init__(self, broadcaster, last_id, heartbeat):
+        self._broadcaster = broadcaster
+        self._events = broadcaster._listen(last_id, heartbeat)
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._events.close()
+            self._broadcaster._unsubscribe()
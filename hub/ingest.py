@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+
+# Write-behind ingest: request threads enqueue validated alerts and return
+# immediately, a single writer thread drains the queue and commits them in
+# groups so one fsync covers many alerts. When a group fails, each request
+# in it is stored on its own, so one bad request does not cost the others
+# their alerts. Queued alerts are not durable: they are lost when the
+# process dies before the writer commits them.
+
+class IngestQueue:
+    def __init__(self, store, max_size=10000, batch_size=200, flush_ms=50):
+        # store(records) persists a list of records in one transaction
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = max(0, flush_ms) / 1000.0
+        # bounded by queued alerts, not requests, as a request may be a batch
+        self.max_size = max(1, max_size)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stored = 0
+        self._failed = 0
+        self._rejected = 0
+        self._commits = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bayanihub-ingest-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Flush what is queued and stop the writer thread."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, records):
+        """Queue a list of records; returns False when they would take the
+        queue past max_size alerts."""
+        if not records:
+            return True
+        with self._lock:
+            if self._pending + len(records) > self.max_size:
+                self._rejected += len(records)
+                return False
+            self._pending += len(records)
+        self._queue.put(records)
+        return True
+
+    def depth(self):
+        with self._lock:
+            return self._pending
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "queued_requests": self._queue.qsize(),
+                "capacity": self.max_size,
+                "stored": self._stored,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "group_commits": self._commits,
+                "batch_size": self.batch_size,
+                "flush_ms": int(self.flush_seconds * 1000)
+            }
+
+    def _next_group(self):
+        """The submitted record lists of the next group, oldest first."""
+        try:
+            group = [self._queue.get(timeout=0.2)]
+        except queue.Empty:
+            return []
+        size = len(group[0])
+        deadline = time.monotonic() + self.flush_seconds
+        while size < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    group.append(self._queue.get(timeout=remaining))
+                else:
+                    group.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            size += len(group[-1])
+        return group
+
+    def _store(self, records):
+        """Store records in one transaction; False when that failed."""
+        try:
+            self.store(records)
+        except Exception as e:
+            print(f"[HUB] Ingest writer failed to store {len(records)} alerts: {e}")
+            return False
+        with self._lock:
+            self._stored += len(records)
+            self._commits += 1
+        return True
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            group = self._next_group()
+            if not group:
+                continue
+            records = [record for submitted in group for record in submitted]
+            if self._store(records):
+                failed = 0
+            elif len(group) == 1:
+                failed = len(records)
+            else:
+                # the group was rolled back; retry request by request so
+                # only the alerts of the failing ones are lost
+                failed = sum(len(submitted) for submitted in group if not self._store(submitted))
+            with self._lock:
+                self._failed += failed
+                self._pending -= len(records)
@@ -0,0 +1,113 @@
+from datetime import datetime
+import json
+import re
+
+# Validation and anonymization of incoming alert payloads, shared by the
+# hub's ingest endpoints and the bulk importer.
+
+INTEGER_DETAILS = ("attempts", "dst_port", "ports_scanned")
+INT64_RANGE = (-(1 << 63), (1 << 63) - 1)
+INTEGER_PATTERN = re.compile(r"[+-]?[0-9]{1,18}")
+
+def prepare_alert(data):
+    """Validate and anonymize one alert payload.
+
+    Returns (record, None) ready for storage, or (None, error message).
+    """
+    if not isinstance(data, dict) or "suc_id" not in data:
+        return None, "malformed payload: missing suc_id"
+
+    # Basic anonymization
+    raw = data.get("raw_details", {})
+    if not isinstance(raw, dict):
+        raw = {}
+    
+    masked = {}
+    # Example anonymization: mask IPs and usernames
+    if "src_ip" in raw:
+        ip = raw["src_ip"]
+        masked["src_ip_masked"] = mask_ip(ip)
+    if "username" in raw:
+        masked["username_hash"] = hash_username(raw["username"])
+    # counts and ports are stored as integers; anything else is dropped
+    for name in INTEGER_DETAILS:
+        if name in raw:
+            value = to_int(raw[name])
+            if value is not None:
+                masked[name] = value
+
+    # Validate and sanitize inputs
+    suc_id = str(data["suc_id"]).strip()
+    if len(suc_id) > 50:
+        return None, "suc_id too long (max 50 characters)"
+    if not suc_id:
+        return None, "suc_id cannot be empty"
+    
+    event_type = str(data.get("event_type", "")).strip()[:50]
+    timestamp = data.get("timestamp")
+    if not timestamp:
+        timestamp = datetime.utcnow().isoformat() + "Z"
+    
+    anomaly_score = data.get("anomaly_score")
+    if anomaly_score is not None:
+        try:
+            anomaly_score = float(anomaly_score)
+            # Clamp to valid range
+            anomaly_score = max(0.0, min(1.0, anomaly_score))
+        except (ValueError, TypeError):
+            anomaly_score = None
+
+    # Safely serialize masked data
+    try:
+        raw_masked_json = json.dumps(masked)
+    except (TypeError, ValueError):
+        raw_masked_json = "{}"
+
+    record = {
+        "suc_id": suc_id,
+        "timestamp": timestamp,
+        "event_type": event_type,
+        "raw_masked": raw_masked_json,
+        "anomaly_score": anomaly_score
+    }
+    return record, None
+
+def to_int(value):
+    """value as a 64-bit int (from an int, an integral float or a string
+    of digits with an optional sign), or None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.strip(" \t\r\n")
+        if not INTEGER_PATTERN.fullmatch(value):
+            return None
+        value = int(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            return None
+        value = int(value)
+    if not isinstance(value, int) or not INT64_RANGE[0] <= value <= INT64_RANGE[1]:
+        return None
+    return value
+
+def mask_ip(ip):
+    # naive mask: replace last octet
+    try:
+        if not ip or not isinstance(ip, str):
+            return "masked"
+        parts = ip.split(".")
+        if len(parts) == 4:
+            parts[-1] = "xxx"
+            return ".".join(parts)
+    except (AttributeError, ValueError):
+        pass
+    return "masked"
+
+def hash_username(u):
+    # simple deterministic hash for demo (not secure)
+    try:
+        if not u or not isinstance(u, str):
+            return "0"
+        return str(abs(hash(u)) % 1000000)
+    except (TypeError, AttributeError):
+        return "0"
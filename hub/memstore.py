@@ -0,0 +1,565 @@
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from backends import AlertStore
+from correlation import CorrelationWindow, classify_alert, TIME_WINDOW_SECONDS
+from storage import ROLLUP_BUCKETS, DETAIL_FIELDS, insert_changes, parse_epoch, repeat_key, row_to_alert, _check_fields
+
+# In-memory columnar alert store. Every column is a NumPy array grown by
+# doubling; strings with few distinct values (SUC, event type, severity,
+# masked IP, username hash) are dictionary-encoded to int32 codes, so
+# filters and aggregates are vectorized array operations. Nothing is
+# durable except the periodic snapshot, written as an .npz file with
+# strings packed into byte buffers (no pickling).
+
+NUMERIC_COLUMNS = {
+    "id": np.int64,
+    "ts_epoch": np.float64,
+    "anomaly_score": np.float64,
+    "attempts": np.float64,  # NaN when missing
+    "dst_port": np.float64,
+    "ports_scanned": np.float64,
+    "coordinated": np.bool_,
+    "occurrence_count": np.int64,
+    "change_seq": np.int64
+}
+CODED_COLUMNS = ("suc_id", "event_type", "severity", "src_ip_masked", "username_hash")
+OBJECT_COLUMNS = ("timestamp", "raw_masked", "summary", "last_seen")
+INITIAL_CAPACITY = 1024
+
+# how the sqlite backend presents missing values in /metrics and rollups
+NORMALIZED_DEFAULTS = {"suc_id": "unknown", "event_type": "unknown", "severity": "Medium"}
+
+def _float(value):
+    if value is None or isinstance(value, bool):
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+def _pack_strings(values):
+    """Pack a list of str/None into (utf-8 bytes, end offsets, null flags)."""
+    encoded = [(v if isinstance(v, str) else "").encode("utf-8") for v in values]
+    offsets = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    nulls = np.array([v is None for v in values], dtype=np.bool_)
+    return data, offsets, nulls
+
+def _unpack_strings(data, offsets, nulls):
+    raw = data.tobytes()
+    values = []
+    start = 0
+    for end, null in zip(offsets.tolist(), nulls.tolist()):
+        values.append(None if null else raw[start:end].decode("utf-8"))
+        start = end
+    return values
+
+class _Dictionary:
+    """Value <-> int32 code mapping for one dictionary-encoded column."""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+        self._decoded = None
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+            self._decoded = None
+        return code
+
+    def lookup(self, values):
+        """Codes of the given values that have been seen."""
+        if isinstance(values, str):
+            values = [values]
+        return [self.codes[v] for v in values if v in self.codes]
+
+    def decoded(self):
+        if self._decoded is None or len(self._decoded) != len(self.values):
+            self._decoded = np.array(self.values + [None], dtype=object)[:len(self.values)]
+        return self._decoded
+
+class MemoryStore(AlertStore):
+    name = "memory"
+
+    def __init__(self, snapshot_path=None, snapshot_interval=60):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.RLock()
+        self._size = 0
+        self._next_id = 1
+        self._dirty = False
+        # not persisted: start from the clock so versions keep increasing
+        # across restarts
+        self._modified = time.time()
+        self._version = int(self._modified * 1000)
+        self._numeric = {name: np.empty(INITIAL_CAPACITY, dtype=dtype) for name, dtype in NUMERIC_COLUMNS.items()}
+        self._coded = {name: np.empty(INITIAL_CAPACITY, dtype=np.int32) for name in CODED_COLUMNS}
+        self._objects = {name: np.empty(INITIAL_CAPACITY, dtype=object) for name in OBJECT_COLUMNS}
+        self._dicts = {name: _Dictionary() for name in CODED_COLUMNS}
+        self._listeners = []
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._load(snapshot_path)
+            if self._size:
+                self._version = max(self._version, int(self._numeric["change_seq"][:self._size].max()))
+            print(f"[HUB] Restored {self._size} alerts from snapshot {snapshot_path}")
+        self._stopping = threading.Event()
+        self._thread = None
+        if snapshot_path and snapshot_interval and snapshot_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="bayanihub-snapshot", daemon=True)
+            self._thread.start()
+
+    # -- writes --
+
+    def _reserve(self, count):
+        capacity = len(self._numeric["id"])
+        if self._size + count <= capacity:
+            return
+        capacity = max(capacity * 2, self._size + count)
+        for columns in (self._numeric, self._coded, self._objects):
+            for name, old in columns.items():
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:self._size] = old[:self._size]
+                columns[name] = new
+
+    def _append(self, record):
+        i = self._size
+        try:
+            details = json.loads(record.get("raw_masked") or "{}")
+        except (TypeError, ValueError):
+            details = {}
+        if not isinstance(details, dict):
+            details = {}
+        numeric = self._numeric
+        numeric["id"][i] = self._next_id
+        numeric["ts_epoch"][i] = _float(record["ts_epoch"])
+        numeric["anomaly_score"][i] = _float(record.get("anomaly_score"))
+        for name in ("attempts", "dst_port", "ports_scanned"):
+            numeric[name][i] = _float(details.get(name))
+        numeric["coordinated"][i] = "coordinated" in str(record.get("summary") or "").lower()
+        for name in ("suc_id", "event_type", "severity"):
+            self._coded[name][i] = self._dicts[name].encode(record.get(name))
+        for name in ("src_ip_masked", "username_hash"):
+            value = details.get(name)
+            self._coded[name][i] = self._dicts[name].encode(value if isinstance(value, str) else None)
+        for name in OBJECT_COLUMNS:
+            self._objects[name][i] = record.get(name)
+        numeric["occurrence_count"][i] = 1
+        numeric["change_seq"][i] = record["change_seq"]
+        self._objects["last_seen"][i] = record.get("timestamp")
+        self._size += 1
+        self._next_id += 1
+
+    def insert_alerts(self, records, classify=None, coalesce=None):
+        if not records:
+            return []
+        with self._lock:
+            size, next_id = self._size, self._next_id
+            self._reserve(len(records))
+            alert_ids = []
+            folded = []  # (position, occurrence_count, last_seen, change_seq) before folding
+            try:
+                for seq, record in enumerate(records, self._version + 1):
+                    record["ts_epoch"] = parse_epoch(record["timestamp"])
+                    record.setdefault("severity", "Medium")
+                    record.setdefault("summary", "")
+                    record["occurrence_count"] = 1
+                    record["change_seq"] = seq
+                    window = coalesce(record["event_type"]) if coalesce is not None else None
+                    i = self.find_repeat(record, window) if window else None
+                    if i is not None:
+                        count = int(self._numeric["occurrence_count"][i])
+                        last_seen = self._objects["last_seen"][i]
+                        folded.append((i, count, last_seen, int(self._numeric["change_seq"][i])))
+                        self._numeric["occurrence_count"][i] = count + 1
+                        self._numeric["change_seq"][i] = seq
+                        if parse_epoch(last_seen) is None or record["ts_epoch"] >= parse_epoch(last_seen):
+                            self._objects["last_seen"][i] = record["timestamp"]
+                        record["occurrence_count"] = count + 1
+                        record["severity"] = self._dicts["severity"].values[self._coded["severity"][i]]
+                        record["summary"] = self._objects["summary"][i]
+                        alert_ids.append(int(self._numeric["id"][i]))
+                        continue
+                    if classify is not None:
+                        # rows appended earlier in the batch are visible
+                        record["severity"], record["summary"] = classify(self, record)
+                    alert_ids.append(self._next_id)
+                    self._append(record)
+            except Exception:
+                # all or nothing, like the sqlite transaction
+                self._size, self._next_id = size, next_id
+                for i, count, last_seen, seq in reversed(folded):
+                    self._numeric["occurrence_count"][i] = count
+                    self._objects["last_seen"][i] = last_seen
+                    self._numeric["change_seq"][i] = seq
+                raise
+            self._changed(len(records))
+        self._notify(insert_changes(alert_ids, records))
+        return alert_ids
+
+    def find_repeat(self, record, window_seconds):
+        """Position of the most recent alert the record repeats (see
+        storage.find_repeat), or None."""
+        n = self._size
+        epoch = record["ts_epoch"]
+        if epoch is None or n == 0:
+            return None
+        src_ip_masked, dst_port = repeat_key(record)
+        mask = np.ones(n, dtype=np.bool_)
+        for name, value in (("suc_id", record["suc_id"]), ("event_type", record["event_type"]),
+                            ("src_ip_masked", src_ip_masked if isinstance(src_ip_masked, str) else None)):
+            code = self._dicts[name].codes.get(value)
+            if code is None:
+                return None
+            mask &= self._coded[name][:n] == code
+        ts = self._numeric["ts_epoch"][:n]
+        mask &= (ts >= epoch - window_seconds) & (ts <= epoch + window_seconds)
+        ports = self._numeric["dst_port"][:n]
+        port = _float(dst_port)
+        mask &= np.isnan(ports) if math.isnan(port) else ports == port
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return None
+        return int(rows[np.argmax(ts[rows])])
+
+    def _position(self, alert_id):
+        ids = self._numeric["id"][:self._size]
+        i = int(np.searchsorted(ids, alert_id))
+        if i < self._size and ids[i] == alert_id:
+            return i
+        return None
+
+    def update_severity(self, alert_id, severity, summary):
+        with self._lock:
+            i = self._position(alert_id)
+            if i is None:
+                return
+            self._coded["severity"][i] = self._dicts["severity"].encode(severity)
+            self._objects["summary"][i] = summary
+            self._numeric["coordinated"][i] = "coordinated" in str(summary or "").lower()
+            self._numeric["change_seq"][i] = self._version + 1
+            self._changed()
+        self._notify([("update", [{"id": alert_id, "severity": severity, "summary": summary}])])
+
+    def add_change_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, changes):
+        # outside the lock, like the sqlite listeners after commit
+        for kind, items in changes:
+            for listener in list(self._listeners):
+                try:
+                    listener(kind, items)
+                except Exception as e:
+                    print(f"Error in change listener: {e}")
+
+    def _changed(self, count=1):
+        # the version doubles as the change_seq counter, as in sqlite
+        self._dirty = True
+        self._version += count
+        self._modified = time.time()
+
+    def data_version(self):
+        with self._lock:
+            return self._version, self._modified
+
+    # -- correlation --
+
+    def find_other_suc(self, suc_id, event_type, epoch, window_seconds=TIME_WINDOW_SECONDS):
+        """Whether another SUC stored event_type within the window of epoch
+        (used by classify_alert in place of the SQL lookup)."""
+        with self._lock:
+            n = self._size
+            event_code = self._dicts["event_type"].codes.get(event_type)
+            if event_code is None or n == 0:
+                return False
+            ts = self._numeric["ts_epoch"][:n]
+            sucs = self._coded["suc_id"][:n]
+            mask = (self._coded["event_type"][:n] == event_code) & (ts >= epoch - window_seconds) & (ts <= epoch + window_seconds)
+            for code in self._dicts["suc_id"].lookup([suc_id, None]):
+                mask &= sucs != code
+            return bool(mask.any())
+
+    def correlate(self, alert_id, window=None):
+        with self._lock:
+            i = self._position(alert_id)
+            if i is None:
+                return "Unknown", "No record found"
+            record = {
+                "suc_id": self._dicts["suc_id"].values[self._coded["suc_id"][i]],
+                "event_type": self._dicts["event_type"].values[self._coded["event_type"][i]],
+                "timestamp": self._objects["timestamp"][i],
+                "anomaly_score": self._float_value(self._numeric["anomaly_score"][i]),
+                "ts_epoch": self._float_value(self._numeric["ts_epoch"][i])
+            }
+            severity, summary = classify_alert(self, record, window)
+            self.update_severity(alert_id, severity, summary)
+            return severity, summary
+
+    def correlation_window(self, window_seconds=TIME_WINDOW_SECONDS):
+        index = CorrelationWindow(window_seconds)
+        with self._lock:
+            n = self._size
+            ts = self._numeric["ts_epoch"][:n]
+            if n == 0 or np.isnan(ts).all():
+                return index
+            cutoff = float(np.nanmax(ts)) - 2 * window_seconds
+            rows = np.flatnonzero(ts >= cutoff)
+            rows = rows[np.argsort(ts[rows], kind="stable")]
+            sucs = self._dicts["suc_id"].decoded()[self._coded["suc_id"][rows]]
+            events = self._dicts["event_type"].decoded()[self._coded["event_type"][rows]]
+            for suc_id, epoch, event_type in zip(sucs.tolist(), ts[rows].tolist(), events.tolist()):
+                index.add(event_type, suc_id, epoch)
+        index.floor = cutoff
+        return index
+
+    # -- reads --
+
+    @staticmethod
+    def _float_value(value):
+        return None if math.isnan(value) else float(value)
+
+    def _filter_mask(self, n, severity=None, suc_id=None, event_type=None, since=None, until=None,
+                     dst_port=None, src_ip_masked=None, username_hash=None, min_attempts=None):
+        mask = np.ones(n, dtype=np.bool_)
+        for name, values in (("severity", severity), ("suc_id", suc_id), ("event_type", event_type),
+                             ("src_ip_masked", src_ip_masked), ("username_hash", username_hash)):
+            if values:
+                mask &= np.isin(self._coded[name][:n], self._dicts[name].lookup(values))
+        if dst_port:
+            ports = [dst_port] if isinstance(dst_port, int) else dst_port
+            mask &= np.isin(self._numeric["dst_port"][:n], [float(p) for p in ports])
+        # comparisons with NaN are False, like NULL in SQL
+        if min_attempts is not None:
+            mask &= self._numeric["attempts"][:n] >= min_attempts
+        if since is not None:
+            mask &= self._numeric["ts_epoch"][:n] >= since
+        if until is not None:
+            mask &= self._numeric["ts_epoch"][:n] <= until
+        return mask
+
+    def _select(self, limit=None, before_id=None, after_id=None, **filters):
+        """Row positions matching a get_alerts query, in result order."""
+        n = self._size
+        mask = self._filter_mask(n, **filters)
+        ids = self._numeric["id"][:n]
+        if before_id is not None:
+            mask[np.searchsorted(ids, before_id):] = False
+        if after_id is not None:
+            mask[:np.searchsorted(ids, after_id, side="right")] = False
+        rows = np.flatnonzero(mask)
+        if after_id is None or before_id is not None:
+            rows = rows[::-1]
+        if limit is not None:
+            rows = rows[:limit]
+        return rows
+
+    def _rows(self, rows, fields):
+        columns = []
+        for field in fields:
+            if field in self._coded:
+                columns.append(self._dicts[field].decoded()[self._coded[field][rows]].tolist())
+            elif field in self._objects:
+                columns.append(self._objects[field][rows].tolist())
+            elif field in ("id", "occurrence_count", "change_seq"):
+                columns.append(self._numeric[field][rows].tolist())
+            else:
+                values = self._numeric[field][rows]
+                convert = int if field in DETAIL_FIELDS else float
+                columns.append([None if math.isnan(v) else convert(v) for v in values.tolist()])
+        return list(zip(*columns))
+
+    def get_alerts(self, fields=None, **query):
+        fields = _check_fields(fields)
+        with self._lock:
+            return [row_to_alert(row, fields) for row in self._rows(self._select(**query), fields)]
+
+    def iter_alert_batches(self, batch_size=1000, fields=None, **query):
+        fields = _check_fields(fields)
+        with self._lock:
+            rows = self._select(**query)
+        for start in range(0, len(rows), batch_size):
+            with self._lock:
+                batch = self._rows(rows[start:start + batch_size], fields)
+            if batch:
+                yield batch
+
+    def search_alerts(self, q, fields=None, limit=50, offset=0, sort="rank", **filters):
+        """Case-insensitive substring search over the FTS columns; the score
+        counts matching (term, column) pairs."""
+        terms = [term.lower() for term in (q or "").split()]
+        if not terms:
+            return []
+        fields = _check_fields(fields)
+        with self._lock:
+            n = self._size
+            mask = self._filter_mask(n, **filters)
+            score = np.zeros(n, dtype=np.int64)
+            summaries = [str(s or "").lower() for s in self._objects["summary"][:n].tolist()]
+            for term in terms:
+                hits = np.zeros(n, dtype=np.int64)
+                for name in ("suc_id", "event_type", "severity"):
+                    matches = np.array([term in str(v or "").lower() for v in self._dicts[name].values] + [False])
+                    hits += matches[self._coded[name][:n]]
+                hits += np.fromiter((term in s for s in summaries), dtype=np.bool_, count=n)
+                mask &= hits > 0
+                score += hits
+            rows = np.flatnonzero(mask)[::-1]
+            if sort != "recent":
+                rows = rows[np.argsort(-score[rows], kind="stable")]
+            rows = rows[offset:offset + limit]
+            results = []
+            for row, position in zip(self._rows(rows, fields), rows.tolist()):
+                alert = row_to_alert(row, fields)
+                alert["score"] = float(score[position])
+                results.append(alert)
+            return results
+
+    def get_changes(self, since_seq=0, limit=500, fields=None, **filters):
+        fields = _check_fields(fields)
+        if "change_seq" not in fields:
+            fields = fields + ("change_seq",)
+        with self._lock:
+            n = self._size
+            seqs = self._numeric["change_seq"][:n]
+            rows = np.flatnonzero(self._filter_mask(n, **filters) & (seqs > since_seq))
+            rows = rows[np.argsort(seqs[rows], kind="stable")][:limit]
+            changes = [row_to_alert(row, fields) for row in self._rows(rows, fields)]
+            if len(changes) == limit:
+                return changes, changes[-1]["change_seq"]
+            return changes, max(since_seq, self._version)
+
+    def _normalized(self, name):
+        """Per-code values the way /metrics and the rollups present them."""
+        default = NORMALIZED_DEFAULTS[name]
+        return [value or default for value in self._dicts[name].values]
+
+    def get_metrics(self):
+        with self._lock:
+            n = self._size
+            counts = {}
+            for name in ("severity", "suc_id", "event_type"):
+                totals = {}
+                bincount = np.bincount(self._coded[name][:n], minlength=len(self._dicts[name].values))
+                for value, count in zip(self._normalized(name), bincount.tolist()):
+                    if count:
+                        totals[value] = totals.get(value, 0) + count
+                counts[name] = totals
+            coordinated = int(self._numeric["coordinated"][:n].sum())
+            occurrences = int(self._numeric["occurrence_count"][:n].sum())
+        severities = counts["severity"]
+        return {
+            "total_alerts": n,
+            "total_occurrences": occurrences,
+            "by_severity": {
+                "high": severities.get("High", 0),
+                "medium": severities.get("Medium", 0),
+                "low": severities.get("Low", 0)
+            },
+            "by_suc": counts["suc_id"],
+            "by_event_type": counts["event_type"],
+            "coordinated_attacks": coordinated
+        }
+
+    def get_timeseries(self, bucket="1m", since=None, until=None, suc_id=None, event_type=None, severity=None):
+        if bucket not in ROLLUP_BUCKETS:
+            raise ValueError(f"unknown bucket: {bucket}")
+        seconds = ROLLUP_BUCKETS[bucket]
+        with self._lock:
+            n = self._size
+            ts = self._numeric["ts_epoch"][:n]
+            mask = ~np.isnan(ts)
+            for name, values in (("suc_id", suc_id), ("event_type", event_type), ("severity", severity)):
+                if values:
+                    wanted = {values} if isinstance(values, str) else set(values)
+                    codes = [code for code, value in enumerate(self._normalized(name)) if value in wanted]
+                    mask &= np.isin(self._coded[name][:n], codes)
+            rows = np.flatnonzero(mask)
+            buckets = (np.floor(ts[rows] / seconds) * seconds).astype(np.int64)
+            keep = np.ones(len(rows), dtype=np.bool_)
+            if since is not None:
+                keep &= buckets >= int(since // seconds) * seconds
+            if until is not None:
+                keep &= buckets <= until
+            buckets = buckets[keep]
+            severities = np.array(self._normalized("severity") + [""], dtype=object)[self._coded["severity"][rows[keep]]]
+        counts = {}
+        for key in zip(buckets.tolist(), severities.tolist()):
+            counts[key] = counts.get(key, 0) + 1
+        return [{"bucket": b, "severity": sev, "count": count} for (b, sev), count in sorted(counts.items())]
+
+    # -- snapshots --
+
+    def snapshot(self, path=None):
+        """Write the store to path (default snapshot_path) atomically."""
+        path = path or self.snapshot_path
+        with self._lock:
+            n = self._size
+            arrays = {f"num_{name}": column[:n].copy() for name, column in self._numeric.items()}
+            arrays.update({f"code_{name}": column[:n].copy() for name, column in self._coded.items()})
+            objects = {name: column[:n].tolist() for name, column in self._objects.items()}
+            dictionaries = {name: list(d.values) for name, d in self._dicts.items()}
+            arrays["next_id"] = np.array([self._next_id], dtype=np.int64)
+            self._dirty = False
+        for prefix, columns in (("obj", objects), ("dict", dictionaries)):
+            for name, values in columns.items():
+                data, offsets, nulls = _pack_strings(values)
+                arrays[f"{prefix}_{name}_data"] = data
+                arrays[f"{prefix}_{name}_offsets"] = offsets
+                arrays[f"{prefix}_{name}_nulls"] = nulls
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except Exception:
+            self._dirty = True
+            raise
+        return n
+
+    def _load(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            def strings(prefix, name):
+                return _unpack_strings(data[f"{prefix}_{name}_data"], data[f"{prefix}_{name}_offsets"],
+                                       data[f"{prefix}_{name}_nulls"])
+            n = len(data["num_id"])
+            self._reserve(n)
+            for name in NUMERIC_COLUMNS:
+                if f"num_{name}" in data:
+                    self._numeric[name][:n] = data[f"num_{name}"]
+            for name in CODED_COLUMNS:
+                self._coded[name][:n] = data[f"code_{name}"]
+                self._dicts[name] = _Dictionary(strings("dict", name))
+            for name in OBJECT_COLUMNS:
+                if f"obj_{name}_data" in data:
+                    self._objects[name][:n] = strings("obj", name)
+            if "num_occurrence_count" not in data:
+                # snapshot from before coalescing
+                self._numeric["occurrence_count"][:n] = 1
+                self._objects["last_seen"][:n] = self._objects["timestamp"][:n]
+            if "num_change_seq" not in data:
+                self._numeric["change_seq"][:n] = self._numeric["id"][:n]
+            self._next_id = int(data["next_id"][0])
+            self._size = n
+
+    def _run(self):
+        while not self._stopping.wait(self.snapshot_interval):
+            if self._dirty:
+                try:
+                    self.snapshot()
+                except Exception as e:
+                    print(f"[HUB] Error writing snapshot: {e}")
+
+    def close(self):
+        self._stopping.set()
+        if self.snapshot_path and self._dirty:
+            self.snapshot()
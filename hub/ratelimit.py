@@ -0,0 +1,91 @@
+import math
+import threading
+import time
+
+# Admission control for ingest. Every SUC gets a token bucket that refills
+# at rate alerts per second up to burst, so one flooding SUC is turned away
+# with 429 while the others keep their share. Each alert takes a token:
+# of a batch, only as many alerts as the bucket holds whole tokens are
+# admitted, so no request gets past burst. A separate cap bounds how many
+# ingest requests run at once.
+
+OVERFLOW_KEY = "*"
+
+class SucRateLimiter:
+    def __init__(self, rate=0, burst=0, max_sucs=10000):
+        # rate <= 0 admits everything but still counts per SUC
+        self.rate = float(rate)
+        self.burst = max(float(burst) if burst > 0 else self.rate, 1.0)
+        self.max_sucs = max_sucs
+        self._buckets = {}  # suc_id -> [tokens, updated, admitted, rejected]
+        self._lock = threading.Lock()
+
+    def _bucket(self, suc_id, now):
+        bucket = self._buckets.get(suc_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_sucs:
+                # suc_id comes from the payload, so an unbounded number of
+                # them must not grow the table; latecomers share one bucket
+                suc_id = OVERFLOW_KEY
+                bucket = self._buckets.get(suc_id)
+            if bucket is None:
+                bucket = self._buckets[suc_id] = [self.burst, now, 0, 0]
+        return bucket
+
+    def acquire(self, suc_id, count=1):
+        """Take up to count tokens from suc_id's bucket. Returns (admitted,
+        wait): the number of alerts admitted, and when some were not, the
+        seconds until the bucket holds tokens for the rest (at most burst)."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(suc_id, now)
+            if self.rate <= 0:
+                bucket[2] += count
+                return count, 0
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            admitted = min(count, int(bucket[0]))
+            bucket[0] -= admitted
+            bucket[2] += admitted
+            bucket[3] += count - admitted
+            if admitted == count:
+                return count, 0
+            return admitted, (min(count - admitted, self.burst) - bucket[0]) / self.rate
+
+    def stats(self):
+        with self._lock:
+            sucs = {suc_id: {"admitted": b[2], "rejected": b[3]} for suc_id, b in self._buckets.items()}
+        return {"rate": self.rate, "burst": self.burst if self.rate > 0 else None, "sucs": sucs}
+
+class ConcurrencyCap:
+    """At most limit requests at a time; limit <= 0 means no cap."""
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self._lock = threading.Lock()
+        self._active = 0
+        self.rejected = 0
+
+    def try_enter(self):
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self._active += 1
+        return True
+
+    def leave(self):
+        with self._lock:
+            self._active -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {"limit": self.limit or None, "active": self._active, "rejected": self.rejected}
+
+def retry_after_header(seconds):
+    """Retry-After value: whole seconds, rounded up, at least 1."""
+    return str(max(1, math.ceil(seconds)))
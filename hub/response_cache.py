@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+# Small in-process cache of rendered GET responses, keyed by the store's
+# data version and the request, so repeated polls of unchanged data skip
+# the query and the JSON encoding. Entries for older versions can never
+# be hit again and are dropped as soon as a newer version is cached.
+
+class ResponseCache:
+    def __init__(self, max_entries=32, max_bytes=1 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key):
+        """A fresh copy of the cached response, or None."""
+        with self._lock:
+            entry = self._entries.get((version, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+        body, mimetype, headers = entry
+        return Response(body, mimetype=mimetype, headers=headers)
+
+    def put(self, version, key, response):
+        """Cache a complete 200 response of at most max_bytes; streamed
+        responses are left alone."""
+        if self.max_entries <= 0 or response.status_code != 200 or response.is_streamed:
+            return
+        body = response.get_data()
+        if len(body) > self.max_bytes:
+            return
+        headers = [(name, value) for name, value in response.headers
+                   if name.lower() not in ("content-type", "content-length")]
+        with self._lock:
+            if self._version is not None and version < self._version:
+                return
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._entries[(version, key)] = (body, response.mimetype, headers)
+            self._entries.move_to_end((version, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
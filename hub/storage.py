@@ -1,91 +1,1192 @@
 import sqlite3
 import json
+import os
+import urllib.parse
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Time-bucket rollups: bucket name -> (seconds, table)
+ROLLUP_BUCKETS = {"1m": 60, "1h": 3600}
+ROLLUP_TABLES = {"1m": "alert_rollup_1m", "1h": "alert_rollup_1h"}
+
+# Connection settings, overridable via environment like BAYANI_DB
+JOURNAL_MODE = os.environ.get("BAYANI_DB_JOURNAL_MODE", "WAL").upper()
+SYNCHRONOUS = os.environ.get("BAYANI_DB_SYNCHRONOUS", "NORMAL").upper()
+CACHE_SIZE_KB = int(os.environ.get("BAYANI_DB_CACHE_KB", 65536))
+MMAP_SIZE = int(os.environ.get("BAYANI_DB_MMAP_SIZE", 268435456))
+BUSY_TIMEOUT_SECONDS = float(os.environ.get("BAYANI_DB_BUSY_TIMEOUT", 5.0))
+POOL_SIZE = int(os.environ.get("BAYANI_DB_POOL_SIZE", 8))
+READ_POOL_SIZE = int(os.environ.get("BAYANI_DB_READ_POOL_SIZE", 8))
+READ_TIMEOUT_SECONDS = float(os.environ.get("BAYANI_DB_READ_TIMEOUT", 10.0))
+STATEMENT_CACHE_SIZE = int(os.environ.get("BAYANI_DB_STATEMENT_CACHE", 256))
+
+if JOURNAL_MODE not in ("WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "OFF"):
+    raise ValueError(f"Invalid BAYANI_DB_JOURNAL_MODE: {JOURNAL_MODE}")
+if SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"Invalid BAYANI_DB_SYNCHRONOUS: {SYNCHRONOUS}")
+
+_pools = {}
+_read_pools = {}
+_pools_lock = threading.Lock()
+
+class QueryTimeout(Exception):
+    """A read ran past its time limit or found no free read connection."""
+
+def _open_connection(db_path):
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE};")
+    conn.execute(f"PRAGMA synchronous={SYNCHRONOUS};")
+    # negative cache_size is in KiB rather than pages
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB:d};")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE:d};")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    return conn
+
+@contextmanager
+def connection(db_path):
+    """Borrow a pooled connection for one transaction.
+
+    Connections are opened once with the tuned pragmas above and reused
+    across requests; the block commits on success and rolls back on error.
+    Up to POOL_SIZE idle connections are kept per database.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = queue.LifoQueue(maxsize=max(1, POOL_SIZE))
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection(db_path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+class _ReadConnection(sqlite3.Connection):
+    # monotonic time after which the running statement is interrupted
+    deadline = None
+
+    def _past_deadline(self):
+        return 1 if self.deadline is not None and time.monotonic() > self.deadline else 0
+
+def _open_read_connection(db_path):
+    uri = "file:" + urllib.parse.quote(os.path.abspath(db_path)) + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE, factory=_ReadConnection)
+    conn.execute("PRAGMA query_only=ON;")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB:d};")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE:d};")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.set_progress_handler(conn._past_deadline, 1000)
+    return conn
+
+@contextmanager
+def read_connection(db_path, timeout=READ_TIMEOUT_SECONDS):
+    """Borrow a read-only (mode=ro) connection from a pool separate from
+    the one writes use, so dashboard queries never take connections or
+    locks away from ingest.
+
+    At most READ_POOL_SIZE reads run at once per database; a caller that
+    finds none free within BUSY_TIMEOUT_SECONDS, or a statement that runs
+    longer than timeout seconds, gets QueryTimeout. Long readers can push
+    conn.deadline forward between steps.
+    """
+    with _pools_lock:
+        pool = _read_pools.get(db_path)
+        if pool is None:
+            pool = _read_pools[db_path] = (threading.BoundedSemaphore(max(1, READ_POOL_SIZE)), queue.LifoQueue())
+    slots, idle = pool
+    if not slots.acquire(timeout=BUSY_TIMEOUT_SECONDS):
+        raise QueryTimeout("no read connection available")
+    try:
+        try:
+            conn = idle.get_nowait()
+        except queue.Empty:
+            conn = _open_read_connection(db_path)
+        conn.deadline = time.monotonic() + timeout if timeout else None
+        try:
+            yield conn
+        except sqlite3.OperationalError as e:
+            if str(e) == "interrupted":
+                raise QueryTimeout(f"query ran longer than {timeout:g}s") from e
+            raise
+        finally:
+            conn.deadline = None
+            idle.put_nowait(conn)
+    finally:
+        slots.release()
+
+def close_connections(db_path=None):
+    """Close idle pooled connections (all databases when db_path is None)."""
+    with _pools_lock:
+        paths = [db_path] if db_path is not None else list(set(_pools) | set(_read_pools))
+        pools = [_pools.pop(p) for p in paths if p in _pools]
+        pools += [_read_pools.pop(p)[1] for p in paths if p in _read_pools]
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+def parse_epoch(timestamp):
+    """Parse an ISO timestamp to epoch seconds (naive means UTC), or None."""
+    try:
+        ts = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except (ValueError, AttributeError, TypeError):
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+# Masked detail fields are virtual columns generated from raw_masked, so
+# they can be indexed and filtered in SQL without decoding the JSON blob.
+DETAIL_COLUMNS = (
+    ("src_ip_masked", "TEXT"),
+    ("username_hash", "TEXT"),
+    ("attempts", "INTEGER"),
+    ("dst_port", "INTEGER"),
+    ("ports_scanned", "INTEGER")
+)
+DETAIL_FIELDS = tuple(name for name, _ in DETAIL_COLUMNS)
+
+def _integer_detail_sql(name):
+    """An integer JSON value, an integral real or a string of digits with
+    an optional sign as an integer, else NULL: the rule masking.to_int
+    applies at ingest, for rows stored before it did."""
+    value = f"json_extract(raw_masked, '$.{name}')"
+    text = f"trim({value}, ' ' || char(9, 10, 13))"
+    digits = f"ltrim({text}, '+-')"
+    return (f"CASE json_type(raw_masked, '$.{name}') WHEN 'integer' THEN {value} "
+            f"WHEN 'real' THEN CASE WHEN {value} = CAST({value} AS INTEGER) THEN CAST({value} AS INTEGER) END "
+            f"WHEN 'text' THEN CASE WHEN {digits} GLOB '[0-9]*' AND {digits} NOT GLOB '*[^0-9]*' "
+            f"AND length({text}) - length({digits}) <= 1 AND length({digits}) <= 18 "
+            f"THEN CAST({text} AS INTEGER) END END")
+
+def _detail_expression(name):
+    if dict(DETAIL_COLUMNS)[name] == "INTEGER":
+        return f"CASE WHEN json_valid(raw_masked) THEN {_integer_detail_sql(name)} END"
+    return f"CASE WHEN json_valid(raw_masked) THEN json_extract(raw_masked, '$.{name}') END"
+
+FTS_COLUMNS = ("suc_id", "event_type", "severity", "summary")
+
+# Schema v2 keeps alerts compact in alert_rows: SUC, event type and severity
+# are integer codes into small lookup tables, and the usual summaries are a
+# template number (tag) instead of text. The alerts view decodes rows back to
+# the v1 columns, so reads are unchanged; writes go to alert_rows.
+LOOKUP_TABLES = {"suc_id": "sucs", "event_type": "event_types", "severity": "severities"}
+CODE_COLUMNS = {"suc_id": "suc_code", "event_type": "event_code", "severity": "severity_code"}
+SEVERITY_CODES = {"Low": 1, "Medium": 2, "High": 3}
+TAG_DETECTED = 1
+TAG_COORDINATED = 2
+SUMMARY_TEMPLATES = {
+    TAG_DETECTED: "{event_type} detected by {suc_id}",
+    TAG_COORDINATED: "Coordinated {event_type} detected across schools"
+}
+
+def _summary_sql(template, suc_column, event_column):
+    """SQL expression for a summary template over the given name columns."""
+    return "'" + template.replace("{event_type}", f"' || {event_column} || '").replace(
+        "{suc_id}", f"' || {suc_column} || '") + "'"
+
+def _tag_case_sql(suc_column, event_column, summary_column):
+    return "CASE " + " ".join(
+        f"WHEN {summary_column} = {_summary_sql(template, suc_column, event_column)} THEN {tag}"
+        for tag, template in SUMMARY_TEMPLATES.items()) + " END"
+
+def _alerts_view_sql(*columns):
+    """CREATE VIEW for the alerts view; columns are extra "expression AS
+    name" items over alert_rows r, added by later schema versions."""
+    summary = " ".join(f"WHEN {tag} THEN {_summary_sql(template, 's.name', 'e.name')}"
+                       for tag, template in SUMMARY_TEMPLATES.items())
+    details = ", ".join(f"r.{name} AS {name}" for name, _ in DETAIL_COLUMNS)
+    return f"""
+    CREATE VIEW alerts AS
+    SELECT r.id AS id, s.name AS suc_id, r.timestamp AS timestamp, e.name AS event_type,
+           r.raw_masked AS raw_masked, r.anomaly_score AS anomaly_score, v.name AS severity,
+           CASE r.tag {summary} ELSE r.summary END AS summary,
+           r.ts_epoch AS ts_epoch, {details},
+           r.suc AS suc_code, r.event AS event_code, r.severity AS severity_code{''.join(', ' + c for c in columns)}
+    FROM alert_rows r
+    LEFT JOIN sucs s ON s.id = r.suc
+    LEFT JOIN event_types e ON e.id = r.event
+    LEFT JOIN severities v ON v.id = r.severity
+    """
+
+# v3: repeats of an alert folded into it at ingest (see insert_rows)
+OCCURRENCE_VIEW_COLUMNS = ("r.occurrence_count AS occurrence_count",
+                           "COALESCE(r.last_seen, r.timestamp) AS last_seen")
 
 def init_db(db_path="bayanihub.db"):
+    """Create the database or upgrade it to SCHEMA_VERSION.
+
+    The schema version is kept in PRAGMA user_version; each migration in
+    MIGRATIONS runs once, in order, and records its version when done.
+    Migrations that rewrite rows commit in batches and pick up where they
+    stopped if the hub is interrupted.
+    """
     try:
-        with sqlite3.connect(db_path) as conn:
-            c = conn.cursor()
-            c.execute("""
-            CREATE TABLE IF NOT EXISTS alerts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                suc_id TEXT,
-                timestamp TEXT,
-                event_type TEXT,
-                raw_masked TEXT,
-                anomaly_score REAL,
-                severity TEXT,
-                summary TEXT
-            );
-            """)
-            # Create indexes for better query performance
-            c.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON alerts(timestamp);")
-            c.execute("CREATE INDEX IF NOT EXISTS idx_event_type ON alerts(event_type);")
-            c.execute("CREATE INDEX IF NOT EXISTS idx_suc_id ON alerts(suc_id);")
-            conn.commit()
+        with connection(db_path) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for target, migrate in MIGRATIONS:
+                if version < target:
+                    migrate(conn)
+                    conn.execute(f"PRAGMA user_version={target:d}")
+                    conn.commit()
+                    version = target
     except Exception as e:
         print(f"Error initializing database: {e}")
         raise
 
+def _migrate_v1(conn):
+    """v1: one wide alerts table with text columns, plus the counters,
+    rollups, search index and indexes. Idempotent, so it also brings
+    databases created before schema versioning up to date."""
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        suc_id TEXT,
+        timestamp TEXT,
+        event_type TEXT,
+        raw_masked TEXT,
+        anomaly_score REAL,
+        severity TEXT,
+        summary TEXT,
+        ts_epoch REAL
+    );
+    """)
+    columns = [row[1] for row in c.execute("PRAGMA table_xinfo(alerts)")]
+    if "ts_epoch" not in columns:
+        c.execute("ALTER TABLE alerts ADD COLUMN ts_epoch REAL;")
+    for name, column_type in DETAIL_COLUMNS:
+        if name not in columns:
+            c.execute(f"ALTER TABLE alerts ADD COLUMN {name} {column_type} "
+                      f"GENERATED ALWAYS AS ({_detail_expression(name)}) VIRTUAL;")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS alert_counters (
+        dimension TEXT NOT NULL,
+        key TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, key)
+    ) WITHOUT ROWID;
+    """)
+    existing = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    for table in ROLLUP_TABLES.values():
+        c.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            bucket INTEGER NOT NULL,
+            suc_id TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, suc_id, event_type, severity)
+        ) WITHOUT ROWID;
+        """)
+    conn.commit()
+    backfill_ts_epoch(conn)
+    if c.execute("SELECT 1 FROM alert_counters WHERE dimension='total'").fetchone() is None:
+        # first start with counters: count what is already stored
+        rebuild_counters(conn)
+    if any(table not in existing for table in ROLLUP_TABLES.values()):
+        rebuild_rollups(conn)
+    # Full-text index over the alert metadata; it reads its content
+    # from the alerts table and is kept in step by the write helpers
+    c.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS alerts_fts USING fts5(
+        {', '.join(FTS_COLUMNS)},
+        content='alerts', content_rowid='id', prefix='2 3'
+    );
+    """)
+    if "alerts_fts" not in existing:
+        rebuild_search_index(conn)
+        conn.commit()
+    # Create indexes for better query performance
+    c.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON alerts(timestamp);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_suc_id ON alerts(suc_id);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_severity ON alerts(severity);")
+    # (event_type, ts_epoch) serves correlation range lookups and
+    # makes the old single-column event_type index redundant
+    c.execute("CREATE INDEX IF NOT EXISTS idx_event_type_ts ON alerts(event_type, ts_epoch);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ts_epoch ON alerts(ts_epoch);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dst_port_ts ON alerts(dst_port, ts_epoch);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_src_ip_masked_ts ON alerts(src_ip_masked, ts_epoch);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_username_hash_ts ON alerts(username_hash, ts_epoch);")
+    c.execute("DROP INDEX IF EXISTS idx_event_type;")
+    conn.commit()
+
+def _migrate_v2(conn, batch_size=BACKFILL_BATCH_SIZE):
+    """v2: move the alerts table into the compact alert_rows table behind
+    an alerts view. Rows are copied in id order, one transaction per
+    batch; an interrupted copy resumes after the last copied id."""
+    c = conn.cursor()
+    for table in LOOKUP_TABLES.values():
+        c.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);")
+    c.executemany("INSERT OR IGNORE INTO severities (id, name) VALUES (?, ?)",
+                  [(code, name) for name, code in SEVERITY_CODES.items()])
+    details = ",\n".join(f"        {name} {column_type} GENERATED ALWAYS AS ({_detail_expression(name)}) VIRTUAL"
+                          for name, column_type in DETAIL_COLUMNS)
+    c.execute(f"""
+    CREATE TABLE IF NOT EXISTS alert_rows (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        suc INTEGER REFERENCES sucs(id),
+        event INTEGER REFERENCES event_types(id),
+        severity INTEGER REFERENCES severities(id),
+        tag INTEGER,
+        summary TEXT,
+        ts_epoch REAL,
+        timestamp TEXT,
+        anomaly_score REAL,
+        raw_masked TEXT,
+{details}
+    );
+    """)
+    conn.commit()
+    if c.execute("SELECT type FROM sqlite_master WHERE name='alerts'").fetchone()[0] == "view":
+        return  # swapped already; stopped before the version was recorded
+
+    total = c.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+    copied = c.execute("SELECT COUNT(*) FROM alert_rows").fetchone()[0]
+    batch = "SELECT * FROM alerts WHERE id > ? ORDER BY id LIMIT ?"
+    while True:
+        last_id = c.execute("SELECT COALESCE(MAX(id), 0) FROM alert_rows").fetchone()[0]
+        for column, table in LOOKUP_TABLES.items():
+            c.execute(f"""
+                INSERT OR IGNORE INTO {table} (name)
+                SELECT DISTINCT {column} FROM ({batch}) WHERE {column} IS NOT NULL
+            """, (last_id, batch_size))
+        c.execute(f"""
+            INSERT INTO alert_rows (id, suc, event, severity, tag, summary, ts_epoch, timestamp, anomaly_score, raw_masked)
+            SELECT a.id, s.id, e.id, v.id, {_tag_case_sql('a.suc_id', 'a.event_type', 'a.summary')},
+                   CASE WHEN {_tag_case_sql('a.suc_id', 'a.event_type', 'a.summary')} IS NULL THEN a.summary END,
+                   a.ts_epoch, a.timestamp, a.anomaly_score, a.raw_masked
+            FROM ({batch}) a
+            LEFT JOIN sucs s ON s.name = a.suc_id
+            LEFT JOIN event_types e ON e.name = a.event_type
+            LEFT JOIN severities v ON v.name = a.severity
+        """, (last_id, batch_size))
+        if c.rowcount <= 0:
+            break
+        conn.commit()
+        copied += c.rowcount
+        print(f"[HUB] Schema v2: copied {copied}/{total} alerts")
+
+    # swap the table for the view in one transaction
+    conn.commit()
+    c.execute("BEGIN")
+    row = c.execute("SELECT seq FROM sqlite_sequence WHERE name='alerts'").fetchone()
+    if row is not None:
+        # keep AUTOINCREMENT from reusing ids of deleted alerts
+        c.execute("DELETE FROM sqlite_sequence WHERE name='alert_rows'")
+        c.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('alert_rows', MAX(?, (SELECT COALESCE(MAX(id), 0) FROM alert_rows)))",
+                  (row[0],))
+    c.execute("DROP TABLE alerts;")
+    c.execute(_alerts_view_sql())
+    c.execute("CREATE INDEX IF NOT EXISTS idx_suc_id ON alert_rows(suc);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_severity ON alert_rows(severity);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_event_type_ts ON alert_rows(event, ts_epoch);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ts_epoch ON alert_rows(ts_epoch);")
+    for name, _ in DETAIL_COLUMNS:
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_ts ON alert_rows({name}, ts_epoch);")
+    conn.commit()
+
+def _migrate_v3(conn):
+    """v3: occurrence_count and last_seen for coalesced repeats. Adding
+    columns with constant defaults does not rewrite rows."""
+    c = conn.cursor()
+    columns = {row[1] for row in c.execute("PRAGMA table_xinfo(alert_rows)")}
+    if "occurrence_count" not in columns:
+        c.execute("ALTER TABLE alert_rows ADD COLUMN occurrence_count INTEGER NOT NULL DEFAULT 1;")
+    if "last_seen" not in columns:
+        c.execute("ALTER TABLE alert_rows ADD COLUMN last_seen TEXT;")
+    c.execute("DROP VIEW IF EXISTS alerts;")
+    c.execute(_alerts_view_sql(*OCCURRENCE_VIEW_COLUMNS))
+    conn.commit()
+
+def _migrate_v4(conn):
+    """v4: the data version, one row bumped by every write (see
+    bump_data_version)."""
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL,
+        modified REAL NOT NULL
+    );
+    """)
+    c.execute("INSERT OR IGNORE INTO data_version (id, version, modified) VALUES (1, 0, ?)", (time.time(),))
+    conn.commit()
+
+def _migrate_v5(conn, batch_size=BACKFILL_BATCH_SIZE):
+    """v5: change_seq, the data version at an alert's latest insert,
+    repeat or re-tag (see get_changes). Existing alerts get their id,
+    in id batches, and the data version moves past them."""
+    c = conn.cursor()
+    columns = {row[1] for row in c.execute("PRAGMA table_xinfo(alert_rows)")}
+    if "change_seq" not in columns:
+        c.execute("ALTER TABLE alert_rows ADD COLUMN change_seq INTEGER;")
+        conn.commit()
+    max_id = c.execute("SELECT COALESCE(MAX(id), 0) FROM alert_rows").fetchone()[0]
+    for start in range(0, max_id, batch_size):
+        c.execute("UPDATE alert_rows SET change_seq = id WHERE id > ? AND id <= ? AND change_seq IS NULL",
+                  (start, start + batch_size))
+        conn.commit()
+        if c.rowcount > 0:
+            print(f"[HUB] Schema v5: change_seq set up to alert {min(start + batch_size, max_id)}/{max_id}")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_change_seq ON alert_rows(change_seq);")
+    c.execute("UPDATE data_version SET version = MAX(version, ?)", (max_id,))
+    c.execute("DROP VIEW IF EXISTS alerts;")
+    c.execute(_alerts_view_sql(*OCCURRENCE_VIEW_COLUMNS, "r.change_seq AS change_seq"))
+    conn.commit()
+
+def _migrate_v6(conn):
+    """v6: INTEGER detail columns are NULL for non-numeric JSON values
+    stored before ingest coerced them (see _integer_detail_sql). Virtual columns cost no rewrite;
+    the view and the column's index are rebuilt around them."""
+    c = conn.cursor()
+    # one transaction, so an interrupted upgrade never leaves the view dropped
+    c.execute("BEGIN IMMEDIATE")
+    view_sql = c.execute("SELECT sql FROM sqlite_master WHERE type='view' AND name='alerts'").fetchone()[0]
+    c.execute("DROP VIEW alerts;")
+    for name, column_type in DETAIL_COLUMNS:
+        if column_type != "INTEGER":
+            continue
+        c.execute(f"DROP INDEX IF EXISTS idx_{name}_ts;")
+        c.execute(f"ALTER TABLE alert_rows DROP COLUMN {name};")
+        c.execute(f"ALTER TABLE alert_rows ADD COLUMN {name} {column_type} "
+                  f"GENERATED ALWAYS AS ({_detail_expression(name)}) VIRTUAL;")
+        c.execute(f"CREATE INDEX idx_{name}_ts ON alert_rows({name}, ts_epoch);")
+    c.execute(view_sql)
+    conn.commit()
+
+MIGRATIONS = [(1, _migrate_v1), (2, _migrate_v2), (3, _migrate_v3), (4, _migrate_v4), (5, _migrate_v5),
+              (6, _migrate_v6)]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def backfill_ts_epoch(conn, batch_size=BACKFILL_BATCH_SIZE):
+    """Fill ts_epoch for rows stored before the column existed.
+
+    Works in id order, one transaction per batch, so a large table is
+    migrated without holding the write lock for the whole pass.
+    """
+    c = conn.cursor()
+    last_id = 0
+    while True:
+        c.execute("SELECT id, timestamp FROM alerts WHERE id > ? AND ts_epoch IS NULL ORDER BY id LIMIT ?",
+                  (last_id, batch_size))
+        rows = c.fetchall()
+        if not rows:
+            break
+        updates = [(parse_epoch(ts), id_) for id_, ts in rows]
+        c.executemany("UPDATE alerts SET ts_epoch=? WHERE id=?", [u for u in updates if u[0] is not None])
+        conn.commit()
+        last_id = rows[-1][0]
+
+INSERT_ALERT_SQL = """
+    INSERT INTO alert_rows (suc, event, severity, tag, summary, ts_epoch, timestamp, anomaly_score, raw_masked,
+                            change_seq)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _lookup_code(c, column, name, codes):
+    """Code of name in the lookup table for column, added if new. codes
+    caches lookups for the current transaction only, since codes added
+    by a transaction that rolls back are handed out again."""
+    if name is None:
+        return None
+    key = (column, name)
+    code = codes.get(key)
+    if code is None:
+        table = LOOKUP_TABLES[column]
+        row = c.execute(f"SELECT id FROM {table} WHERE name=?", (name,)).fetchone()
+        if row is None:
+            c.execute(f"INSERT INTO {table} (name) VALUES (?)", (name,))
+            code = c.lastrowid
+        else:
+            code = row[0]
+        codes[key] = code
+    return code
+
+def summary_tag(suc_id, event_type, summary):
+    """(tag, summary text to store): the tag when summary is one of the
+    SUMMARY_TEMPLATES for this alert, else (None, summary)."""
+    if suc_id is not None and event_type is not None:
+        for tag, template in SUMMARY_TEMPLATES.items():
+            if summary == template.format(suc_id=suc_id, event_type=event_type):
+                return tag, None
+    return None, summary
+
+def _alert_params(c, record, codes):
+    tag, summary = summary_tag(record["suc_id"], record["event_type"], record.get("summary", ""))
+    return (_lookup_code(c, "suc_id", record["suc_id"], codes),
+            _lookup_code(c, "event_type", record["event_type"], codes),
+            _lookup_code(c, "severity", record.get("severity", "Medium"), codes),
+            tag, summary, record["ts_epoch"], record["timestamp"], record["anomaly_score"], record["raw_masked"],
+            record["change_seq"])
+
+def insert_rows(c, records, classify=None, fts=True, coalesce=None):
+    """Insert records using cursor c, inside the caller's transaction.
+
+    When classify(c, record) is given, its (severity, summary) are stored
+    with the row, so the final tags land in the same transaction as the
+    insert. Without coalesce every record is classified before the batch
+    is written with one executemany, so classify must itself account for
+    earlier records of the batch (correlation.BatchCorrelation does).
+    severity, summary, ts_epoch and occurrence_count are set on each
+    record dict. Returns the ids in order. fts=False skips the search
+    index; the caller must rebuild it.
+
+    When coalesce(event_type) returns a window in seconds, a record that
+    repeats a stored alert (see find_repeat) within that window of its
+    first occurrence is folded into it instead: occurrence_count and
+    last_seen are updated, the record gets the alert's id and tags, and
+    classify is not called for it.
+    """
+    # one change_seq per record, whether it is inserted or folded
+    first_seq = bump_data_version(c, len(records)) - len(records) + 1
+    for seq, record in enumerate(records, first_seq):
+        record["ts_epoch"] = parse_epoch(record["timestamp"])
+        record.setdefault("severity", "Medium")
+        record.setdefault("summary", "")
+        record["occurrence_count"] = 1
+        record["change_seq"] = seq
+    codes = {}
+    if coalesce is None:
+        if classify is not None:
+            for record in records:
+                record["severity"], record["summary"] = classify(c, record)
+        params = [_alert_params(c, r, codes) for r in records]
+        c.executemany(INSERT_ALERT_SQL, params)
+        # The write lock is held for the whole transaction, so the
+        # AUTOINCREMENT ids handed out by executemany are contiguous.
+        last_id = c.execute("SELECT last_insert_rowid()").fetchone()[0]
+        first_id = last_id - len(records) + 1
+        alert_ids = list(range(first_id, last_id + 1))
+        inserted = list(zip(alert_ids, records))
+    else:
+        # a repeat may be of a record earlier in this batch, which
+        # find_repeat only sees once it is written, so go row by row
+        alert_ids = []
+        inserted = []
+        repeats = 0
+        for record in records:
+            window = coalesce(record["event_type"])
+            repeat = find_repeat(c, record, window) if window else None
+            if repeat is not None:
+                alert_id, count, last_seen, record["severity"], record["summary"] = repeat
+                if parse_epoch(last_seen) is None or record["ts_epoch"] >= parse_epoch(last_seen):
+                    last_seen = record["timestamp"]
+                c.execute("UPDATE alert_rows SET occurrence_count=?, last_seen=?, change_seq=? WHERE id=?",
+                          (count + 1, last_seen, record["change_seq"], alert_id))
+                record["occurrence_count"] = count + 1
+                alert_ids.append(alert_id)
+                repeats += 1
+                continue
+            if classify is not None:
+                record["severity"], record["summary"] = classify(c, record)
+            c.execute(INSERT_ALERT_SQL, _alert_params(c, record, codes))
+            alert_ids.append(c.lastrowid)
+            inserted.append((c.lastrowid, record))
+        _apply_counter_deltas(c, {("repeats", ""): repeats})
+
+    if fts:
+        _fts_insert(c, [(alert_id,) + tuple(record.get(col) for col in FTS_COLUMNS)
+                        for alert_id, record in inserted])
+
+    deltas = {}
+    rollup_deltas = {}
+    for _, record in inserted:
+        for counter in _counter_keys(record):
+            deltas[counter] = deltas.get(counter, 0) + 1
+        for key in _rollup_keys(record):
+            rollup_deltas[key] = rollup_deltas.get(key, 0) + 1
+    _apply_counter_deltas(c, deltas)
+    _apply_rollup_deltas(c, rollup_deltas)
+    return alert_ids
+
+def repeat_key(record):
+    """(src_ip_masked, dst_port) of a record; with suc_id and event_type
+    they identify repeats of the same event."""
+    try:
+        details = json.loads(record.get("raw_masked") or "{}")
+    except (TypeError, ValueError):
+        details = {}
+    if not isinstance(details, dict):
+        details = {}
+    return details.get("src_ip_masked"), details.get("dst_port")
+
+def find_repeat(c, record, window_seconds):
+    """The most recent stored alert with the record's suc_id, event_type,
+    masked source IP and destination port first seen within
+    window_seconds of it, as (id, occurrence_count, last_seen, severity,
+    summary); None when there is none."""
+    if record["ts_epoch"] is None:
+        return None
+    src_ip_masked, dst_port = repeat_key(record)
+    # range seek on idx_event_type_ts, like the correlation lookup
+    c.execute("""
+        SELECT id, occurrence_count, last_seen, severity, summary FROM alerts
+        WHERE event_code=(SELECT id FROM event_types WHERE name=?) AND ts_epoch BETWEEN ? AND ?
+          AND suc_code=(SELECT id FROM sucs WHERE name=?) AND src_ip_masked IS ? AND dst_port IS ?
+        ORDER BY ts_epoch DESC LIMIT 1
+    """, (record["event_type"], record["ts_epoch"] - window_seconds, record["ts_epoch"] + window_seconds,
+          record["suc_id"], src_ip_masked, dst_port))
+    return c.fetchone()
+
+def set_severity(c, alert_id, severity, summary):
+    """Update an alert's tags using cursor c, inside the caller's
+    transaction. Returns False when there is no such alert."""
+    c.execute("SELECT suc_id, event_type, severity, summary, ts_epoch FROM alerts WHERE id=?", (alert_id,))
+    row = c.fetchone()
+    if not row:
+        return False
+    old = {"suc_id": row[0], "event_type": row[1], "severity": row[2], "summary": row[3], "ts_epoch": row[4]}
+    tag, text = summary_tag(old["suc_id"], old["event_type"], summary)
+    c.execute("""
+        UPDATE alert_rows SET severity=?, tag=?, summary=?, change_seq=? WHERE id=?
+    """, (_lookup_code(c, "severity", severity, {}), tag, text, bump_data_version(c), alert_id))
+    _fts_delete(c, [(alert_id,) + tuple(old[col] for col in FTS_COLUMNS)])
+    _fts_insert(c, [(alert_id, old["suc_id"], old["event_type"], severity, summary)])
+
+    deltas = {}
+    for counter in _counter_keys(old, retag=True):
+        deltas[counter] = deltas.get(counter, 0) - 1
+    new = dict(old, severity=severity, summary=summary)
+    for counter in _counter_keys(new, retag=True):
+        deltas[counter] = deltas.get(counter, 0) + 1
+    _apply_counter_deltas(c, deltas)
+
+    if (old["severity"] or "Medium") != (severity or "Medium"):
+        rollup_deltas = {}
+        for key in _rollup_keys(old):
+            rollup_deltas[key] = rollup_deltas.get(key, 0) - 1
+        for key in _rollup_keys(new):
+            rollup_deltas[key] = rollup_deltas.get(key, 0) + 1
+        _apply_rollup_deltas(c, rollup_deltas)
+    return True
+
+def delete_rows(c, alert_ids):
+    """Delete alerts using cursor c, inside the caller's transaction.
+
+    The /metrics counters are decremented; the time-bucket rollups keep
+    the deleted alerts so timelines still cover archived ranges.
+    """
+    deltas = {}
+    for start in range(0, len(alert_ids), 500):
+        chunk = alert_ids[start:start + 500]
+        placeholders = ", ".join("?" for _ in chunk)
+        c.execute(f"SELECT id, suc_id, event_type, severity, summary, occurrence_count FROM alerts "
+                  f"WHERE id IN ({placeholders})", chunk)
+        rows = c.fetchall()
+        for _, suc_id, event_type, severity, summary, count in rows:
+            alert = {"suc_id": suc_id, "event_type": event_type, "severity": severity, "summary": summary}
+            for counter in _counter_keys(alert):
+                deltas[counter] = deltas.get(counter, 0) - 1
+            deltas[("repeats", "")] = deltas.get(("repeats", ""), 0) - (count - 1)
+        _fts_delete(c, [row[:5] for row in rows])
+        c.execute(f"DELETE FROM alert_rows WHERE id IN ({placeholders})", chunk)
+    _apply_counter_deltas(c, deltas)
+    if deltas:
+        bump_data_version(c)
+
+def bump_data_version(c, count=1):
+    """Advance the data version by count inside the caller's transaction
+    and return the new version. It changes exactly when the write commits
+    and is the validator of conditional GETs. Writes use the values
+    handed out as change_seq; writers are serialized by the write lock,
+    so they commit in change_seq order."""
+    c.execute("UPDATE data_version SET version = version + ?, modified = ?", (count, time.time()))
+    return c.execute("SELECT version FROM data_version").fetchone()[0]
+
+def get_data_version(db_path):
+    """(version, modified epoch) of the last committed write."""
+    with read_connection(db_path) as conn:
+        return conn.execute("SELECT version, modified FROM data_version").fetchone()
+
+# alerts_fts is an external-content FTS5 table: it stores only the index,
+# so every write to the indexed columns adds or removes the row's terms
+# here, passing the values that were indexed. Rows are
+# (id, suc_id, event_type, severity, summary).
+
+def rebuild_search_index(conn):
+    """Re-index every alert in alerts_fts (after loads with fts=False)."""
+    conn.execute("INSERT INTO alerts_fts(alerts_fts) VALUES ('rebuild')")
+
+def _fts_insert(c, rows):
+    if rows:
+        c.executemany(f"INSERT INTO alerts_fts (rowid, {', '.join(FTS_COLUMNS)}) VALUES (?, ?, ?, ?, ?)", rows)
+
+def _fts_delete(c, rows):
+    if rows:
+        c.executemany(f"INSERT INTO alerts_fts (alerts_fts, rowid, {', '.join(FTS_COLUMNS)}) "
+                      "VALUES ('delete', ?, ?, ?, ?, ?)", rows)
+
+# Materialized /metrics counters, kept in step with the alerts table by
+# insert_rows and set_severity in the same transaction. Keys are
+# normalized the way get_alerts presents the rows.
+
+def _counter_keys(alert, retag=False):
+    """(dimension, key) counters an alert contributes to; retag=True
+    lists only those a severity/summary update can change."""
+    keys = [("severity", alert.get("severity") or "Medium")]
+    if "coordinated" in str(alert.get("summary") or "").lower():
+        keys.append(("coordinated", ""))
+    if not retag:
+        keys.append(("total", ""))
+        keys.append(("suc", alert.get("suc_id") or "unknown"))
+        keys.append(("event_type", alert.get("event_type") or "unknown"))
+    return keys
+
+def _apply_counter_deltas(c, deltas):
+    changes = [(dimension, key, delta) for (dimension, key), delta in deltas.items() if delta]
+    if changes:
+        c.executemany("""
+            INSERT INTO alert_counters (dimension, key, count) VALUES (?, ?, ?)
+            ON CONFLICT(dimension, key) DO UPDATE SET count = count + excluded.count
+        """, changes)
+
+def rebuild_counters(conn):
+    """Recompute alert_counters from the alerts table in one transaction."""
+    c = conn.cursor()
+    c.execute("DELETE FROM alert_counters")
+    c.execute("INSERT INTO alert_counters (dimension, key, count) SELECT 'total', '', COUNT(*) FROM alerts")
+    c.execute("""
+        INSERT INTO alert_counters (dimension, key, count)
+        SELECT 'severity', COALESCE(NULLIF(severity, ''), 'Medium'), COUNT(*) FROM alerts GROUP BY 2
+    """)
+    c.execute("""
+        INSERT INTO alert_counters (dimension, key, count)
+        SELECT 'suc', COALESCE(NULLIF(suc_id, ''), 'unknown'), COUNT(*) FROM alerts GROUP BY 2
+    """)
+    c.execute("""
+        INSERT INTO alert_counters (dimension, key, count)
+        SELECT 'event_type', COALESCE(NULLIF(event_type, ''), 'unknown'), COUNT(*) FROM alerts GROUP BY 2
+    """)
+    c.execute("""
+        INSERT INTO alert_counters (dimension, key, count)
+        SELECT 'coordinated', '', COUNT(*) FROM alerts WHERE summary LIKE '%coordinated%'
+    """)
+    conn.commit()
+
+# Per-minute and per-hour rollups keyed by (bucket, suc_id, event_type,
+# severity), maintained alongside the counters. Alerts without a
+# parseable timestamp have no bucket and are left out.
+
+def _rollup_keys(alert):
+    epoch = alert.get("ts_epoch")
+    if epoch is None:
+        return []
+    suc_id = alert.get("suc_id") or "unknown"
+    event_type = alert.get("event_type") or "unknown"
+    severity = alert.get("severity") or "Medium"
+    return [(name, int(epoch // seconds) * seconds, suc_id, event_type, severity)
+            for name, seconds in ROLLUP_BUCKETS.items()]
+
+def _apply_rollup_deltas(c, deltas):
+    for name, table in ROLLUP_TABLES.items():
+        changes = [(bucket, suc_id, event_type, severity, delta)
+                   for (bucket_name, bucket, suc_id, event_type, severity), delta in deltas.items()
+                   if bucket_name == name and delta]
+        if changes:
+            c.executemany(f"""
+                INSERT INTO {table} (bucket, suc_id, event_type, severity, count) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(bucket, suc_id, event_type, severity) DO UPDATE SET count = count + excluded.count
+            """, changes)
+
+def rebuild_rollups(conn):
+    """Recompute the rollup tables from the alerts table in one transaction."""
+    c = conn.cursor()
+    for name, table in ROLLUP_TABLES.items():
+        seconds = ROLLUP_BUCKETS[name]
+        c.execute(f"DELETE FROM {table}")
+        c.execute(f"""
+            INSERT INTO {table} (bucket, suc_id, event_type, severity, count)
+            SELECT CAST(ts_epoch / {seconds} AS INTEGER) * {seconds},
+                   COALESCE(NULLIF(suc_id, ''), 'unknown'),
+                   COALESCE(NULLIF(event_type, ''), 'unknown'),
+                   COALESCE(NULLIF(severity, ''), 'Medium'),
+                   COUNT(*)
+            FROM alerts WHERE ts_epoch IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+        """)
+    conn.commit()
+
+def get_timeseries(db_path, bucket="1m", since=None, until=None, suc_id=None, event_type=None, severity=None):
+    """Alert counts per (bucket start, severity) from the rollup tables,
+    oldest bucket first. Filters take a value or a list of values."""
+    if bucket not in ROLLUP_TABLES:
+        raise ValueError(f"unknown bucket: {bucket}")
+    seconds = ROLLUP_BUCKETS[bucket]
+    where = []
+    params = []
+    if since is not None:
+        # include the bucket that contains since
+        where.append("bucket >= ?")
+        params.append(int(since // seconds) * seconds)
+    if until is not None:
+        where.append("bucket <= ?")
+        params.append(until)
+    if suc_id:
+        _in_clause("suc_id", suc_id, where, params)
+    if event_type:
+        _in_clause("event_type", event_type, where, params)
+    if severity:
+        _in_clause("severity", severity, where, params)
+    sql = f"SELECT bucket, severity, SUM(count) FROM {ROLLUP_TABLES[bucket]}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " GROUP BY bucket, severity HAVING SUM(count) > 0 ORDER BY bucket"
+    try:
+        with read_connection(db_path) as conn:
+            c = conn.cursor()
+            c.execute(sql, params)
+            return [{"bucket": b, "severity": sev, "count": count} for b, sev, count in c.fetchall()]
+    except Exception as e:
+        print(f"Error getting timeseries: {e}")
+        raise
+
+def get_metrics(db_path):
+    """Summary statistics for /metrics, read from alert_counters."""
+    try:
+        with read_connection(db_path) as conn:
+            c = conn.cursor()
+            c.execute("SELECT dimension, key, count FROM alert_counters WHERE count <> 0")
+            counters = {}
+            for dimension, key, count in c.fetchall():
+                counters.setdefault(dimension, {})[key] = count
+    except Exception as e:
+        print(f"Error getting metrics: {e}")
+        raise
+    severities = counters.get("severity", {})
+    return {
+        "total_alerts": counters.get("total", {}).get("", 0),
+        "total_occurrences": counters.get("total", {}).get("", 0) + counters.get("repeats", {}).get("", 0),
+        "by_severity": {
+            "high": severities.get("High", 0),
+            "medium": severities.get("Medium", 0),
+            "low": severities.get("Low", 0)
+        },
+        "by_suc": counters.get("suc", {}),
+        "by_event_type": counters.get("event_type", {}),
+        "coordinated_attacks": counters.get("coordinated", {}).get("", 0)
+    }
+
+# Change listeners are called as listener(db_path, kind, items) after a
+# write made through insert_alert(s), update_alert_severity or
+# correlation.correlate_and_tag has committed. kind is "insert" (items are
+# alerts as returned by get_alerts), "repeat" ({id, occurrence_count} of
+# alerts a record was coalesced into) or "update" ({id, severity,
+# summary}). Writes by other processes are not seen.
+_change_listeners = []
+
+def add_change_listener(listener):
+    _change_listeners.append(listener)
+
+def remove_change_listener(listener):
+    if listener in _change_listeners:
+        _change_listeners.remove(listener)
+
+def notify_changes(db_path, kind, items):
+    for listener in list(_change_listeners):
+        try:
+            listener(db_path, kind, items)
+        except Exception as e:
+            print(f"Error in change listener: {e}")
+
+def insert_changes(alert_ids, records):
+    """(kind, items) change notifications for records stored by insert_rows."""
+    inserted = []
+    repeats = []
+    for alert_id, record in zip(alert_ids, records):
+        if record.get("occurrence_count", 1) > 1:
+            repeats.append({"id": alert_id, "occurrence_count": record["occurrence_count"]})
+        else:
+            inserted.append(row_to_alert((alert_id,) + tuple(record.get(field) for field in ALERT_FIELDS[1:]),
+                                         ALERT_FIELDS))
+    return [(kind, items) for kind, items in (("insert", inserted), ("repeat", repeats)) if items]
+
 def insert_alert(db_path, record):
     try:
-        with sqlite3.connect(db_path) as conn:
+        with connection(db_path) as conn:
             c = conn.cursor()
-            c.execute("""
-                INSERT INTO alerts (suc_id, timestamp, event_type, raw_masked, anomaly_score, severity, summary)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (record["suc_id"], record["timestamp"], record["event_type"], record["raw_masked"], 
-                  record["anomaly_score"], record.get("severity", "Medium"), record.get("summary", "")))
+            alert_id = insert_rows(c, [record])[0]
             conn.commit()
-            alert_id = c.lastrowid
-            return alert_id
     except Exception as e:
         print(f"Error inserting alert: {e}")
         raise
+    if _change_listeners:
+        for kind, items in insert_changes([alert_id], [record]):
+            notify_changes(db_path, kind, items)
+    return alert_id
+
+def insert_alerts(db_path, records, classify=None, coalesce=None):
+    """Insert many alerts in one transaction and return their ids in order.
+
+    See insert_rows for classify and coalesce.
+    """
+    if not records:
+        return []
+    try:
+        with connection(db_path) as conn:
+            c = conn.cursor()
+            if classify is not None or coalesce is not None:
+                # take the write lock before the lookups so they and the
+                # inserts see one consistent snapshot
+                c.execute("BEGIN IMMEDIATE")
+            alert_ids = insert_rows(c, records, classify, coalesce=coalesce)
+            conn.commit()
+    except Exception as e:
+        print(f"Error inserting alerts: {e}")
+        raise
+    if _change_listeners:
+        for kind, items in insert_changes(alert_ids, records):
+            notify_changes(db_path, kind, items)
+    return alert_ids
 
 def update_alert_severity(db_path, alert_id, severity, summary):
     try:
-        with sqlite3.connect(db_path) as conn:
+        with connection(db_path) as conn:
             c = conn.cursor()
-            c.execute("""
-                UPDATE alerts SET severity=?, summary=? WHERE id=?
-            """, (severity, summary, alert_id))
+            updated = set_severity(c, alert_id, severity, summary)
             conn.commit()
     except Exception as e:
         print(f"Error updating alert severity: {e}")
         raise
+    if updated:
+        notify_changes(db_path, "update", [{"id": alert_id, "severity": severity, "summary": summary}])
+
+ALERT_FIELDS = ("id", "suc_id", "timestamp", "event_type", "raw_masked", "anomaly_score", "severity", "summary")
+
+# occurrence_count counts the alert and the repeats folded into it;
+# last_seen is the timestamp of the latest of them
+OCCURRENCE_FIELDS = ("occurrence_count", "last_seen")
+
+SELECTABLE_FIELDS = ALERT_FIELDS + DETAIL_FIELDS + OCCURRENCE_FIELDS + ("change_seq",)
+
+def row_to_alert(row, fields):
+    # raw_masked is only decoded when it was selected; the detail columns
+    # come back already extracted
+    alert = dict(zip(fields, row))
+    if "raw_masked" in alert:
+        # Safely parse JSON
+        raw_masked = {}
+        if alert["raw_masked"]:
+            try:
+                raw_masked = json.loads(alert["raw_masked"])
+            except (json.JSONDecodeError, TypeError):
+                raw_masked = {}
+        alert["raw_masked"] = raw_masked
+    if "suc_id" in alert:
+        alert["suc_id"] = alert["suc_id"] or "unknown"
+    if "timestamp" in alert:
+        alert["timestamp"] = alert["timestamp"] or ""
+    if "event_type" in alert:
+        alert["event_type"] = alert["event_type"] or "unknown"
+    if "severity" in alert:
+        alert["severity"] = alert["severity"] or "Medium"
+    if "summary" in alert:
+        alert["summary"] = alert["summary"] or ""
+    return alert
+
+def _in_clause(column, values, where, params):
+    if isinstance(values, (str, int)):
+        values = [values]
+    values = list(values)
+    where.append(f"{column} IN ({', '.join('?' for _ in values)})")
+    params.extend(values)
+
+def _check_fields(fields):
+    fields = tuple(fields) if fields else ALERT_FIELDS
+    for field in fields:
+        if field not in SELECTABLE_FIELDS:
+            raise ValueError(f"unknown field: {field}")
+    return fields
 
-def get_alerts(db_path):
+def _filter_clauses(severity=None, suc_id=None, event_type=None, since=None, until=None, dst_port=None,
+                    src_ip_masked=None, username_hash=None, min_attempts=None, table=""):
+    """WHERE clauses and params for the alert filters; table prefixes the
+    column names (e.g. "a.") when the alerts table is joined."""
+    where = []
+    params = []
+    for column, values in (("severity", severity), ("suc_id", suc_id), ("event_type", event_type)):
+        if values:
+            # filter on the code columns so the alert_rows indexes apply
+            names = []
+            _in_clause("name", values, names, params)
+            where.append(f"{table}{CODE_COLUMNS[column]} IN (SELECT id FROM {LOOKUP_TABLES[column]} WHERE {names[0]})")
+    for column, values in (("dst_port", dst_port), ("src_ip_masked", src_ip_masked),
+                           ("username_hash", username_hash)):
+        if values:
+            _in_clause(table + column, values, where, params)
+    if min_attempts is not None:
+        where.append(f"{table}attempts >= ?")
+        params.append(min_attempts)
+    if since is not None:
+        where.append(f"{table}ts_epoch >= ?")
+        params.append(since)
+    if until is not None:
+        where.append(f"{table}ts_epoch <= ?")
+        params.append(until)
+    return where, params
+
+def build_alert_query(fields=None, limit=None, before_id=None, after_id=None, severity=None,
+                      suc_id=None, event_type=None, since=None, until=None, dst_port=None,
+                      src_ip_masked=None, username_hash=None, min_attempts=None):
+    """Build the SELECT for get_alerts; returns (sql, params, fields).
+
+    severity, suc_id, event_type, dst_port, src_ip_masked and username_hash
+    take a value or a list of values; min_attempts matches attempts >= n;
+    since/until are epoch seconds matched against ts_epoch. Results are
+    newest first, except with after_id where they run oldest first so a
+    client can page forward from its cursor.
+    """
+    fields = _check_fields(fields)
+    where, params = _filter_clauses(severity=severity, suc_id=suc_id, event_type=event_type, since=since,
+                                    until=until, dst_port=dst_port, src_ip_masked=src_ip_masked,
+                                    username_hash=username_hash, min_attempts=min_attempts)
+    if before_id is not None:
+        where.append("id < ?")
+        params.append(before_id)
+    if after_id is not None:
+        where.append("id > ?")
+        params.append(after_id)
+
+    sql = f"SELECT {', '.join(fields)} FROM alerts"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id ASC" if after_id is not None and before_id is None else " ORDER BY id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params, fields
+
+def get_alerts(db_path, **query):
+    """Return alerts as dicts; see build_alert_query for the filters."""
+    sql, params, fields = build_alert_query(**query)
     try:
-        with sqlite3.connect(db_path) as conn:
+        with read_connection(db_path) as conn:
             c = conn.cursor()
-            c.execute("SELECT id, suc_id, timestamp, event_type, raw_masked, anomaly_score, severity, summary FROM alerts ORDER BY id DESC")
-            rows = c.fetchall()
-            results = []
-            for r in rows:
-                # Validate row has expected number of columns
-                if len(r) < 8:
-                    continue
-                    
-                # Safely parse JSON
-                raw_masked = {}
-                if r[4]:
-                    try:
-                        raw_masked = json.loads(r[4])
-                    except (json.JSONDecodeError, TypeError):
-                        raw_masked = {}
-                
-                results.append({
-                    "id": r[0],
-                    "suc_id": r[1] or "unknown",
-                    "timestamp": r[2] or "",
-                    "event_type": r[3] or "unknown",
-                    "raw_masked": raw_masked,
-                    "anomaly_score": r[5] if r[5] is not None else None,
-                    "severity": r[6] or "Medium",
-                    "summary": r[7] or ""
-                })
-            return results
+            c.execute(sql, params)
+            return [row_to_alert(r, fields) for r in c.fetchall()]
+    except QueryTimeout:
+        raise
     except Exception as e:
         print(f"Error getting alerts: {e}")
         return []
 
+def get_changes(db_path, since_seq=0, limit=500, fields=None, **filters):
+    """Alerts inserted, repeated or re-tagged after change_seq since_seq,
+    oldest change first, each with its change_seq, as (changes, next_seq).
+    Deleted (archived) alerts do not appear. filters are those of
+    build_alert_query.
+
+    next_seq is the since_seq to continue from: the last change returned
+    when the page is full, else the data version read before the query,
+    so changes that did not match the filters are not scanned again.
+    """
+    fields = _check_fields(fields)
+    if "change_seq" not in fields:
+        fields = fields + ("change_seq",)
+    where, params = _filter_clauses(**filters)
+    with read_connection(db_path) as conn:
+        # writes take change_seq values in commit order, so every change up
+        # to this version is already visible to the query below
+        version = conn.execute("SELECT version FROM data_version").fetchone()[0]
+        c = conn.cursor()
+        # range seek on idx_change_seq
+        c.execute(f"SELECT {', '.join(fields)} FROM alerts WHERE change_seq > ? AND change_seq <= ?"
+                  f"{''.join(' AND ' + clause for clause in where)} ORDER BY change_seq LIMIT ?",
+                  [since_seq, version] + params + [limit])
+        changes = [row_to_alert(r, fields) for r in c.fetchall()]
+    if len(changes) == limit:
+        return changes, changes[-1]["change_seq"]
+    return changes, max(since_seq, version)
+
+def fts_match_expression(text):
+    """Turn free search text into an FTS5 MATCH expression.
+
+    Every whitespace-separated term must match, as a prefix; terms are
+    quoted so FTS5 operators typed by a user are searched literally.
+    Returns None when there is nothing to search for.
+    """
+    terms = [term.replace('"', '""') for term in (text or "").split()]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+def search_alerts(db_path, q, fields=None, limit=50, offset=0, sort="rank", **filters):
+    """Full-text search over suc_id, event_type, severity and summary.
+
+    sort="rank" orders by bm25 relevance, sort="recent" newest first
+    (cheapest for terms that match most alerts). Each result carries a
+    score, higher meaning more relevant. The get_alerts filters apply.
+    """
+    expression = fts_match_expression(q)
+    if expression is None:
+        return []
+    fields = _check_fields(fields)
+    where, params = _filter_clauses(table="a.", **filters)
+    sql = (f"SELECT {', '.join('a.' + field for field in fields)}, f.rank "
+           "FROM alerts_fts f JOIN alerts a ON a.id = f.rowid WHERE alerts_fts MATCH ?")
+    params.insert(0, expression)
+    if where:
+        sql += " AND " + " AND ".join(where)
+    sql += " ORDER BY f.rowid DESC" if sort == "recent" else " ORDER BY f.rank, f.rowid DESC"
+    sql += " LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+    with read_connection(db_path) as conn:
+        c = conn.cursor()
+        c.execute(sql, params)
+        results = []
+        for row in c.fetchall():
+            alert = row_to_alert(row[:-1], fields)
+            alert["score"] = round(-row[-1], 4)
+            results.append(alert)
+        return results
+
+def iter_alert_batches(db_path, batch_size=1000, fields=None, limit=None, before_id=None, after_id=None,
+                       **filters):
+    """Yield lists of alert rows (tuples in the order of the requested
+    fields), batch_size at a time, so large reads never hold the whole
+    result in memory. See build_alert_query for the filters.
+
+    Each batch is a keyset query on id over a read connection borrowed
+    for that batch only, so a slow client streaming an export does not
+    keep a connection of the read pool (and the time limit applies per
+    batch). Batches are separate reads: alerts changed mid-stream can show
+    their newer values.
+    """
+    fields = _check_fields(fields)
+    # the cursor needs the id of the last row of each batch
+    query_fields = fields if "id" in fields else fields + ("id",)
+    id_index = query_fields.index("id")
+    ascending = after_id is not None and before_id is None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        sql, params, _ = build_alert_query(fields=query_fields, limit=size, before_id=before_id,
+                                           after_id=after_id, **filters)
+        with read_connection(db_path) as conn:
+            rows = conn.execute(sql, params).fetchall()
+        if not rows:
+            break
+        if ascending:
+            after_id = rows[-1][id_index]
+        else:
+            before_id = rows[-1][id_index]
+        if remaining is not None:
+            remaining -= len(rows)
+        yield rows if query_fields is fields else [row[:-1] for row in rows]
+        if len(rows) < size:
+            break
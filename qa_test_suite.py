@@ -7,11 +7,20 @@ Tests all components end-to-end with edge cases
 import requests
 import time
 import json
+import gzip
+import sqlite3
 import sys
 import os
+import subprocess
+import tempfile
+import threading
 from datetime import datetime, timedelta
 
-HUB_URL = "http://localhost:5000"
+HUB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hub")
+sys.path.insert(0, HUB_DIR)
+from storage import SELECTABLE_FIELDS, SCHEMA_VERSION, get_alerts, init_db
+
+HUB_URL = os.environ.get("HUB_URL", "http://localhost:5000")
 TEST_RESULTS = []
 
 def log_test(test_name, passed, message=""):
@@ -336,6 +345,929 @@ def test_data_persistence():
         log_test("Data Persistence", False, f"Exception: {e}")
         return False
 
+def test_batch_ingest():
+    """Test 11: Batch ingestion with per-item results"""
+    payload = [
+        {"suc_id": "BATCH_TEST", "event_type": "batch_test", "anomaly_score": 0.3},
+        {"event_type": "batch_test"},
+        {"suc_id": "BATCH_TEST", "event_type": "batch_test", "anomaly_score": 0.9}
+    ]
+    
+    try:
+        r = requests.post(f"{HUB_URL}/alerts/batch", json=payload, timeout=5)
+        if r.status_code == 200:
+            results = r.json().get("results", [])
+            if (len(results) == 3 and results[0].get("id") and results[2].get("id")
+                    and results[1].get("status") == "rejected"):
+                log_test("Batch Ingest", True, f"Alert IDs: {results[0].get('id')}, {results[2].get('id')}")
+                return True
+            log_test("Batch Ingest", False, f"Unexpected results: {results}")
+            return False
+        log_test("Batch Ingest", False, f"Status code: {r.status_code}")
+        return False
+    except Exception as e:
+        log_test("Batch Ingest", False, f"Exception: {e}")
+        return False
+
+def test_detail_columns():
+    """Test 12: Masked detail counts are stored as integers"""
+    payload = {
+        "suc_id": "DETAIL_TEST",
+        "event_type": "detail_test",
+        "raw_details": {"src_ip": "10.0.0.5", "attempts": "many", "dst_port": "443"}
+    }
+    
+    try:
+        if "ingest_queue" in requests.get(f"{HUB_URL}/health", timeout=2).json():
+            log_test("Detail Columns", True, "Skipped: alerts are queued (BAYANI_ASYNC_INGEST)")
+            return True
+        r = requests.post(f"{HUB_URL}/alerts", json=payload, timeout=2)
+        if r.status_code != 200:
+            log_test("Detail Columns", False, f"Status code: {r.status_code}")
+            return False
+        alert_id = r.json().get("id")
+        r = requests.get(f"{HUB_URL}/alerts", params={"suc_id": "DETAIL_TEST", "fields": "attempts,dst_port"}, timeout=2)
+        found = [a for a in r.json() if a.get("id") == alert_id]
+        if not found or found[0].get("attempts") is not None or found[0].get("dst_port") != 443:
+            log_test("Detail Columns", False, f"Unexpected alert: {found}")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts", params={"suc_id": "DETAIL_TEST", "min_attempts": 1}, timeout=2)
+        if any(a.get("id") == alert_id for a in r.json()):
+            log_test("Detail Columns", False, "Non-numeric attempts matched min_attempts")
+            return False
+        log_test("Detail Columns", True, "attempts dropped, dst_port stored as 443")
+        return True
+    except Exception as e:
+        log_test("Detail Columns", False, f"Exception: {e}")
+        return False
+
+def test_conditional_get():
+    """Test 13: ETag/304 on /alerts and /metrics"""
+    payload = {"suc_id": "ETAG_TEST", "event_type": "etag_test", "anomaly_score": 0.3}
+    
+    try:
+        if "ingest_queue" in requests.get(f"{HUB_URL}/health", timeout=2).json():
+            log_test("Conditional GET", True, "Skipped: alerts are queued (BAYANI_ASYNC_INGEST)")
+            return True
+        for path in ("/alerts", "/metrics"):
+            r = requests.get(f"{HUB_URL}{path}", timeout=2)
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+            if r.status_code != 200 or not etag or not last_modified:
+                log_test("Conditional GET", False, f"{path}: status {r.status_code}, ETag {etag}")
+                return False
+            r = requests.get(f"{HUB_URL}{path}", headers={"If-None-Match": etag}, timeout=2)
+            if r.status_code != 304 or r.content:
+                log_test("Conditional GET", False, f"{path}: expected 304, got {r.status_code}")
+                return False
+            requests.post(f"{HUB_URL}/alerts", json=payload, timeout=2)
+            # a write, likely within the same second as Last-Modified
+            for headers in ({"If-None-Match": etag}, {"If-Modified-Since": last_modified}):
+                r = requests.get(f"{HUB_URL}{path}", headers=headers, timeout=2)
+                if r.status_code != 200:
+                    log_test("Conditional GET", False, f"{path} with {headers}: stale {r.status_code} after a write")
+                    return False
+        log_test("Conditional GET", True, "304 while unchanged, 200 after a write")
+        return True
+    except Exception as e:
+        log_test("Conditional GET", False, f"Exception: {e}")
+        return False
+
+# end-of-stream marker of an Arrow IPC stream, magic of a Parquet file
+COLUMNAR_TRAILERS = {"arrow": b"\xff\xff\xff\xff\x00\x00\x00\x00", "parquet": b"PAR1"}
+
+def test_columnar_all_fields():
+    """Test 14: Arrow and Parquet output of every selectable field"""
+    params = {"fields": ",".join(SELECTABLE_FIELDS), "limit": 100}
+    
+    try:
+        for path in ("/alerts", "/alerts/export"):
+            for fmt, trailer in COLUMNAR_TRAILERS.items():
+                r = requests.get(f"{HUB_URL}{path}", params=dict(params, format=fmt), timeout=10)
+                if r.status_code == 501:
+                    log_test("Columnar All Fields", True, "pyarrow not installed on the hub, skipped")
+                    return True
+                if r.status_code != 200 or not r.content.endswith(trailer):
+                    log_test("Columnar All Fields", False, f"{path} {fmt}: status {r.status_code}, truncated body")
+                    return False
+        log_test("Columnar All Fields", True, f"{len(SELECTABLE_FIELDS)} fields as Arrow and Parquet")
+        return True
+    except Exception as e:
+        log_test("Columnar All Fields", False, f"Exception: {e}")
+        return False
+
+def test_alert_changes():
+    """Test 15: Delta sync with filters via /alerts/changes"""
+    try:
+        if "ingest_queue" in requests.get(f"{HUB_URL}/health", timeout=2).json():
+            log_test("Alert Changes", True, "Skipped: alerts are queued (BAYANI_ASYNC_INGEST)")
+            return True
+        r = requests.get(f"{HUB_URL}/alerts/changes", params={"since_seq": 0, "limit": 1}, timeout=2)
+        if r.status_code != 200 or "X-Next-Since-Seq" not in r.headers:
+            log_test("Alert Changes", False, f"Status code: {r.status_code}")
+            return False
+        requests.post(f"{HUB_URL}/alerts", json={"suc_id": "CHANGES_TEST", "event_type": "changes_test", "anomaly_score": 0.9}, timeout=2)
+        requests.post(f"{HUB_URL}/alerts", json={"suc_id": "CHANGES_TEST", "event_type": "changes_test", "anomaly_score": 0.1}, timeout=2)
+        params = {"since_seq": 0, "suc_id": "CHANGES_TEST", "severity": "High", "fields": "suc_id,severity"}
+        r = requests.get(f"{HUB_URL}/alerts/changes", params=params, timeout=2)
+        changes = r.json()
+        if not changes or any(a.get("suc_id") != "CHANGES_TEST" or a.get("severity") != "High" for a in changes):
+            log_test("Alert Changes", False, f"Filters not applied: {changes}")
+            return False
+        seqs = [a.get("change_seq") for a in changes]
+        if seqs != sorted(seqs) or int(r.headers["X-Next-Since-Seq"]) < seqs[-1]:
+            log_test("Alert Changes", False, f"Bad change order or cursor: {seqs}, {r.headers['X-Next-Since-Seq']}")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts/changes", params=dict(params, since_seq=r.headers["X-Next-Since-Seq"]), timeout=2)
+        if r.json():
+            log_test("Alert Changes", False, f"Changes repeated after the cursor: {r.json()}")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts/changes", params={"before_id": 1}, timeout=2)
+        if r.status_code != 400:
+            log_test("Alert Changes", False, f"before_id: expected 400, got {r.status_code}")
+            return False
+        log_test("Alert Changes", True, f"{len(changes)} matching change(s)")
+        return True
+    except Exception as e:
+        log_test("Alert Changes", False, f"Exception: {e}")
+        return False
+
+def test_rate_limit():
+    """Test 16: Per-SUC rate limiting with 429 and Retry-After"""
+    payload = {"suc_id": "RATE_TEST", "event_type": "rate_test", "anomaly_score": 0.3}
+    
+    try:
+        limits = requests.get(f"{HUB_URL}/health", timeout=2).json().get("rate_limit", {})
+        if not limits.get("rate"):
+            requests.post(f"{HUB_URL}/alerts", json=payload, timeout=2)
+            counts = requests.get(f"{HUB_URL}/health", timeout=2).json()["rate_limit"]["sucs"].get("RATE_TEST", {})
+            if counts.get("admitted", 0) < 1:
+                log_test("Rate Limit", False, f"RATE_TEST not counted: {counts}")
+                return False
+            log_test("Rate Limit", True, "Rate limiting off (BAYANI_SUC_RATE); per-SUC counters checked")
+            return True
+        burst = int(limits["burst"])
+        # a batch may not get past the burst
+        r = requests.post(f"{HUB_URL}/alerts/batch", json=[payload] * (burst + 5), timeout=5)
+        if r.status_code not in (200, 429):
+            log_test("Rate Limit", False, f"Batch status code: {r.status_code}")
+            return False
+        if r.status_code == 200:
+            results = r.json()["results"]
+            admitted = [x for x in results if x.get("status") != "rejected"]
+            limited = [x for x in results if x.get("error") == "rate limit exceeded"]
+            if len(admitted) > burst or not limited or not limited[0].get("retry_after"):
+                log_test("Rate Limit", False, f"{len(admitted)} admitted with burst {burst}")
+                return False
+        r = requests.post(f"{HUB_URL}/alerts", json=payload, timeout=2)
+        retry_after = r.headers.get("Retry-After", "")
+        if r.status_code != 429 or not retry_after.isdigit() or int(retry_after) < 1:
+            log_test("Rate Limit", False, f"Expected 429 with Retry-After, got {r.status_code} {retry_after!r}")
+            return False
+        log_test("Rate Limit", True, f"429 with Retry-After: {retry_after}")
+        return True
+    except Exception as e:
+        log_test("Rate Limit", False, f"Exception: {e}")
+        return False
+
+def test_async_ingest():
+    """Test 17: Write-behind ingest answers 202 and stores queued alerts"""
+    payload = [
+        {"suc_id": "ASYNC_TEST", "event_type": "async_test", "anomaly_score": 0.3, "raw_details": {"dst_port": 1}},
+        {"event_type": "async_test"}
+    ]
+    
+    try:
+        queued = "ingest_queue" in requests.get(f"{HUB_URL}/health", timeout=2).json()
+        r = requests.post(f"{HUB_URL}/alerts", json=payload[0], timeout=2)
+        expected = (202, "queued") if queued else (200, "received")
+        if (r.status_code, r.json().get("status")) != expected:
+            log_test("Async Ingest", False, f"Expected {expected}, got {r.status_code} {r.json().get('status')}")
+            return False
+        if queued and not isinstance(r.json().get("queue_depth"), int):
+            log_test("Async Ingest", False, "Missing queue_depth")
+            return False
+        # another port, so that the alert is not coalesced into the first
+        r = requests.post(f"{HUB_URL}/alerts/batch", json=[dict(payload[0], raw_details={"dst_port": 2}), payload[1]],
+                          timeout=5)
+        data = r.json()
+        if queued and (r.status_code != 202 or data.get("queued") != 1 or data.get("rejected") != 1):
+            log_test("Async Ingest", False, f"Unexpected batch response: {r.status_code} {data}")
+            return False
+        # queued alerts are committed by the writer shortly after
+        for _ in range(20):
+            alerts = requests.get(f"{HUB_URL}/alerts", params={"suc_id": "ASYNC_TEST"}, timeout=2).json()
+            if len(alerts) >= 2:
+                log_test("Async Ingest", True, "queued" if queued else "BAYANI_ASYNC_INGEST off, stored synchronously")
+                return True
+            time.sleep(0.1)
+        log_test("Async Ingest", False, "Queued alerts were not stored")
+        return False
+    except Exception as e:
+        log_test("Async Ingest", False, f"Exception: {e}")
+        return False
+
+def test_async_correlation():
+    """Test 18: Background correlation answers "pending" and tags later"""
+    payload = {"suc_id": "CORRELATION_TEST", "event_type": "correlation_test", "anomaly_score": 0.3}
+    
+    try:
+        health = requests.get(f"{HUB_URL}/health", timeout=2).json()
+        if "ingest_queue" in health:
+            log_test("Async Correlation", True, "Skipped: alerts are queued (BAYANI_ASYNC_INGEST)")
+            return True
+        pooled = "correlation_pool" in health
+        r = requests.post(f"{HUB_URL}/alerts", json=payload, timeout=2)
+        data = r.json()
+        if r.status_code != 200 or (data.get("correlation") == "pending") != pooled:
+            log_test("Async Correlation", False, f"Unexpected response: {r.status_code} {data}")
+            return False
+        if not pooled and not data.get("summary"):
+            log_test("Async Correlation", False, "Missing summary")
+            return False
+        # the worker writes the summary after the response
+        for _ in range(20):
+            alerts = requests.get(f"{HUB_URL}/alerts", params={"suc_id": "CORRELATION_TEST"}, timeout=2).json()
+            found = [a for a in alerts if a.get("id") == data.get("id")]
+            if found and found[0].get("summary"):
+                log_test("Async Correlation", True, "pending, then tagged" if pooled else "BAYANI_ASYNC_CORRELATION off, tagged inline")
+                return True
+            time.sleep(0.1)
+        log_test("Async Correlation", False, "Alert was never tagged")
+        return False
+    except Exception as e:
+        log_test("Async Correlation", False, f"Exception: {e}")
+        return False
+
+def test_correlation_index():
+    """Test 19: Correlation index reported in /health and used for tagging"""
+    try:
+        health = requests.get(f"{HUB_URL}/health", timeout=2).json()
+        if "correlation_index_entries" not in health:
+            log_test("Correlation Index", True, "Index off (BAYANI_CORRELATION_INDEX=false)")
+            return True
+        if "ingest_queue" in health or "correlation_pool" in health:
+            log_test("Correlation Index", True, "Skipped: async ingest or correlation enabled")
+            return True
+        before = health["correlation_index_entries"]
+        for suc_id in ("INDEX_SUC_1", "INDEX_SUC_2"):
+            r = requests.post(f"{HUB_URL}/alerts", json={"suc_id": suc_id, "event_type": "index_test", "anomaly_score": 0.3}, timeout=2)
+        if "coordinated" not in (r.json().get("summary") or "").lower():
+            log_test("Correlation Index", False, f"Second SUC not tagged coordinated: {r.json()}")
+            return False
+        after = requests.get(f"{HUB_URL}/health", timeout=2).json()["correlation_index_entries"]
+        if after < before + 2:
+            log_test("Correlation Index", False, f"Entries went from {before} to {after}")
+            return False
+        log_test("Correlation Index", True, f"{after} entries")
+        return True
+    except Exception as e:
+        log_test("Correlation Index", False, f"Exception: {e}")
+        return False
+
+def test_alert_pagination_filters():
+    """Test 20: Keyset pagination and server-side filters on GET /alerts"""
+    scores = [0.9, 0.3, 0.6, 0.9, 0.3]
+    
+    try:
+        if "ingest_queue" in requests.get(f"{HUB_URL}/health", timeout=2).json():
+            log_test("Alert Pagination and Filters", True, "Skipped: alerts are queued (BAYANI_ASYNC_INGEST)")
+            return True
+        ids = []
+        for i, score in enumerate(scores):
+            payload = {"suc_id": "PAGE_TEST", "event_type": "page_test", "anomaly_score": score,
+                       "timestamp": f"2020-01-0{i + 1}T00:00:00Z", "raw_details": {"dst_port": 22 + i, "attempts": i}}
+            ids.append(requests.post(f"{HUB_URL}/alerts", json=payload, timeout=2).json()["id"])
+        seen = []
+        params = {"suc_id": "PAGE_TEST", "limit": 2}
+        while True:
+            r = requests.get(f"{HUB_URL}/alerts", params=params, timeout=2)
+            seen += [a["id"] for a in r.json()]
+            if "X-Next-Before-Id" not in r.headers:
+                break
+            params["before_id"] = r.headers["X-Next-Before-Id"]
+        if seen != sorted(ids, reverse=True):
+            log_test("Alert Pagination and Filters", False, f"Paged ids {seen}, expected {sorted(ids, reverse=True)}")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts", params={"suc_id": "PAGE_TEST", "after_id": ids[0], "limit": 2}, timeout=2)
+        if [a["id"] for a in r.json()] != ids[1:3] or r.headers.get("X-Next-After-Id") != str(ids[2]):
+            log_test("Alert Pagination and Filters", False, "after_id page not oldest first")
+            return False
+        checks = [
+            ({"severity": "High,Low"}, [i for i, s in zip(ids, scores) if s != 0.6]),
+            ({"since": "2020-01-02T00:00:00Z", "until": "2020-01-03T00:00:00Z"}, ids[1:3]),
+            ({"dst_port": "22,26"}, [ids[0], ids[4]]),
+            ({"min_attempts": 3}, ids[3:])
+        ]
+        for extra, expected in checks:
+            r = requests.get(f"{HUB_URL}/alerts", params=dict(extra, suc_id="PAGE_TEST"), timeout=2)
+            if sorted(a["id"] for a in r.json()) != sorted(expected):
+                log_test("Alert Pagination and Filters", False, f"Filter {extra} returned {[a['id'] for a in r.json()]}")
+                return False
+        for bad in ({"limit": 0}, {"limit": "x"}, {"fields": "nope"}, {"since": "yesterday"}):
+            r = requests.get(f"{HUB_URL}/alerts", params=bad, timeout=2)
+            if r.status_code != 400:
+                log_test("Alert Pagination and Filters", False, f"{bad}: expected 400, got {r.status_code}")
+                return False
+        log_test("Alert Pagination and Filters", True, f"{len(seen)} alerts in pages of 2")
+        return True
+    except Exception as e:
+        log_test("Alert Pagination and Filters", False, f"Exception: {e}")
+        return False
+
+def test_metrics_counters():
+    """Test 21: /metrics counters follow every stored alert"""
+    payload = {"suc_id": "METRICS_TEST", "event_type": "metrics_test", "anomaly_score": 0.9}
+    
+    try:
+        if "ingest_queue" in requests.get(f"{HUB_URL}/health", timeout=2).json():
+            log_test("Metrics Counters", True, "Skipped: alerts are queued (BAYANI_ASYNC_INGEST)")
+            return True
+        before = requests.get(f"{HUB_URL}/metrics", timeout=2).json()
+        # by_severity is keyed by the lower-case severity
+        severity = requests.post(f"{HUB_URL}/alerts", json=payload, timeout=2).json()["severity"].lower()
+        after = requests.get(f"{HUB_URL}/metrics", timeout=2).json()
+        deltas = {
+            "total_alerts": after["total_alerts"] - before["total_alerts"],
+            "by_suc": after["by_suc"].get("METRICS_TEST", 0) - before["by_suc"].get("METRICS_TEST", 0),
+            "by_event_type": after["by_event_type"].get("metrics_test", 0) - before["by_event_type"].get("metrics_test", 0),
+            "by_severity": after["by_severity"].get(severity, 0) - before["by_severity"].get(severity, 0)
+        }
+        if any(delta != 1 for delta in deltas.values()):
+            log_test("Metrics Counters", False, f"Counters moved by {deltas}")
+            return False
+        log_test("Metrics Counters", True, f"Total: {after['total_alerts']}")
+        return True
+    except Exception as e:
+        log_test("Metrics Counters", False, f"Exception: {e}")
+        return False
+
+def test_metrics_timeseries():
+    """Test 22: /metrics/timeseries buckets alert counts by time and severity"""
+    timestamps = ["2021-03-04T05:06:10Z", "2021-03-04T05:06:50Z", "2021-03-04T05:08:00Z"]
+    
+    try:
+        if "ingest_queue" in requests.get(f"{HUB_URL}/health", timeout=2).json():
+            log_test("Metrics Timeseries", True, "Skipped: alerts are queued (BAYANI_ASYNC_INGEST)")
+            return True
+        for port, timestamp in enumerate(timestamps):
+            requests.post(f"{HUB_URL}/alerts", json={"suc_id": "TIMESERIES_TEST", "event_type": "timeseries_test",
+                                                     "anomaly_score": 0.3, "timestamp": timestamp,
+                                                     "raw_details": {"dst_port": port}}, timeout=2)
+        params = {"suc_id": "TIMESERIES_TEST", "since": "2021-03-04T00:00:00Z", "until": "2021-03-05T00:00:00Z"}
+        r = requests.get(f"{HUB_URL}/metrics/timeseries", params=dict(params, bucket="1m"), timeout=2)
+        points = [(p["time"], p["severity"], p["count"]) for p in r.json()["points"]]
+        if points != [("2021-03-04T05:06:00Z", "Low", 2), ("2021-03-04T05:08:00Z", "Low", 1)]:
+            log_test("Metrics Timeseries", False, f"Unexpected 1m points: {points}")
+            return False
+        r = requests.get(f"{HUB_URL}/metrics/timeseries", params=dict(params, bucket="1h"), timeout=2)
+        if [p["count"] for p in r.json()["points"]] != [3]:
+            log_test("Metrics Timeseries", False, f"Unexpected 1h points: {r.json()['points']}")
+            return False
+        r = requests.get(f"{HUB_URL}/metrics/timeseries", params={"bucket": "1d"}, timeout=2)
+        if r.status_code != 400:
+            log_test("Metrics Timeseries", False, f"bucket=1d: expected 400, got {r.status_code}")
+            return False
+        log_test("Metrics Timeseries", True, f"{len(points)} minute buckets")
+        return True
+    except Exception as e:
+        log_test("Metrics Timeseries", False, f"Exception: {e}")
+        return False
+
+def test_archive_endpoint():
+    """Test 23: GET /alerts/archive reads archived partitions"""
+    try:
+        params = {"since": "2020-01-01T00:00:00Z", "until": "2020-02-01T00:00:00Z", "limit": 10}
+        r = requests.get(f"{HUB_URL}/alerts/archive", params=params, timeout=5)
+        if r.status_code == 501:
+            log_test("Archive Endpoint", True, "pyarrow not installed on the hub, skipped")
+            return True
+        alerts = r.json()
+        if r.status_code != 200 or not isinstance(alerts, list) or len(alerts) > 10:
+            log_test("Archive Endpoint", False, f"Status code: {r.status_code}")
+            return False
+        if any(not "2020-01-01" <= a.get("timestamp", "") < "2020-02-01T00:00:01" for a in alerts):
+            log_test("Archive Endpoint", False, "Archived alert outside since/until")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts/archive", params={"since": "yesterday"}, timeout=2)
+        if r.status_code != 400:
+            log_test("Archive Endpoint", False, f"since=yesterday: expected 400, got {r.status_code}")
+            return False
+        log_test("Archive Endpoint", True, f"{len(alerts)} archived alert(s) in range")
+        return True
+    except Exception as e:
+        log_test("Archive Endpoint", False, f"Exception: {e}")
+        return False
+
+def test_columnar_formats():
+    """Test 24: Arrow and Parquet responses, by format= and by Accept"""
+    mimetypes = {"arrow": "application/vnd.apache.arrow.stream", "parquet": "application/vnd.apache.parquet"}
+    
+    try:
+        for fmt, mimetype in mimetypes.items():
+            for request_args in ({"params": {"format": fmt, "limit": 20}},
+                                 {"params": {"limit": 20}, "headers": {"Accept": mimetype}}):
+                r = requests.get(f"{HUB_URL}/alerts", timeout=5, **request_args)
+                if r.status_code == 501:
+                    log_test("Columnar Formats", True, "pyarrow not installed on the hub, skipped")
+                    return True
+                if (r.status_code != 200 or r.headers.get("Content-Type") != mimetype
+                        or not r.content.endswith(COLUMNAR_TRAILERS[fmt])):
+                    log_test("Columnar Formats", False, f"{request_args}: {r.status_code} {r.headers.get('Content-Type')}")
+                    return False
+        r = requests.get(f"{HUB_URL}/alerts", params={"format": "xml"}, timeout=2)
+        if r.status_code != 406:
+            log_test("Columnar Formats", False, f"format=xml: expected 406, got {r.status_code}")
+            return False
+        log_test("Columnar Formats", True, "Arrow and Parquet negotiated")
+        return True
+    except Exception as e:
+        log_test("Columnar Formats", False, f"Exception: {e}")
+        return False
+
+def test_streamed_alerts():
+    """Test 25: Streamed JSON array and NDJSON match the plain response"""
+    params = {"limit": 50}
+    
+    try:
+        plain = requests.get(f"{HUB_URL}/alerts", params=params, timeout=5).json()
+        r = requests.get(f"{HUB_URL}/alerts", params=dict(params, stream=1), timeout=5)
+        if r.status_code != 200 or r.json() != plain:
+            log_test("Streamed Alerts", False, "stream=1 differs from the plain response")
+            return False
+        for request_args in ({"params": dict(params, format="ndjson")},
+                             {"params": params, "headers": {"Accept": "application/x-ndjson"}}):
+            r = requests.get(f"{HUB_URL}/alerts", timeout=5, **request_args)
+            if r.status_code != 200 or r.headers.get("Content-Type") != "application/x-ndjson":
+                log_test("Streamed Alerts", False, f"{request_args}: {r.status_code} {r.headers.get('Content-Type')}")
+                return False
+            if [json.loads(line) for line in r.text.splitlines() if line] != plain:
+                log_test("Streamed Alerts", False, "NDJSON differs from the plain response")
+                return False
+        log_test("Streamed Alerts", True, f"{len(plain)} alerts streamed")
+        return True
+    except Exception as e:
+        log_test("Streamed Alerts", False, f"Exception: {e}")
+        return False
+
+def test_alert_search():
+    """Test 26: Full-text search with ranking and offset paging"""
+    try:
+        if "ingest_queue" in requests.get(f"{HUB_URL}/health", timeout=2).json():
+            log_test("Alert Search", True, "Skipped: alerts are queued (BAYANI_ASYNC_INGEST)")
+            return True
+        ids = set()
+        for suc_id in ("SEARCH_TEST_1", "SEARCH_TEST_2"):
+            r = requests.post(f"{HUB_URL}/alerts", json={"suc_id": suc_id, "event_type": "zetasearch_probe", "anomaly_score": 0.3}, timeout=2)
+            ids.add(r.json()["id"])
+        # every word must match, as a prefix
+        r = requests.get(f"{HUB_URL}/alerts/search", params={"q": "zetasearch SEARCH_TEST", "limit": 1}, timeout=2)
+        first = r.json()
+        if r.status_code != 200 or len(first) != 1 or "score" not in first[0] or r.headers.get("X-Next-Offset") != "1":
+            log_test("Alert Search", False, f"Unexpected first page: {r.status_code} {first}")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts/search", params={"q": "zetasearch SEARCH_TEST", "limit": 1, "offset": 1}, timeout=2)
+        if {first[0]["id"]} | {a["id"] for a in r.json()} != ids:
+            log_test("Alert Search", False, f"Pages do not cover alerts {ids}")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts/search", params={"q": "zetasearch", "suc_id": "SEARCH_TEST_2", "sort": "recent"}, timeout=2)
+        if [a["suc_id"] for a in r.json()] != ["SEARCH_TEST_2"]:
+            log_test("Alert Search", False, f"suc_id filter not applied: {r.json()}")
+            return False
+        for bad in ({}, {"q": "x", "sort": "best"}, {"q": "x", "offset": -1}, {"q": "x", "before_id": 5}):
+            r = requests.get(f"{HUB_URL}/alerts/search", params=bad, timeout=2)
+            if r.status_code != 400:
+                log_test("Alert Search", False, f"{bad}: expected 400, got {r.status_code}")
+                return False
+        log_test("Alert Search", True, "2 matches in pages of 1")
+        return True
+    except Exception as e:
+        log_test("Alert Search", False, f"Exception: {e}")
+        return False
+
+def test_storage_backend():
+    """Test 27: /health names the storage backend and alerts read back from it"""
+    try:
+        health = requests.get(f"{HUB_URL}/health", timeout=2).json()
+        if health.get("storage") not in ("sqlite", "memory"):
+            log_test("Storage Backend", False, f"Unexpected storage: {health.get('storage')}")
+            return False
+        if "ingest_queue" in health:
+            log_test("Storage Backend", True, f"{health['storage']} (read-back skipped: alerts are queued)")
+            return True
+        r = requests.post(f"{HUB_URL}/alerts", json={"suc_id": "STORAGE_TEST", "event_type": "storage_probe",
+                                                     "anomaly_score": 0.5, "dst_port": 8443}, timeout=2)
+        alert_id = r.json()["id"]
+        r = requests.get(f"{HUB_URL}/alerts", params={"after_id": alert_id - 1, "before_id": alert_id + 1}, timeout=2)
+        alerts = r.json()
+        if len(alerts) != 1 or alerts[0]["suc_id"] != "STORAGE_TEST" or alerts[0]["event_type"] != "storage_probe":
+            log_test("Storage Backend", False, f"Alert {alert_id} did not read back: {alerts}")
+            return False
+        log_test("Storage Backend", True, f"{health['storage']}, alert {alert_id} read back")
+        return True
+    except Exception as e:
+        log_test("Storage Backend", False, f"Exception: {e}")
+        return False
+
+def test_alert_coalescing():
+    """Test 28: Repeats of an alert are coalesced when BAYANI_COALESCE_SECONDS is set"""
+    try:
+        if "ingest_queue" in requests.get(f"{HUB_URL}/health", timeout=2).json():
+            log_test("Alert Coalescing", True, "Skipped: alerts are queued (BAYANI_ASYNC_INGEST)")
+            return True
+        alert = {"suc_id": "COALESCE_TEST", "event_type": "coalesce_probe", "anomaly_score": 0.4,
+                 "raw_details": {"src_ip": "10.9.8.7", "dst_port": 2222}}
+        first = requests.post(f"{HUB_URL}/alerts", json=alert, timeout=2).json()
+        second = requests.post(f"{HUB_URL}/alerts", json=alert, timeout=2).json()
+        batch = requests.post(f"{HUB_URL}/alerts/batch", json=[alert, dict(alert, raw_details={"src_ip": "10.9.8.7", "dst_port": 2223})], timeout=2).json()
+        if second["status"] == "received":
+            # coalescing is off: every repeat is stored on its own
+            if second["id"] == first["id"] or batch["coalesced"] != 0:
+                log_test("Alert Coalescing", False, f"Repeat folded with coalescing off: {second} {batch}")
+                return False
+            log_test("Alert Coalescing", True, "Off: repeats stored separately")
+            return True
+        if second["status"] != "coalesced" or second["id"] != first["id"] or second["occurrence_count"] != 2:
+            log_test("Alert Coalescing", False, f"Unexpected repeat response: {second}")
+            return False
+        statuses = [item["status"] for item in batch["results"]]
+        if batch["coalesced"] != 1 or statuses != ["coalesced", "received"] or batch["results"][0]["occurrence_count"] != 3:
+            log_test("Alert Coalescing", False, f"Unexpected batch response: {batch}")
+            return False
+        log_test("Alert Coalescing", True, f"Alert {first['id']} seen 3 times, other port stored")
+        return True
+    except Exception as e:
+        log_test("Alert Coalescing", False, f"Exception: {e}")
+        return False
+
+def test_alert_stream():
+    """Test 29: Server-Sent Events on /alerts/stream with Last-Event-ID resume"""
+    def read_events(r):
+        event = {}
+        for line in r.iter_lines(chunk_size=1, decode_unicode=True):
+            if line:
+                field, _, value = line.partition(":")
+                event[field] = value.strip()
+            elif event:
+                yield event
+                event = {}
+
+    try:
+        with requests.get(f"{HUB_URL}/alerts/stream", stream=True, timeout=(2, 5)) as r:
+            if r.status_code != 200 or not r.headers.get("Content-Type", "").startswith("text/event-stream"):
+                log_test("Alert Stream", False, f"Unexpected response: {r.status_code} {r.headers.get('Content-Type')}")
+                return False
+            events = read_events(r)
+            if "retry" not in next(events):
+                log_test("Alert Stream", False, "Stream does not start with retry")
+                return False
+            requests.post(f"{HUB_URL}/alerts", json={"suc_id": "STREAM_TEST", "event_type": "stream_test",
+                                                     "anomaly_score": 0.3}, timeout=2)
+            # other events (e.g. re-tagging) may come first
+            for event in events:
+                if event.get("event") == "insert" and json.loads(event["data"])["suc_id"] == "STREAM_TEST":
+                    break
+            event_id = int(event["id"])
+        with requests.get(f"{HUB_URL}/alerts/stream", headers={"Last-Event-ID": str(event_id - 1)},
+                          stream=True, timeout=(2, 5)) as r:
+            events = read_events(r)
+            next(events)
+            resumed = next(events)
+        if (resumed.get("id"), resumed.get("event")) != (str(event_id), "insert"):
+            log_test("Alert Stream", False, f"Resume after {event_id - 1} got {resumed}")
+            return False
+        with requests.get(f"{HUB_URL}/alerts/stream", headers={"Last-Event-ID": "1"}, stream=True, timeout=(2, 5)) as r:
+            events = read_events(r)
+            next(events)
+            if next(events).get("event") != "reset":
+                log_test("Alert Stream", False, "No reset for a Last-Event-ID that is no longer buffered")
+                return False
+        r = requests.get(f"{HUB_URL}/alerts/stream", headers={"Last-Event-ID": "abc"}, timeout=2)
+        if r.status_code != 400:
+            log_test("Alert Stream", False, f"Last-Event-ID abc: expected 400, got {r.status_code}")
+            return False
+        log_test("Alert Stream", True, f"insert event {event_id} received and resumed")
+        return True
+    except Exception as e:
+        log_test("Alert Stream", False, f"Exception: {e}")
+        return False
+
+def test_gzip():
+    """Test 30: gzip for large responses and for POST bodies"""
+    alert = {"suc_id": "GZIP_TEST", "event_type": "gzip_test", "anomaly_score": 0.3}
+    
+    try:
+        for path, body, expected in (("/alerts", json.dumps(alert), (200, 202)),
+                                     ("/alerts/batch", json.dumps([alert, alert]), (200, 202))):
+            r = requests.post(f"{HUB_URL}{path}", data=gzip.compress(body.encode()), timeout=2,
+                              headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+            if r.status_code not in expected:
+                log_test("Gzip", False, f"gzip POST {path}: {r.status_code} {r.text[:100]}")
+                return False
+        # a generator body is sent chunked, without Content-Length
+        body = gzip.compress(json.dumps([alert] * 5).encode())
+        r = requests.post(f"{HUB_URL}/alerts/batch", data=(body[i:i + 16] for i in range(0, len(body), 16)), timeout=2,
+                          headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        if r.status_code not in (200, 202) or r.json().get("rejected") != 0:
+            log_test("Gzip", False, f"Chunked gzip POST /alerts/batch: {r.status_code} {r.text[:100]}")
+            return False
+        r = requests.post(f"{HUB_URL}/alerts", data=b"not gzip", timeout=2,
+                          headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        if r.status_code != 400:
+            log_test("Gzip", False, f"Malformed gzip body: expected 400, got {r.status_code}")
+            return False
+        # queued alerts and background re-tagging change the ETag; let them land
+        for _ in range(50):
+            health = requests.get(f"{HUB_URL}/health", timeout=2).json()
+            if not health.get("ingest_queue", {}).get("pending") and not health.get("correlation_pool", {}).get("pending"):
+                break
+            time.sleep(0.1)
+        r = requests.get(f"{HUB_URL}/alerts", params={"limit": 50}, headers={"Accept-Encoding": "gzip"}, timeout=5)
+        etag = r.headers.get("ETag", "")
+        if r.headers.get("Content-Encoding") != "gzip" or not etag.startswith("W/") or "Accept-Encoding" not in r.headers.get("Vary", ""):
+            log_test("Gzip", False, f"Large /alerts not gzipped: {dict(r.headers)}")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts", params={"limit": 50}, timeout=5,
+                         headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        if r.status_code != 304:
+            log_test("Gzip", False, f"Weak ETag of the gzipped response: expected 304, got {r.status_code}")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts", params={"limit": 50}, headers={"Accept-Encoding": "identity"}, timeout=5)
+        if "Content-Encoding" in r.headers:
+            log_test("Gzip", False, "Response gzipped without Accept-Encoding: gzip")
+            return False
+        # streamed responses are compressed chunk by chunk
+        r = requests.get(f"{HUB_URL}/alerts", params={"limit": 50, "format": "ndjson"},
+                         headers={"Accept-Encoding": "gzip"}, timeout=5)
+        if r.headers.get("Content-Encoding") != "gzip" or not r.text.strip():
+            log_test("Gzip", False, f"Streamed NDJSON not gzipped: {dict(r.headers)}")
+            return False
+        log_test("Gzip", True, "POST bodies inflated, responses gzipped")
+        return True
+    except Exception as e:
+        log_test("Gzip", False, f"Exception: {e}")
+        return False
+
+def test_range_correlation():
+    """Test 31: Correlation and since/until use the event time, across time zones"""
+    # a fresh event type per run, so earlier runs cannot correlate
+    event_type = f"range_test_{int(time.time() * 1000)}"
+    alerts = [
+        ("RANGE_A", "2022-06-01T10:00:00Z"),
+        ("RANGE_B", "2022-06-01T10:01:30Z"),       # 90s after A: coordinated
+        ("RANGE_C", "2022-06-01T10:10:00Z"),       # 8.5 minutes after B: not
+        ("RANGE_D", "2022-06-01T18:11:00+08:00"),  # 10:11:00Z, 60s after C: coordinated
+    ]
+    
+    try:
+        health = requests.get(f"{HUB_URL}/health", timeout=2).json()
+        if "ingest_queue" in health:
+            log_test("Range Correlation", True, "Skipped: alerts are queued (BAYANI_ASYNC_INGEST)")
+            return True
+        for i, (suc_id, timestamp) in enumerate(alerts):
+            requests.post(f"{HUB_URL}/alerts", json={"suc_id": suc_id, "event_type": event_type, "anomaly_score": 0.3,
+                                                     "timestamp": timestamp, "raw_details": {"dst_port": i}}, timeout=2)
+        # background correlation (BAYANI_ASYNC_CORRELATION) tags shortly after
+        for _ in range(20):
+            stored = requests.get(f"{HUB_URL}/alerts", params={"event_type": event_type}, timeout=2).json()
+            if all(a["summary"] for a in stored):
+                break
+            time.sleep(0.1)
+        coordinated = sorted(a["suc_id"] for a in stored if a["summary"].startswith("Coordinated"))
+        if len(stored) != 4 or coordinated != ["RANGE_B", "RANGE_D"]:
+            log_test("Range Correlation", False, f"Expected RANGE_B and RANGE_D coordinated, got {coordinated}")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts", params={"event_type": event_type, "since": "2022-06-01T10:05:00Z"}, timeout=2)
+        if sorted(a["suc_id"] for a in r.json()) != ["RANGE_C", "RANGE_D"]:
+            log_test("Range Correlation", False, f"since did not compare event times: {[a['suc_id'] for a in r.json()]}")
+            return False
+        log_test("Range Correlation", True, "120s window applied across time zones")
+        return True
+    except Exception as e:
+        log_test("Range Correlation", False, f"Exception: {e}")
+        return False
+
+def test_transactional_tagging():
+    """Test 32: Concurrent batches are tagged as if stored one after another"""
+    event_type = f"txn_test_{int(time.time() * 1000)}"
+    sucs = [f"TXN_{i}" for i in range(4)]
+    results = {}
+    
+    def post_batch(suc_id):
+        batch = [{"suc_id": suc_id, "event_type": event_type, "anomaly_score": 0.3, "timestamp": "2022-07-01T12:00:00Z",
+                  "raw_details": {"dst_port": port}} for port in range(5)]
+        results[suc_id] = requests.post(f"{HUB_URL}/alerts/batch", json=batch, timeout=10).json()["results"]
+    
+    try:
+        health = requests.get(f"{HUB_URL}/health", timeout=2).json()
+        if "ingest_queue" in health or "correlation_pool" in health:
+            log_test("Transactional Tagging", True, "Skipped: alerts are queued or tagged in the background")
+            return True
+        threads = [threading.Thread(target=post_batch, args=(suc_id,)) for suc_id in sucs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the batch committed first sees no other SUC, every later one does
+        first = [suc_id for suc_id in sucs if not any(x["summary"].startswith("Coordinated") for x in results[suc_id])]
+        mixed = [suc_id for suc_id in sucs if len({x["summary"] for x in results[suc_id]}) != 1]
+        if len(first) != 1 or mixed:
+            log_test("Transactional Tagging", False, f"Uncoordinated batches {first}, mixed batches {mixed}")
+            return False
+        answered = {x["id"]: (x["severity"], x["summary"]) for suc_id in sucs for x in results[suc_id]}
+        stored = requests.get(f"{HUB_URL}/alerts", params={"event_type": event_type}, timeout=2).json()
+        if {a["id"]: (a["severity"], a["summary"]) for a in stored} != answered:
+            log_test("Transactional Tagging", False, "Stored tags differ from the ones answered")
+            return False
+        log_test("Transactional Tagging", True, f"{first[0]} committed first, 3 batches coordinated")
+        return True
+    except Exception as e:
+        log_test("Transactional Tagging", False, f"Exception: {e}")
+        return False
+
+def test_concurrent_access():
+    """Test 33: Concurrent writes and reads all succeed and nothing is lost"""
+    run = int(time.time() * 1000)
+    writers = [f"CONCURRENT_{run}_{i}" for i in range(6)]
+    statuses = []
+    slowest = [0.0]
+    
+    def request(method, path, **kwargs):
+        started = time.time()
+        r = requests.request(method, f"{HUB_URL}{path}", timeout=10, **kwargs)
+        statuses.append((method, path, r.status_code))
+        slowest[0] = max(slowest[0], time.time() - started)
+    
+    def write(suc_id):
+        for port in range(15):
+            request("POST", "/alerts", json={"suc_id": suc_id, "event_type": "concurrent_test", "anomaly_score": 0.3,
+                                             "raw_details": {"dst_port": port}})
+    
+    def read():
+        for _ in range(15):
+            request("GET", "/alerts", params={"limit": 200})
+            request("GET", "/metrics")
+    
+    try:
+        threads = [threading.Thread(target=write, args=(suc_id,)) for suc_id in writers]
+        threads += [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        failed = [s for s in statuses if s[2] not in ((200, 202) if s[0] == "POST" else (200,))]
+        if failed:
+            log_test("Concurrent Access", False, f"{len(failed)} failed requests, e.g. {failed[0]}")
+            return False
+        # queued alerts are committed by the writer shortly after
+        for _ in range(50):
+            stored = requests.get(f"{HUB_URL}/alerts", params={"suc_id": writers, "limit": 1000}, timeout=2).json()
+            if len(stored) >= 90:
+                break
+            time.sleep(0.1)
+        if len(stored) != 90:
+            log_test("Concurrent Access", False, f"Expected 90 stored alerts, found {len(stored)}")
+            return False
+        log_test("Concurrent Access", True, f"{len(statuses)} requests, slowest {slowest[0]:.2f}s")
+        return True
+    except Exception as e:
+        log_test("Concurrent Access", False, f"Exception: {e}")
+        return False
+
+def test_read_pool():
+    """Test 34: Reads past the read pool or its timeout get 503 and never block ingest"""
+    run = int(time.time() * 1000)
+    reads = []
+    writes = []
+    
+    def read():
+        for path, params in (("/alerts", {"limit": 5000}), ("/metrics/timeseries", {"bucket": "1h", "since": 0}),
+                             ("/alerts/search", {"q": "test", "limit": 500}), ("/alerts/changes", {"since_seq": 0})):
+            r = requests.get(f"{HUB_URL}{path}", params=params, timeout=30)
+            reads.append((path, r.status_code, r.json() if r.status_code == 503 else None))
+    
+    def write(suc_id):
+        for port in range(10):
+            started = time.time()
+            r = requests.post(f"{HUB_URL}/alerts", json={"suc_id": suc_id, "event_type": "read_pool_test",
+                                                         "anomaly_score": 0.3, "raw_details": {"dst_port": port}}, timeout=30)
+            writes.append((r.status_code, time.time() - started))
+    
+    try:
+        threads = [threading.Thread(target=read) for _ in range(16)]
+        threads += [threading.Thread(target=write, args=(f"READ_POOL_{run}_{i}",)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        bad = [r for r in reads if r[1] not in (200, 503) or (r[1] == 503 and "error" not in r[2])]
+        if bad:
+            log_test("Read Pool", False, f"Reads must answer 200 or 503 with an error, got {bad[0][:2]}")
+            return False
+        if any(status not in (200, 202) for status, _ in writes) or max(seconds for _, seconds in writes) > 5:
+            log_test("Read Pool", False, f"Ingest failed or waited on readers: {writes}")
+            return False
+        timed_out = sum(r[1] == 503 for r in reads)
+        log_test("Read Pool", True, f"{len(reads)} reads ({timed_out} answered 503), ingest unaffected")
+        return True
+    except Exception as e:
+        log_test("Read Pool", False, f"Exception: {e}")
+        return False
+
+def test_bulk_import():
+    """Test 35: bulk_import.py loads, masks and correlates NDJSON and CSV files"""
+    ndjson = [
+        {"suc_id": "IMPORT_A", "event_type": "import_brute", "timestamp": "2021-05-01T10:00:00Z", "anomaly_score": 0.3,
+         "raw_details": {"src_ip": "192.168.1.50", "username": "admin", "attempts": "7"}},
+        {"suc_id": "IMPORT_B", "event_type": "import_brute", "timestamp": "2021-05-01T10:01:00Z", "anomaly_score": 0.3},
+        {"suc_id": "IMPORT_C", "event_type": "import_brute", "timestamp": "2021-05-01T11:00:00Z", "anomaly_score": 0.3},
+        {"event_type": "import_brute"},
+    ]
+    csv_rows = [
+        "suc_id,timestamp,event_type,anomaly_score,src_ip,dst_port",
+        "IMPORT_D,2021-05-01T12:00:00Z,import_scan,0.9,10.1.2.3,22",
+        "IMPORT_E,2021-05-01T12:00:30Z,import_scan,0.2,10.1.2.4,22",
+    ]
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "import.db")
+            with open(os.path.join(tmp, "alerts.ndjson"), "w") as f:
+                f.write("\n".join(json.dumps(payload) for payload in ndjson) + "\nnot json\n")
+            with open(os.path.join(tmp, "alerts.csv"), "w") as f:
+                f.write("\n".join(csv_rows) + "\n")
+            # the CLI works on a database file; this one is not the hub's
+            r = subprocess.run([sys.executable, os.path.join(HUB_DIR, "bulk_import.py"), "--db", db_path,
+                                os.path.join(tmp, "alerts.ndjson"), os.path.join(tmp, "alerts.csv")],
+                               capture_output=True, text=True, timeout=60)
+            if r.returncode != 0:
+                log_test("Bulk Import", False, f"Exit code {r.returncode}: {r.stderr[-200:]}")
+                return False
+            alerts = {a["suc_id"]: a for a in get_alerts(db_path, limit=100)}
+            leftovers = [name for name in os.listdir(tmp) if "checkpoint" in name]
+        if sorted(alerts) != ["IMPORT_A", "IMPORT_B", "IMPORT_C", "IMPORT_D", "IMPORT_E"] or leftovers:
+            log_test("Bulk Import", False, f"Imported {sorted(alerts)}, leftover {leftovers}")
+            return False
+        coordinated = sorted(s for s, a in alerts.items() if a["summary"].startswith("Coordinated"))
+        if coordinated != ["IMPORT_A", "IMPORT_B", "IMPORT_D", "IMPORT_E"]:
+            log_test("Bulk Import", False, f"Unexpected coordinated alerts: {coordinated}")
+            return False
+        details = alerts["IMPORT_A"]["raw_masked"]
+        if "192.168.1.50" in json.dumps(details) or details.get("attempts") != 7 or "username_hash" not in details:
+            log_test("Bulk Import", False, f"Details not masked like POST /alerts: {details}")
+            return False
+        log_test("Bulk Import", True, "5 alerts imported, 2 lines rejected")
+        return True
+    except Exception as e:
+        log_test("Bulk Import", False, f"Exception: {e}")
+        return False
+
+def test_schema_migration():
+    """Test 36: A database from before schema versioning upgrades without changing alerts"""
+    rows = [
+        ("MIGRATE_A", "2021-08-01T09:00:00Z", "brute_force", json.dumps({"src_ip_masked": "10.0.0.xxx", "attempts": 4}),
+         0.8, "High", "brute_force detected by MIGRATE_A"),
+        ("MIGRATE_B", "2021-08-01T09:00:30+08:00", "port_scan", json.dumps({"dst_port": "443"}), 0.2, "Low",
+         "hand-written summary"),
+        ("MIGRATE_C", "not a time", None, "{}", None, "Medium", ""),
+    ]
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "v0.db")
+            # the original schema: one wide alerts table, user_version 0
+            with sqlite3.connect(db_path) as conn:
+                conn.execute("""CREATE TABLE alerts (id INTEGER PRIMARY KEY AUTOINCREMENT, suc_id TEXT, timestamp TEXT,
+                                event_type TEXT, raw_masked TEXT, anomaly_score REAL, severity TEXT, summary TEXT)""")
+                conn.executemany("INSERT INTO alerts (suc_id, timestamp, event_type, raw_masked, anomaly_score, severity, summary) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.close()
+            init_db(db_path)
+            init_db(db_path)  # a second run finds nothing to do
+            with sqlite3.connect(db_path) as conn:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                compact = conn.execute("SELECT COUNT(*) FROM alert_rows").fetchone()[0]
+            conn.close()
+            alerts = sorted(get_alerts(db_path, limit=10), key=lambda a: a["id"])
+        if version != SCHEMA_VERSION or compact != 3:
+            log_test("Schema Migration", False, f"user_version {version}, {compact} compact rows")
+            return False
+        got = [(a["suc_id"], a["timestamp"], a["event_type"], json.dumps(a["raw_masked"]), a["anomaly_score"],
+                a["severity"], a["summary"]) for a in alerts]
+        # a missing event type has always been served as "unknown"
+        if got != rows[:2] + [rows[2][:2] + ("unknown",) + rows[2][3:]]:
+            log_test("Schema Migration", False, f"Alerts changed by the upgrade: {got}")
+            return False
+        r = requests.get(f"{HUB_URL}/alerts", params={"fields": "summary,event_type", "limit": 1}, timeout=2)
+        if r.status_code != 200 or set(r.json()[0]) != {"id", "summary", "event_type"}:
+            log_test("Schema Migration", False, f"Decoded fields not served: {r.status_code} {r.text[:100]}")
+            return False
+        log_test("Schema Migration", True, f"Upgraded to schema v{SCHEMA_VERSION}, 3 alerts unchanged")
+        return True
+    except Exception as e:
+        log_test("Schema Migration", False, f"Exception: {e}")
+        return False
+
 def main():
     print("=" * 60)
     print("BAYANIHUB POC - Comprehensive QA Test Suite")
@@ -365,6 +1297,32 @@ def main():
     test_severity_assignment()
     test_coordinated_detection()
     test_data_persistence()
+    test_batch_ingest()
+    test_detail_columns()
+    test_conditional_get()
+    test_columnar_all_fields()
+    test_alert_changes()
+    test_rate_limit()
+    test_async_ingest()
+    test_async_correlation()
+    test_correlation_index()
+    test_alert_pagination_filters()
+    test_metrics_counters()
+    test_metrics_timeseries()
+    test_archive_endpoint()
+    test_columnar_formats()
+    test_streamed_alerts()
+    test_alert_search()
+    test_storage_backend()
+    test_alert_coalescing()
+    test_alert_stream()
+    test_gzip()
+    test_range_correlation()
+    test_transactional_tagging()
+    test_concurrent_access()
+    test_read_pool()
+    test_bulk_import()
+    test_schema_migration()
     
     # Summary
     print("\n" + "=" * 60)